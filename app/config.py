@@ -9,3 +9,77 @@ PORT_DB = os.environ.get("FSTR_DB_PORT")
 NAME_DB = os.environ.get("FSTR_DB_NAME")
 USER_DB = os.environ.get("FSTR_DB_LOGIN")
 PASSWORD_DB = os.environ.get("FSTR_DB_PASS")
+
+PAGE_SIZE = int(os.environ.get("FSTR_PAGE_SIZE", 100))
+PAGE_SIZE_MAX = int(os.environ.get("FSTR_PAGE_SIZE_MAX", 500))
+BATCH_MAX_SIZE = int(os.environ.get("FSTR_BATCH_MAX_SIZE", 100))
+
+BLOB_STORE_PATH = os.environ.get("FSTR_BLOB_STORE_PATH", "media")
+IMAGES_URL = os.environ.get("FSTR_IMAGES_URL", "/SubmitData/images/")
+MAX_IMAGE_SIZE = int(os.environ.get("FSTR_MAX_IMAGE_SIZE", 20 * 1024 * 1024))
+MAX_METADATA_SIZE = int(os.environ.get("FSTR_MAX_METADATA_SIZE", 64 * 1024))
+
+THUMBNAIL_WORKERS = int(os.environ.get("FSTR_THUMBNAIL_WORKERS", 2))
+IMAGE_JOB_BATCH_SIZE = int(os.environ.get("FSTR_IMAGE_JOB_BATCH_SIZE", 16))
+IMAGE_JOB_MAX_ATTEMPTS = int(os.environ.get("FSTR_IMAGE_JOB_MAX_ATTEMPTS", 5))
+IMAGE_JOB_LEASE = int(os.environ.get("FSTR_IMAGE_JOB_LEASE", 300))
+IMAGE_JOB_POLL_INTERVAL = float(os.environ.get("FSTR_IMAGE_JOB_POLL_INTERVAL", 30))
+
+USER_CACHE_SIZE = int(os.environ.get("FSTR_USER_CACHE_SIZE", 10000))
+USER_CACHE_TTL = float(os.environ.get("FSTR_USER_CACHE_TTL", 300))
+
+# Points closer than this many degrees on both axes share a coords row, 0 reuses only exact matches
+COORDS_TOLERANCE = float(os.environ.get("FSTR_COORDS_TOLERANCE", 0))
+
+NEARBY_MAX_RADIUS = float(os.environ.get("FSTR_NEARBY_MAX_RADIUS", 500))
+
+# Up to this zoom tiles show clusters, deeper tiles list the passes themselves
+CLUSTER_MAX_ZOOM = int(os.environ.get("FSTR_CLUSTER_MAX_ZOOM", 12))
+TILE_MAX_ZOOM = int(os.environ.get("FSTR_TILE_MAX_ZOOM", 18))
+TILE_MAX_PEREVALS = int(os.environ.get("FSTR_TILE_MAX_PEREVALS", 500))
+TILE_CACHE_SIZE = int(os.environ.get("FSTR_TILE_CACHE_SIZE", 5000))
+TILE_CACHE_TTL = float(os.environ.get("FSTR_TILE_CACHE_TTL", 300))
+# Writes only record cluster deltas, a background worker folds them into map_clusters
+CLUSTER_BATCH_SIZE = int(os.environ.get("FSTR_CLUSTER_BATCH_SIZE", 1000))
+CLUSTER_POLL_INTERVAL = float(os.environ.get("FSTR_CLUSTER_POLL_INTERVAL", 1))
+
+# Serialized pass responses, RESPONSE_CACHE_URL adds a shared redis:// cache behind the in-process one
+RESPONSE_CACHE_SIZE = int(os.environ.get("FSTR_RESPONSE_CACHE_SIZE", 10000))
+RESPONSE_CACHE_TTL = float(os.environ.get("FSTR_RESPONSE_CACHE_TTL", 300))
+RESPONSE_CACHE_URL = os.environ.get("FSTR_RESPONSE_CACHE_URL", "")
+
+# Results of requests with an Idempotency-Key are replayed on retries for this many seconds
+IDEMPOTENCY_TTL = int(os.environ.get("FSTR_IDEMPOTENCY_TTL", 86400))
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get("FSTR_IDEMPOTENCY_CACHE_SIZE", 10000))
+IDEMPOTENCY_CLEANUP_INTERVAL = float(os.environ.get("FSTR_IDEMPOTENCY_CLEANUP_INTERVAL", 3600))
+
+# Passes sent to /SubmitData/queue are written by a background batcher
+INGEST_BATCH_SIZE = int(os.environ.get("FSTR_INGEST_BATCH_SIZE", 100))
+INGEST_MAX_ATTEMPTS = int(os.environ.get("FSTR_INGEST_MAX_ATTEMPTS", 5))
+INGEST_LINGER = float(os.environ.get("FSTR_INGEST_LINGER", 0.05))
+INGEST_POLL_INTERVAL = float(os.environ.get("FSTR_INGEST_POLL_INTERVAL", 10))
+# Written and failed queue rows, and so their tickets, are kept for this many seconds
+INGEST_RETENTION = int(os.environ.get("FSTR_INGEST_RETENTION", 604800))
+INGEST_CLEANUP_INTERVAL = float(os.environ.get("FSTR_INGEST_CLEANUP_INTERVAL", 3600))
+
+# asyncpg connection pool
+DB_POOL_MIN_SIZE = int(os.environ.get("FSTR_DB_POOL_MIN_SIZE", 5))
+DB_POOL_MAX_SIZE = int(os.environ.get("FSTR_DB_POOL_MAX_SIZE", 20))
+# A connection is replaced after this many queries, 0 never replaces it
+DB_POOL_MAX_QUERIES = int(os.environ.get("FSTR_DB_POOL_MAX_QUERIES", 50000))
+# Idle connections above min size are closed after this many seconds, 0 keeps them
+DB_POOL_MAX_IDLE = float(os.environ.get("FSTR_DB_POOL_MAX_IDLE", 300))
+# Prepared statements cached per connection, 0 disables the cache (needed behind pgbouncer in transaction mode)
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get("FSTR_DB_STATEMENT_CACHE_SIZE", 1024))
+# Default timeout of a single query in seconds
+DB_COMMAND_TIMEOUT = float(os.environ.get("FSTR_DB_COMMAND_TIMEOUT", 30))
+
+# Logging: level name, "json" or "text" output, share of sampled info lines written
+LOG_LEVEL = os.environ.get("FSTR_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("FSTR_LOG_FORMAT", "json")
+LOG_SAMPLE_RATE = float(os.environ.get("FSTR_LOG_SAMPLE_RATE", 1))
+
+# Query profiler, off by default: requests with more queries or taking longer are logged with their statements
+PROFILE_QUERIES = os.environ.get("FSTR_PROFILE_QUERIES", "").lower() in ("1", "true", "yes")
+PROFILE_QUERY_BUDGET = int(os.environ.get("FSTR_PROFILE_QUERY_BUDGET", 10))
+PROFILE_SLOW_REQUEST = float(os.environ.get("FSTR_PROFILE_SLOW_REQUEST", 0.5))
@@ -3,9 +3,44 @@ import subprocess
 
 import databases
 
-from app.config import HOST_DB, NAME_DB, PASSWORD_DB, PORT_DB, USER_DB
+from app.config import (DB_COMMAND_TIMEOUT, DB_POOL_MAX_IDLE,
+                        DB_POOL_MAX_QUERIES, DB_POOL_MAX_SIZE,
+                        DB_POOL_MIN_SIZE, DB_STATEMENT_CACHE_SIZE, HOST_DB,
+                        NAME_DB, PASSWORD_DB, PORT_DB, USER_DB)
+from app.utils.metrics import registry
 
 DATABASE_URL = f"postgresql://{USER_DB}:{PASSWORD_DB}@{HOST_DB}:{PORT_DB}/{NAME_DB}"
-database = databases.Database(DATABASE_URL)
 
 
+class Database(databases.Database):
+    """ databases.Database reporting query times and pool waits to app.utils.metrics """
+
+    SUPPORTED_BACKENDS = {
+        **databases.Database.SUPPORTED_BACKENDS,
+        "postgresql": "app.utils.db_metrics:InstrumentedPostgresBackend",
+    }
+
+
+# Options are passed to asyncpg.create_pool()
+database = Database(
+    DATABASE_URL,
+    min_size=DB_POOL_MIN_SIZE,
+    max_size=DB_POOL_MAX_SIZE,
+    max_queries=DB_POOL_MAX_QUERIES,
+    max_inactive_connection_lifetime=DB_POOL_MAX_IDLE,
+    statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+    command_timeout=DB_COMMAND_TIMEOUT,
+)
+
+
+def pool_stats() -> dict:
+    """ Size of the asyncpg pool behind database, empty before it is connected """
+    pool = getattr(database._backend, "_pool", None)
+    if pool is None:
+        return {}
+    return dict(size=pool.get_size(), idle=pool.get_idle_size(), min_size=pool.get_min_size(),
+                max_size=pool.get_max_size())
+
+
+registry.gauge("fstr_db_pool_connections", "Connections in the pool.", ("state",),
+               lambda: [((state,), value) for state, value in pool_stats().items()])
@@ -1,37 +1,169 @@
+import atexit
+import contextvars
+import copy
+import json
 import logging
 import logging.config
+import queue
+import random
+import re
+import sys
+import uuid
+from logging.handlers import QueueHandler, QueueListener
 
 from pydantic import BaseModel
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import LOG_FORMAT, LOG_LEVEL, LOG_SAMPLE_RATE
+
+# Correlation id of the request being handled, "-" outside of requests
+request_id: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="-")
+
+# Pass as extra= to high-volume info lines, only LOG_SAMPLE_RATE of them are written
+SAMPLED = {"sampled": True}
+
+TEXT_FORMAT = "%(levelprefix)s | %(asctime)s | %(request_id)s | %(message)s"
+REQUEST_ID_HEADER = "x-request-id"
+VALID_REQUEST_ID = re.compile(r"[\w.:-]{1,64}")
 
 
 class LogConfig(BaseModel):
     """Logging configuration to be set for the server"""
 
     LOGGER_NAME: str = "APIlogger"
-    LOG_FORMAT: str = "%(levelprefix)s | %(asctime)s | %(message)s"
-    LOG_LEVEL: str = "DEBUG"
+    LOG_FORMAT: str = TEXT_FORMAT
+    LOG_LEVEL: str = LOG_LEVEL
 
     # Logging config
     version = 1
     disable_existing_loggers = False
-    formatters = {
-        "default": {
-            "()": "uvicorn.logging.DefaultFormatter",
-            "fmt": LOG_FORMAT,
-            "datefmt": "%Y-%m-%d %H:%M:%S",
-        },
+    filters = {
+        "request_id": {"()": "app.logger.RequestIdFilter"},
+        "sampling": {"()": "app.logger.SamplingFilter", "rate": LOG_SAMPLE_RATE},
     }
     handlers = {
         "default": {
-            "formatter": "default",
-            "class": "logging.StreamHandler",
-            "stream": "ext://sys.stderr",
+            "()": "app.logger.queue_handler",
+            "filters": ["request_id"],
         },
     }
     loggers = {
-        LOGGER_NAME: {"handlers": ["default"], "level": LOG_LEVEL},
+        LOGGER_NAME: {"handlers": ["default"], "level": LOG_LEVEL, "filters": ["sampling"]},
     }
 
 
+class RequestIdFilter(logging.Filter):
+    """ Stamp records with the correlation id, runs in the task that logs """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """ Drop all but rate of the records logged with extra=SAMPLED, others pass """
+
+    def __init__(self, rate: float = 1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return not getattr(record, "sampled", False) or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """ One JSON object per line """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": f"{self.formatTime(record, '%Y-%m-%dT%H:%M:%S')}.{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class LogQueueHandler(QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread. Only the message
+    arguments are merged here, they may change after the call returns.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+listener = QueueListener(log_queue)
+
+
+def queue_handler() -> QueueHandler:
+    """
+    Handler for the logging config. Records are put on a queue and written to
+    stderr by a listener thread, so a slow stderr does not block the event loop.
+    """
+    if LOG_FORMAT == "text":
+        from uvicorn.logging import DefaultFormatter
+        formatter = DefaultFormatter(TEXT_FORMAT, datefmt="%Y-%m-%d %H:%M:%S")
+    else:
+        formatter = JsonFormatter()
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(formatter)
+    listener.handlers = (stream,)
+
+    if listener._thread is None:
+        listener.start()
+        # Write what is still queued on exit
+        atexit.register(stop_logging)
+    return LogQueueHandler(log_queue)
+
+
+def stop_logging() -> None:
+    """ Write out the queued records and stop the listener thread """
+    if listener._thread is not None:
+        listener.stop()
+
+
+class RequestIdMiddleware:
+    """
+    Sets request_id for the request from the X-Request-ID header, or a new one,
+    and returns it in the response header.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        value = dict(scope["headers"]).get(REQUEST_ID_HEADER.encode(), b"").decode("latin-1")
+        if not VALID_REQUEST_ID.fullmatch(value):
+            value = uuid.uuid4().hex
+
+        async def send_with_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)[REQUEST_ID_HEADER] = value
+            await send(message)
+
+        token = request_id.set(value)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id.reset(token)
+
+
 def get_logger():
     return logging.getLogger("APIlogger")
@@ -1,12 +1,19 @@
 from logging.config import dictConfig
 
-import sqlalchemy
 from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 
-from app.db_connection import DATABASE_URL, database
-from app.logger import LogConfig
-from app.routers import submitdata
+from app.config import PROFILE_QUERIES
+from app.db_connection import database
+from app.logger import REQUEST_ID_HEADER, LogConfig, RequestIdMiddleware
+from app.routers import geo, search, service, submitdata
+from app.utils.derivative_worker import derivative_worker
+from app.utils.idempotency import idempotency_store
+from app.utils.ingest_worker import ingest_worker
+from app.utils.metrics import MetricsMiddleware
+from app.utils.profiler import QueryProfilerMiddleware
+from app.utils.responses import FastJSONResponse
+from app.utils.tiles import cluster_worker
 
 dictConfig(LogConfig().dict())
 
@@ -16,28 +23,41 @@ app = FastAPI(
     contact={"name": "Evgeny Abrosimov",
              "url": "https://github.com/LatikDesu/SF_Sprint"},
     version="0.1.0",
-    docs_url="/docs")
-
-engine = sqlalchemy.create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False}
-)
+    docs_url="/docs",
+    default_response_class=FastJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[REQUEST_ID_HEADER],
 )
+if PROFILE_QUERIES:
+    app.add_middleware(QueryProfilerMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestIdMiddleware)
 
 
 @app.on_event("startup")
 async def startup():
     await database.connect()
+    derivative_worker.start()
+    idempotency_store.start()
+    ingest_worker.start()
+    cluster_worker.start()
 
 
 @app.on_event("shutdown")
 async def shutdown():
+    await derivative_worker.stop()
+    await idempotency_store.stop()
+    await ingest_worker.stop()
+    await cluster_worker.stop()
     await database.disconnect()
 
 
 app.include_router(submitdata.router)
+app.include_router(geo.router)
+app.include_router(search.router)
+app.include_router(service.router)
@@ -1,4 +1,5 @@
 import sqlalchemy
+from sqlalchemy.dialects.postgresql import TSVECTOR, UUID
 
 metadata = sqlalchemy.MetaData()
 
@@ -9,6 +10,12 @@ coords_table = sqlalchemy.Table(
     sqlalchemy.Column("latitude", sqlalchemy.Float),
     sqlalchemy.Column("longitude", sqlalchemy.Float),
     sqlalchemy.Column("height", sqlalchemy.Integer),
+    # Grid cell of the point, see app.utils.geo
+    sqlalchemy.Column("cell", sqlalchemy.BigInteger,
+                      sqlalchemy.Computed("floor((latitude + 90) * 10)::bigint * 3601 "
+                                          "+ floor((longitude + 180) * 10)::bigint")),
+    sqlalchemy.UniqueConstraint("latitude", "longitude", "height", name="uq_coords_latitude_longitude_height"),
+    sqlalchemy.Index("ix_coords_cell", "cell", postgresql_include=["latitude", "longitude"]),
 )
 
 users_table = sqlalchemy.Table(
@@ -20,6 +27,9 @@ users_table = sqlalchemy.Table(
     sqlalchemy.Column("last_name", sqlalchemy.String(100)),
     sqlalchemy.Column("patronymic", sqlalchemy.String(100)),
     sqlalchemy.Column("phone", sqlalchemy.String(100)),
+    # Set by a trigger on every update, see migration 8e3a5c0f2d71
+    sqlalchemy.Column("updated_at", sqlalchemy.DateTime(timezone=True), server_default=sqlalchemy.func.now(),
+                      nullable=False),
 )
 
 ActivitiesTypes_table = sqlalchemy.Table(
@@ -53,6 +63,23 @@ pereval_add_table = sqlalchemy.Table(
     sqlalchemy.Column("level_autumn", sqlalchemy.String(255)),
     sqlalchemy.Column("level_spring", sqlalchemy.String(255)),
     sqlalchemy.Column("user_id", sqlalchemy.Integer(), sqlalchemy.ForeignKey('users.id'), nullable=False),
+    # Transliterated titles, see app.utils.search
+    sqlalchemy.Column("search_text", sqlalchemy.Text, nullable=False, server_default=""),
+    sqlalchemy.Column("search_vector", TSVECTOR,
+                      sqlalchemy.Computed("to_tsvector('simple'::regconfig, search_text)")),
+    # Set by a trigger on every update, see migration 8e3a5c0f2d71
+    sqlalchemy.Column("updated_at", sqlalchemy.DateTime(timezone=True), server_default=sqlalchemy.func.now(),
+                      nullable=False),
+    # Id of the last transaction that wrote the row, set by a trigger on update, see migration 6f2b8d4e9a03
+    sqlalchemy.Column("change_seq", sqlalchemy.BigInteger,
+                      server_default=sqlalchemy.text("pg_current_xact_id()::text::bigint"), nullable=False),
+    sqlalchemy.Index("ix_pereval_add_user_id_add_time_id", "user_id", "add_time", "id",
+                     postgresql_include=["updated_at"]),
+    sqlalchemy.Index("ix_pereval_add_user_id_change_seq_id", "user_id", "change_seq", "id"),
+    sqlalchemy.Index("ix_pereval_add_coords_id", "coords_id"),
+    sqlalchemy.Index("ix_pereval_add_search_vector", "search_vector", postgresql_using="gin"),
+    sqlalchemy.Index("ix_pereval_add_search_text", "search_text", postgresql_using="gin",
+                     postgresql_ops={"search_text": "gin_trgm_ops"}),
 )
 
 images_table = sqlalchemy.Table(
@@ -60,7 +87,70 @@ images_table = sqlalchemy.Table(
     metadata,
     sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True, autoincrement=True),
     sqlalchemy.Column("pereval", sqlalchemy.ForeignKey("pereval_add.id")),
-    sqlalchemy.Column("data", sqlalchemy.String(100)),
+    sqlalchemy.Column("sha256", sqlalchemy.String(64), nullable=False),
+    sqlalchemy.Column("size", sqlalchemy.Integer, nullable=False),
     sqlalchemy.Column("name", sqlalchemy.String(100)),
     sqlalchemy.Column("data_added", sqlalchemy.DateTime, server_default=sqlalchemy.func.now(), nullable=False),
+    sqlalchemy.Index("ix_pereval_images_pereval", "pereval"),
+)
+
+image_jobs_table = sqlalchemy.Table(
+    "image_jobs",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True, autoincrement=True),
+    sqlalchemy.Column("sha256", sqlalchemy.String(64), unique=True, nullable=False),
+    sqlalchemy.Column("status", sqlalchemy.String(10), nullable=False, server_default="new"),
+    sqlalchemy.Column("attempts", sqlalchemy.Integer, nullable=False, server_default="0"),
+    sqlalchemy.Column("locked_until", sqlalchemy.DateTime),
+    sqlalchemy.Column("last_error", sqlalchemy.Text),
+    sqlalchemy.Column("created_at", sqlalchemy.DateTime, server_default=sqlalchemy.func.now(), nullable=False),
+    sqlalchemy.Index("ix_image_jobs_status_id", "status", "id"),
+)
+
+map_clusters_table = sqlalchemy.Table(
+    "map_clusters",
+    metadata,
+    sqlalchemy.Column("zoom", sqlalchemy.SmallInteger, primary_key=True),
+    sqlalchemy.Column("cell_x", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("cell_y", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("count", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("sum_latitude", sqlalchemy.Float, nullable=False),
+    sqlalchemy.Column("sum_longitude", sqlalchemy.Float, nullable=False),
+)
+
+# Passes added (+1) or removed (-1) at a coords row, folded into map_clusters by the cluster worker
+map_cluster_deltas_table = sqlalchemy.Table(
+    "map_cluster_deltas",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.BigInteger, primary_key=True, autoincrement=True),
+    sqlalchemy.Column("coords_id", sqlalchemy.Integer, sqlalchemy.ForeignKey('coords.id'), nullable=False),
+    sqlalchemy.Column("count", sqlalchemy.SmallInteger, nullable=False),
+)
+
+idempotency_keys_table = sqlalchemy.Table(
+    "idempotency_keys",
+    metadata,
+    sqlalchemy.Column("key", sqlalchemy.String(255), primary_key=True),
+    # sha256 of the request, a key reused with another request is rejected
+    sqlalchemy.Column("fingerprint", sqlalchemy.String(64), nullable=False),
+    sqlalchemy.Column("response", sqlalchemy.Text),
+    sqlalchemy.Column("created_at", sqlalchemy.DateTime(timezone=True), server_default=sqlalchemy.func.now(),
+                      nullable=False),
+    sqlalchemy.Index("ix_idempotency_keys_created_at", "created_at"),
+)
+
+ingest_queue_table = sqlalchemy.Table(
+    "ingest_queue",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.BigInteger, primary_key=True, autoincrement=True),
+    sqlalchemy.Column("ticket", UUID(as_uuid=False), unique=True, nullable=False),
+    # PerevalMetadataRequest and the list of ImageRefModel as JSON
+    sqlalchemy.Column("payload", sqlalchemy.Text, nullable=False),
+    sqlalchemy.Column("images", sqlalchemy.Text, nullable=False),
+    sqlalchemy.Column("status", sqlalchemy.String(10), nullable=False, server_default="new"),
+    sqlalchemy.Column("attempts", sqlalchemy.Integer, nullable=False, server_default="0"),
+    sqlalchemy.Column("pereval_id", sqlalchemy.Integer, sqlalchemy.ForeignKey('pereval_add.id')),
+    sqlalchemy.Column("last_error", sqlalchemy.Text),
+    sqlalchemy.Column("created_at", sqlalchemy.DateTime, server_default=sqlalchemy.func.now(), nullable=False),
+    sqlalchemy.Index("ix_ingest_queue_status_id", "status", "id"),
 )
@@ -26,6 +26,22 @@ class ImagesModel(BaseModel):
     name: str
 
 
+class ImageRefModel(BaseModel):
+    """ Model for image saved to the blob store """
+    sha256: str
+    size: int
+    name: str
+
+
+class ImagesResponseModel(BaseModel):
+    """ Model for stored images """
+    name: str
+    url: str
+    size: int
+    thumbnail_url: str
+    preview_url: str
+
+
 class LevelModel(BaseModel):
     """ Model for level """
     winter: str
@@ -34,8 +50,8 @@ class LevelModel(BaseModel):
     spring: str
 
 
-class PerevalPostRequest(BaseModel):
-    """    Model for post request to pereval add event"""
+class PerevalMetadataRequest(BaseModel):
+    """ Model for pereval data without images, sent as metadata of multipart upload"""
 
     beauty_title: str
     title: str
@@ -47,6 +63,10 @@ class PerevalPostRequest(BaseModel):
 
     level: LevelModel
 
+
+class PerevalPostRequest(PerevalMetadataRequest):
+    """    Model for post request to pereval add event"""
+
     images: list[ImagesModel]
 
 
@@ -58,6 +78,30 @@ class PerevalResponse(BaseModel):
     id: Optional[int] = None
 
 
+class PerevalBatchResponse(BaseModel):
+    """ Model for post response to batch of pereval add events"""
+
+    status: int
+    message: Optional[str] = None
+    items: list[PerevalResponse] = []
+
+
+class IngestTicketResponse(BaseModel):
+    """ Model for response to a pereval accepted into the ingest queue"""
+
+    status: int
+    message: str
+    ticket: Optional[str] = None
+
+
+class IngestStatusResponse(BaseModel):
+    """ Model for the state of a queued pereval"""
+
+    state: str
+    message: str
+    id: Optional[int] = None
+
+
 class PatchResponse(BaseModel):
     """ Model for patch response to pereval patch event"""
 
@@ -81,10 +125,52 @@ class PerevalGetResponse(BaseModel):
 
     level: LevelModel
 
-    images: list[ImagesModel]
+    images: list[ImagesResponseModel]
 
 
 class PerevalResponseByEmail(BaseModel):
     """ Model for get response to pereval by email"""
 
     perevals: list[PerevalGetResponse]
+    next_cursor: Optional[str] = None
+
+
+class PerevalSyncResponse(BaseModel):
+    """ Model for perevals changed since a sync token"""
+
+    perevals: list[PerevalGetResponse]
+    since: str
+    has_more: bool = False
+
+
+class PerevalShortResponse(BaseModel):
+    """ Model for pereval in map and search results"""
+
+    id: int
+    status: str
+    beauty_title: str
+    title: str
+    coords: CoordsModel
+    distance: Optional[float] = None
+    rank: Optional[float] = None
+
+
+class PerevalListResponse(BaseModel):
+    """ Model for list of perevals in map and search results"""
+
+    perevals: list[PerevalShortResponse]
+
+
+class ClusterModel(BaseModel):
+    """ Model for cluster of perevals on map"""
+
+    latitude: float
+    longitude: float
+    count: int
+
+
+class TileResponse(BaseModel):
+    """ Model for map tile, clusters at low zoom and perevals at high zoom"""
+
+    clusters: list[ClusterModel] = []
+    perevals: list[PerevalShortResponse] = []
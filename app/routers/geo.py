@@ -0,0 +1,117 @@
+from fastapi import APIRouter
+from starlette.responses import JSONResponse, Response
+
+from app.config import (CLUSTER_MAX_ZOOM, NEARBY_MAX_RADIUS, PAGE_SIZE,
+                        PAGE_SIZE_MAX, TILE_MAX_PEREVALS, TILE_MAX_ZOOM)
+from app.db_connection import database
+from app.logger import SAMPLED, get_logger
+from app.models.models import pereval_add_table
+from app.models.schemas import PerevalListResponse, TileResponse
+from app.utils.functions import pereval_short_dict, pereval_short_query
+from app.utils.geo import bbox_condition, haversine, radius_bbox
+from app.utils.responses import FastJSONResponse, dumps
+from app.utils.tiles import clusters_query, tile_bbox, tile_cache
+
+logger = get_logger()
+
+router = APIRouter(prefix="/SubmitData", tags=["Map"])
+
+
+def valid_point(latitude: float, longitude: float) -> bool:
+    return -90 <= latitude <= 90 and -180 <= longitude <= 180
+
+
+@router.get("/nearby",
+            summary="Получение перевалов рядом с точкой",
+            description="Перевалы в радиусе radius км от точки, ближайшие первыми",
+            response_model=PerevalListResponse)
+async def get_nearby(latitude: float, longitude: float, radius: float = 10, limit: int = PAGE_SIZE):
+    if not valid_point(latitude, longitude) or not 0 < radius <= NEARBY_MAX_RADIUS:
+        return JSONResponse({'status': 400, 'message': 'Неверные координаты или радиус.'})
+    limit = max(1, min(limit, PAGE_SIZE_MAX))
+
+    distance = haversine(latitude, longitude)
+    query = (
+        pereval_short_query()
+        .add_columns(distance.label("distance"))
+        .where(bbox_condition(*radius_bbox(latitude, longitude, radius)))
+        .where(distance <= radius)
+        .order_by(distance, pereval_add_table.c.id)
+        .limit(limit)
+    )
+
+    async with database.connection():
+        try:
+            rows = await database.fetch_all(query)
+            logger.info("Nearby data retrieved successfully. Found: %s", len(rows), extra=SAMPLED)
+            return FastJSONResponse(dict(perevals=[pereval_short_dict(row) for row in rows]))
+
+        except Exception as e:
+            logger.error("Error getting nearby data: %s", e)
+            return JSONResponse({'status': 500, 'message': "Ошибка при получении данных"})
+
+
+@router.get("/bbox",
+            summary="Получение перевалов в прямоугольной области",
+            description="Перевалы внутри области south/west/north/east, "
+                        "область с west > east пересекает 180-й меридиан",
+            response_model=PerevalListResponse)
+async def get_bbox(south: float, west: float, north: float, east: float, limit: int = PAGE_SIZE):
+    if not valid_point(south, west) or not valid_point(north, east) or south > north:
+        return JSONResponse({'status': 400, 'message': 'Неверные границы области.'})
+    limit = max(1, min(limit, PAGE_SIZE_MAX))
+
+    query = (
+        pereval_short_query()
+        .where(bbox_condition(south, west, north, east))
+        .order_by(pereval_add_table.c.id)
+        .limit(limit)
+    )
+
+    async with database.connection():
+        try:
+            rows = await database.fetch_all(query)
+            logger.info("Bbox data retrieved successfully. Found: %s", len(rows), extra=SAMPLED)
+            return FastJSONResponse(dict(perevals=[pereval_short_dict(row) for row in rows]))
+
+        except Exception as e:
+            logger.error("Error getting bbox data: %s", e)
+            return JSONResponse({'status': 500, 'message': "Ошибка при получении данных"})
+
+
+@router.get("/tiles/{z}/{x}/{y}",
+            summary="Получение тайла карты с перевалами",
+            description=f"До зума {CLUSTER_MAX_ZOOM} тайл содержит кластеры с количеством перевалов и центром, "
+                        "на большем зуме содержит сами перевалы",
+            response_model=TileResponse)
+async def get_tile(z: int, x: int, y: int):
+    if not 0 <= z <= TILE_MAX_ZOOM or not 0 <= x < 2 ** z or not 0 <= y < 2 ** z:
+        return JSONResponse({'status': 400, 'message': 'Неверный номер тайла.'})
+
+    content = tile_cache.get((z, x, y))
+    if content is not None:
+        return Response(content, media_type="application/json")
+
+    async with database.connection():
+        try:
+            if z <= CLUSTER_MAX_ZOOM:
+                rows = await database.fetch_all(clusters_query(z, x, y))
+                tile = dict(clusters=[dict(latitude=float(row["latitude"]), longitude=float(row["longitude"]),
+                                           count=row["count"]) for row in rows], perevals=[])
+            else:
+                query = (
+                    pereval_short_query()
+                    .where(bbox_condition(*tile_bbox(z, x, y)))
+                    .order_by(pereval_add_table.c.id)
+                    .limit(TILE_MAX_PEREVALS)
+                )
+                rows = await database.fetch_all(query)
+                tile = dict(clusters=[], perevals=[pereval_short_dict(row) for row in rows])
+
+        except Exception as e:
+            logger.error("Error getting tile %s/%s/%s: %s", z, x, y, e)
+            return JSONResponse({'status': 500, 'message': "Ошибка при получении данных"})
+
+    content = dumps(tile)
+    tile_cache.set((z, x, y), content)
+    return Response(content, media_type="application/json")
@@ -0,0 +1,46 @@
+from fastapi import APIRouter
+from starlette.responses import JSONResponse
+
+from app.config import PAGE_SIZE, PAGE_SIZE_MAX
+from app.db_connection import database
+from app.logger import SAMPLED, get_logger
+from app.models.models import pereval_add_table
+from app.models.schemas import PerevalListResponse
+from app.utils.functions import pereval_short_dict, pereval_short_query
+from app.utils.responses import FastJSONResponse
+from app.utils.search import search_condition, search_rank, transliterate
+
+logger = get_logger()
+
+router = APIRouter(prefix="/SubmitData", tags=["Search"])
+
+
+@router.get("/search",
+            summary="Поиск перевалов по названию",
+            description="Поиск по title, beauty_title и other_titles с учётом опечаток "
+                        "и транслитерации, наиболее подходящие первыми",
+            response_model=PerevalListResponse)
+async def search_perevals(q: str, limit: int = PAGE_SIZE):
+    text = transliterate(q)
+    if not text:
+        return JSONResponse({'status': 400, 'message': 'Пустой поисковый запрос.'})
+    limit = max(1, min(limit, PAGE_SIZE_MAX))
+
+    rank = search_rank(text)
+    query = (
+        pereval_short_query()
+        .add_columns(rank.label("rank"))
+        .where(search_condition(text))
+        .order_by(rank.desc(), pereval_add_table.c.id)
+        .limit(limit)
+    )
+
+    async with database.connection():
+        try:
+            rows = await database.fetch_all(query)
+            logger.info("Search data retrieved successfully. Found: %s", len(rows), extra=SAMPLED)
+            return FastJSONResponse(dict(perevals=[pereval_short_dict(row) for row in rows]))
+
+        except Exception as e:
+            logger.error("Error searching data: %s", e)
+            return JSONResponse({'status': 500, 'message': "Ошибка при получении данных"})
@@ -0,0 +1,37 @@
+from fastapi import APIRouter
+from starlette.responses import PlainTextResponse
+
+from app.db_connection import pool_stats
+from app.utils.functions import users_cache
+from app.utils.metrics import registry
+from app.utils.response_cache import response_cache
+from app.utils.tiles import tile_cache
+
+router = APIRouter(tags=["Service"])
+
+
+@router.get("/cache/stats",
+            summary="Статистика кешей",
+            description="Попадания, промахи и вытеснения кешей ответов, пользователей и тайлов")
+async def get_cache_stats():
+    return {
+        'responses': response_cache.stats(),
+        'users': users_cache.stats(),
+        'tiles': tile_cache.stats(),
+    }
+
+
+@router.get("/pool/stats",
+            summary="Статистика пула соединений с базой",
+            description="Текущий размер пула, число свободных соединений и границы размера")
+async def get_pool_stats():
+    return pool_stats()
+
+
+@router.get("/metrics",
+            summary="Метрики в формате Prometheus",
+            description="Время обработки запросов по маршрутам, время этапов, число и время запросов к базе "
+                        "на запрос, ожидание соединения из пула",
+            response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
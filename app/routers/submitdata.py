@@ -1,85 +1,322 @@
+import uuid
+from pathlib import Path
+from typing import Annotated, AsyncIterator, List, Optional
+
 import sqlalchemy
-from fastapi import APIRouter
+from fastapi import APIRouter, Header, Request
+from pydantic import ValidationError
 from sqlalchemy.exc import DatabaseError, IntegrityError
-from starlette.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response, StreamingResponse
 
+from app.config import BATCH_MAX_SIZE, PAGE_SIZE, PAGE_SIZE_MAX
 from app.db_connection import database
-from app.logger import get_logger
-from app.models.models import coords_table, pereval_add_table, users_table
-from app.models.schemas import (PatchResponse, PerevalGetResponse,
-                                PerevalPostRequest, PerevalResponse,
-                                PerevalResponseByEmail)
+from app.logger import SAMPLED, get_logger
+from app.models.models import ingest_queue_table
+from app.models.schemas import (ImageRefModel, IngestStatusResponse,
+                                IngestTicketResponse, PatchResponse,
+                                PerevalBatchResponse, PerevalGetResponse,
+                                PerevalMetadataRequest, PerevalPostRequest,
+                                PerevalResponse, PerevalResponseByEmail,
+                                PerevalSyncResponse)
+from app.utils.blobstore import blob_path, guess_media_type
+from app.utils.derivative_worker import derivative_worker
+from app.utils.derivatives import derivative_path
 from app.utils.functions import (create_images, create_pereval,
-                                 get_or_create_coords, get_or_create_user,
-                                 get_pereval_by_id, update_pereval)
+                                 create_perevals, cursor_params,
+                                 decode_sync_token, encode_cursor,
+                                 encode_sync_token, get_or_create_coords,
+                                 get_or_create_user, pereval_by_id,
+                                 pereval_by_id_validators, pereval_check,
+                                 pereval_dict, perevals_by_email_query,
+                                 perevals_changed_query, perevals_page,
+                                 perevals_page_validators, store_images,
+                                 sync_watermark_query, update_pereval,
+                                 user_pereval_ids)
+from app.utils.idempotency import (IDEMPOTENCY_KEY_MAX_LENGTH, fingerprint,
+                                   idempotency_store)
+from app.utils.ingest_worker import enqueue_pereval, ingest_worker
+from app.utils.multipart import PerevalUploadParser, UploadError
+from app.utils.prepared import PreparedQuery
+from app.utils.response_cache import (CachedResponse, email_key,
+                                      invalidate_perevals, pereval_key,
+                                      response_cache)
+from app.utils.responses import (BlobResponse, FastJSONResponse, dumps,
+                                 is_conditional, is_not_modified, parse_range,
+                                 validators)
+from app.utils.tiles import invalidate_tiles, record_cluster_changes
 
 logger = get_logger()
 
 router = APIRouter(prefix="/SubmitData", tags=["SubmitData"])
 
 
+IdempotencyKey = Annotated[Optional[str], Header(max_length=IDEMPOTENCY_KEY_MAX_LENGTH,
+                                                  description="Ключ для безопасного повтора запроса")]
+
+
 @router.post("",
              summary="Отправка данных о перевале для обработки",
-             description="Отправляет данные о перевале для обработки",
+             description="Отправляет данные о перевале для обработки. Повтор запроса с тем же "
+                         "заголовком Idempotency-Key возвращает первый результат и не создаёт дубликатов.",
              response_model=PerevalResponse)
-async def submit_data(request: PerevalPostRequest) -> PerevalResponse:
-    async with database.transaction():
+async def submit_data(request: PerevalPostRequest, idempotency_key: IdempotencyKey = None) -> PerevalResponse:
+    request_fingerprint = fingerprint(request.json(sort_keys=True))
+    if idempotency_key:
+        replay = idempotency_store.replay(idempotency_key, request_fingerprint)
+        if replay is not None:
+            return replay
+
+    try:
+        images = await store_images(request.images)
+    except OSError as e:
+        logger.error("Error saving images: %s", e)
+        return PerevalResponse(status=500, message="Ошибка при сохранении изображений")
+
+    return await save_pereval(request, images, idempotency_key, request_fingerprint)
+
+
+@router.post("/upload",
+             summary="Отправка данных о перевале с фотографиями в multipart/form-data",
+             description="Принимает часть metadata с JSON данными о перевале без изображений "
+                         "и фотографии отдельными файлами. Файлы сохраняются по мере получения. "
+                         "Поддерживает заголовок Idempotency-Key.",
+             response_model=PerevalResponse)
+async def submit_data_multipart(request: Request, idempotency_key: IdempotencyKey = None):
+    try:
+        parser = PerevalUploadParser.from_content_type(request.headers.get('content-type', ''))
+    except UploadError as e:
+        return JSONResponse({'status': e.status, 'message': str(e)}, status_code=e.status)
+
+    try:
+        async for chunk in request.stream():
+            await run_in_threadpool(parser.write, chunk)
+        metadata = await run_in_threadpool(parser.finish)
+
+    except ValidationError as e:
+        parser.abort()
+        return JSONResponse({'detail': e.errors()}, status_code=422)
+
+    except UploadError as e:
+        parser.abort()
+        logger.info("Upload rejected: %s", e)
+        return JSONResponse({'status': e.status, 'message': str(e)}, status_code=e.status)
+
+    except OSError as e:
+        parser.abort()
+        logger.error("Error saving images: %s", e)
+        return PerevalResponse(status=500, message="Ошибка при сохранении изображений")
+
+    # Photos are content addressed, storing them again on a retry creates no duplicates
+    request_fingerprint = fingerprint(metadata.json(sort_keys=True), *(image.json() for image in parser.images))
+    if idempotency_key:
+        replay = idempotency_store.replay(idempotency_key, request_fingerprint)
+        if replay is not None:
+            return replay
+
+    return await save_pereval(metadata, parser.images, idempotency_key, request_fingerprint)
+
+
+@router.post("/batch",
+             summary="Пакетная отправка данных о перевалах",
+             description="Принимает список перевалов, накопленных мобильным приложением без связи. "
+                         "Возвращает статус каждого перевала в порядке отправки. "
+                         "Поддерживает заголовок Idempotency-Key.",
+             response_model=PerevalBatchResponse)
+async def submit_data_batch(request: List[PerevalPostRequest],
+                            idempotency_key: IdempotencyKey = None) -> PerevalBatchResponse:
+    if len(request) > BATCH_MAX_SIZE:
+        return PerevalBatchResponse(status=413, message=f"Не более {BATCH_MAX_SIZE} перевалов за запрос")
+
+    request_fingerprint = fingerprint(*(pereval.json(sort_keys=True) for pereval in request))
+    if idempotency_key:
+        replay = idempotency_store.replay(idempotency_key, request_fingerprint)
+        if replay is not None:
+            return replay
+
+    items: List[Optional[PerevalResponse]] = [None] * len(request)
+    stored = {}
+    for index, pereval in enumerate(request):
+        try:
+            stored[index] = await store_images(pereval.images)
+        except OSError as e:
+            logger.error("Error saving images: %s", e)
+            items[index] = PerevalResponse(status=500, message="Ошибка при сохранении изображений")
+
+    if stored:
+        try:
+            async with database.transaction():
+                if idempotency_key:
+                    replay = await idempotency_store.claim(idempotency_key, request_fingerprint)
+                    if replay is not None:
+                        return replay
+
+                updated_users = set()
+                ids = await create_perevals([request[index] for index in stored], list(stored.values()),
+                                            updated_users)
+                stale = await user_pereval_ids(updated_users)
+                for index, pereval in zip(stored, ids):
+                    items[index] = PerevalResponse(status=200, message="Отправлено успешно", id=pereval)
+
+                # A partly failed batch is replayed as well, its accepted items are committed with the key
+                response = batch_response(items)
+                if idempotency_key:
+                    await idempotency_store.save(idempotency_key, response.json().encode())
+
+        except Exception as e:
+            logger.error("Error submitting batch: %s", e)
+            for index in stored:
+                items[index] = PerevalResponse(status=500, message="Ошибка при отправке данных")
+
+        else:
+            logger.info("Batch submitted successfully. Pereval IDs: %s", ids)
+            derivative_worker.notify()
+            invalidate_tiles((request[index].coords.latitude, request[index].coords.longitude) for index in stored)
+            await invalidate_perevals(stale, {request[index].user.email for index in stored})
+            if idempotency_key:
+                idempotency_store.remember(idempotency_key, request_fingerprint, response.json().encode())
+
+    return batch_response(items)
+
+
+@router.post("/queue",
+             summary="Отправка данных о перевале в очередь",
+             description="Проверяет данные и ставит перевал в очередь на запись, не дожидаясь базы. "
+                         "Возвращает 202 и ticket, по которому запрашивается результат.",
+             response_model=IngestTicketResponse,
+             status_code=202)
+async def submit_data_queued(request: PerevalPostRequest) -> IngestTicketResponse:
+    try:
+        images = await store_images(request.images)
+    except OSError as e:
+        logger.error("Error saving images: %s", e)
+        return JSONResponse({'status': 500, 'message': "Ошибка при сохранении изображений"})
+
+    try:
+        ticket = await enqueue_pereval(request, images)
+    except Exception as e:
+        logger.error("Error queueing data: %s", e)
+        return JSONResponse({'status': 500, 'message': "Ошибка при отправке данных"})
+
+    ingest_worker.notify()
+    logger.info("Data queued successfully. Ticket: %s", ticket)
+    return IngestTicketResponse(status=202, message="Принято в обработку", ticket=ticket)
+
+
+@router.get("/queue/{ticket}",
+            summary="Получение результата записи перевала из очереди",
+            description="state: pending - ещё в очереди, done - записан (id перевала), failed - ошибка записи",
+            response_model=IngestStatusResponse)
+async def get_queued_status(ticket: str):
+    try:
+        uuid.UUID(ticket)
+    except ValueError:
+        return JSONResponse({'status': 404, 'message': 'Заявка не найдена.'}, status_code=404)
+
+    query = (
+        sqlalchemy.select(ingest_queue_table.c.status, ingest_queue_table.c.pereval_id)
+        .where(ingest_queue_table.c.ticket == ticket)
+    )
+    async with database.connection():
         try:
-            user = await get_or_create_user(request.user)
+            row = await database.fetch_one(query)
+        except Exception as e:
+            logger.error("Error getting queue status: %s", e)
+            return JSONResponse({'status': 500, 'message': "Ошибка при получении данных"})
+
+    if row is None:
+        return JSONResponse({'status': 404, 'message': 'Заявка не найдена.'}, status_code=404)
+    if row["status"] == 'done':
+        return IngestStatusResponse(state='done', message="Отправлено успешно", id=row["pereval_id"])
+    if row["status"] == 'failed':
+        return IngestStatusResponse(state='failed', message="Ошибка при отправке данных")
+    return IngestStatusResponse(state='pending', message="В очереди")
+
+
+def batch_response(items: List[PerevalResponse]) -> PerevalBatchResponse:
+    failed = sum(item.status != 200 for item in items)
+    return PerevalBatchResponse(status=200 if not failed else 500,
+                                message=f"Отправлено {len(items) - failed} из {len(items)}",
+                                items=items)
+
+
+async def save_pereval(request: PerevalMetadataRequest, images: List[ImageRefModel],
+                       idempotency_key: Optional[str] = None, request_fingerprint: str = '') -> PerevalResponse:
+    try:
+        async with database.transaction():
+            if idempotency_key:
+                replay = await idempotency_store.claim(idempotency_key, request_fingerprint)
+                if replay is not None:
+                    return replay
+
+            updated_users = set()
+            user = await get_or_create_user(request.user, updated_users)
             coords = await get_or_create_coords(request.coords)
             pereval = await create_pereval(request, user, coords)
-            await create_images(request.images, pereval)
+            await create_images(images, pereval)
+            # Cached responses of the user's other perevals show the old name and phone
+            stale = await user_pereval_ids(updated_users)
 
-            logger.info(f"Data submitted successfully. Pereval ID: {pereval}")
+            response = PerevalResponse(status=200, message="Отправлено успешно", id=pereval)
+            if idempotency_key:
+                await idempotency_store.save(idempotency_key, response.json().encode())
+            await record_cluster_changes(added=[coords])
 
-            return PerevalResponse(status=200, message="Отправлено успешно", id=pereval)
+            logger.info("Data submitted successfully. Pereval ID: %s", pereval)
 
-        except (DatabaseError, IntegrityError) as e:
-            logger.error(f"Error submitting data: {str(e)}")
-            return PerevalResponse(status=500, message=str(e))
+    # Errors roll the transaction back, a retry with the same Idempotency-Key runs again
+    except (DatabaseError, IntegrityError) as e:
+        logger.error("Error submitting data: %s", e)
+        return PerevalResponse(status=500, message=str(e))
 
-        except Exception as e:
-            logger.error(f"Error submitting data: {str(e)}")
-            return PerevalResponse(status=500, message="Ошибка при отправке данных")
+    except Exception as e:
+        logger.error("Error submitting data: %s", e)
+        return PerevalResponse(status=500, message="Ошибка при отправке данных")
+
+    derivative_worker.notify()
+    invalidate_tiles([(request.coords.latitude, request.coords.longitude)])
+    await invalidate_perevals(stale, [request.user.email])
+    if idempotency_key:
+        idempotency_store.remember(idempotency_key, request_fingerprint, response.json().encode())
+    return response
 
 
 @router.get("",
             summary="Получение данных о перевале по id",
-            description="Получение данных о перевале по id",
+            description="Получение данных о перевале по id. Ответ содержит ETag и Last-Modified, "
+                        "при совпадении If-None-Match или If-Modified-Since отдаётся 304.",
             response_model=PerevalGetResponse)
-async def get_data(pereval_id: int):
+async def get_data(pereval_id: int, request: Request):
+    entry = await response_cache.get(pereval_key(pereval_id))
+    if entry is not None:
+        return json_response(request, entry)
+
+    version = response_cache.version()
     async with database.connection():
         try:
-            query = (
-                sqlalchemy.select(
-                    pereval_add_table,
-                    coords_table,
-                    users_table
-                )
-                .select_from(
-                    pereval_add_table
-                    .join(coords_table, pereval_add_table.c.coords_id == coords_table.c.id)
-                    .join(users_table, pereval_add_table.c.user_id == users_table.c.id)
-                )
-                .where(pereval_add_table.c.id == pereval_id)
-            )
-            pereval = await database.fetch_one(query)
+            response = await not_modified(request, pereval_by_id_validators, pereval_id=pereval_id)
+            if response is not None:
+                return response
+
+            pereval = await pereval_by_id.fetch_one(pereval_id=pereval_id)
 
             if pereval:
-                logger.info(f"Data retrieved successfully. Pereval ID: {pereval.id}")
-                response = await get_pereval_by_id(pereval)
-                return response
+                logger.info("Data retrieved successfully. Pereval ID: %s", pereval.id, extra=SAMPLED)
+                entry = CachedResponse(dumps(pereval_dict(pereval)),
+                                       *validators(pereval["total"], pereval["modified"]))
+                await response_cache.set(pereval_key(pereval_id), entry, version)
+                return json_response(request, entry)
 
             else:
-                logger.info(f"Data not found. Pereval ID: {pereval}")
+                logger.info("Data not found. Pereval ID: %s", pereval)
                 return JSONResponse({'status': 204, 'message': 'Данные не найдены.'})
 
         except (DatabaseError, IntegrityError) as e:
-            logger.error(f"Error getting data: {str(e)}")
+            logger.error("Error getting data: %s", e)
             return JSONResponse({'status': 500, 'message': "Ошибка при получении данных"})
 
         except Exception as e:
-            logger.error(f"Error getting data: {str(e)}")
+            logger.error("Error getting data: %s", e)
             return JSONResponse({'status': 500, 'message': "Ошибка при получении данных"})
 
 
@@ -89,82 +326,246 @@ async def get_data(pereval_id: int):
               response_model=PatchResponse)
 async def update_data(pereval_id: int, request: PerevalPostRequest) -> PatchResponse:
     async with database.transaction():
-        query = (
-            sqlalchemy.select(
-                pereval_add_table,
-                users_table
-            )
-            .select_from(
-                pereval_add_table
-                .join(users_table, pereval_add_table.c.user_id == users_table.c.id)
-            )
-            .where(pereval_add_table.c.id == pereval_id)
-        )
-        check_pereval = await database.fetch_one(query)
+        check_pereval = await pereval_check.fetch_one(pereval_id=pereval_id)
 
         if check_pereval is None:
-            logger.info(f"Data not found. Pereval ID: {pereval_id} exists.")
+            logger.info("Data not found. Pereval ID: %s exists.", pereval_id)
             return PatchResponse(state=0, message='Данные о перевале не найдены.')
 
         if check_pereval.status != 'new':
-            logger.error(f"Can not update data. Pereval ID: {pereval_id}")
+            logger.error("Can not update data. Pereval ID: %s", pereval_id)
             return PatchResponse(state=0, message='Запрещено изменять проверенные данные.')
 
         if check_pereval.email != request.user.email or check_pereval.last_name != request.user.fam or \
                 check_pereval.first_name != request.user.name or check_pereval.patronymic != request.user.otc \
                 or check_pereval.phone != request.user.phone:
-            logger.error(f"Can not update user data. Pereval ID: {pereval_id}")
+            logger.error("Can not update user data. Pereval ID: %s", pereval_id)
             return PatchResponse(state=0, message='Запрещено изменять данные о пользователе.')
 
+        # Photos of a rejected update are never written
+        try:
+            images = await store_images(request.images)
+        except OSError as e:
+            logger.error("Error saving images: %s", e)
+            return PatchResponse(state=0, message="Ошибка при сохранении изображений")
+
         user = check_pereval.user_id
-        coords = await get_or_create_coords(request.coords, check_pereval.coords_id)
-        pereval = await update_pereval(request, pereval_id, user, coords)
-        await create_images(request.images, pereval)
+        coords = await get_or_create_coords(request.coords)
+        await update_pereval(request, pereval_id, user, coords)
+        await create_images(images, pereval_id)
+
+        moved = [(check_pereval.latitude, check_pereval.longitude), (request.coords.latitude, request.coords.longitude)]
+        if coords != check_pereval.coords_id:
+            await record_cluster_changes(added=[coords], removed=[check_pereval.coords_id])
 
-        logger.info(f"Data updated successfully.")
+        logger.info("Data updated successfully.")
 
-        return PatchResponse(state=1, message="Данные обновлены.")
+    derivative_worker.notify()
+    invalidate_tiles(moved)
+    await invalidate_perevals([pereval_id], [request.user.email])
+    return PatchResponse(state=1, message="Данные обновлены.")
 
 
 @router.get("/<user_email>",
             summary="Получение данных о перевалах добавленных пользователем",
-            description="Получение данных о перевалах добавленных пользователем",
+            description="Получение данных о перевалах добавленных пользователем. "
+                        "Данные отдаются страницами по limit записей, следующая страница "
+                        "запрашивается по next_cursor. При stream=true отдаётся NDJSON поток. "
+                        "Страницы поддерживают ETag/Last-Modified и ответ 304.",
             response_model=PerevalResponseByEmail)
-async def get_data_by_email(user_email: str):
+async def get_data_by_email(user_email: str, request: Request, limit: int = PAGE_SIZE,
+                            cursor: Optional[str] = None, stream: bool = False):
+    limit = max(1, min(limit, PAGE_SIZE_MAX))
+
+    # The first page with the default limit is what clients load on start, only it is cached
+    cached = not stream and cursor is None and limit == PAGE_SIZE
+    if cached:
+        entry = await response_cache.get(email_key(user_email))
+        if entry is not None:
+            return json_response(request, entry)
+    version = response_cache.version()
+
+    try:
+        params = dict(user_email=user_email, **cursor_params(cursor))
+    except ValueError as e:
+        logger.info("Bad cursor: %s", e)
+        return JSONResponse({'status': 400, 'message': 'Неверный курсор.'})
+
+    after_cursor = bool(cursor)
+    if stream:
+        query = perevals_by_email_query(after_cursor).params(**params)
+        return StreamingResponse(stream_perevals(query), media_type="application/x-ndjson")
+
     async with database.connection():
         try:
-            query = (
-                sqlalchemy.select(
-                    pereval_add_table,
-                    coords_table,
-                    users_table
-                )
-                .select_from(
-                    pereval_add_table
-                    .join(coords_table, pereval_add_table.c.coords_id == coords_table.c.id)
-                    .join(users_table, pereval_add_table.c.user_id == users_table.c.id)
-                )
-                .where(users_table.c.email == user_email)
-            )
-            entities = await database.fetch_all(query)
+            response = await not_modified(request, perevals_page_validators[after_cursor], **params)
+            if response is not None:
+                return response
+
+            entities = await perevals_page[after_cursor].fetch_all(limit=limit + 1, **params)
 
             if entities:
                 list_perevals = []
-                for entity in entities:
+                for entity in entities[:limit]:
                     try:
-                        pereval = await get_pereval_by_id(entity)
-                        list_perevals.append(pereval)
+                        list_perevals.append(pereval_dict(entity))
                     except Exception as e:
-                        logger.error(f"Error getting data: {str(e)}")
+                        logger.error("Error getting data: %s", e)
                         continue
-                return PerevalResponseByEmail(perevals=list_perevals)
+
+                next_cursor = None
+                if len(entities) > limit:
+                    last = entities[limit - 1]
+                    next_cursor = encode_cursor(last["add_time"], last["id"])
+
+                entry = CachedResponse(dumps(dict(perevals=list_perevals, next_cursor=next_cursor)),
+                                       *validators(entities[0]["total"], entities[0]["modified"]))
+                if cached:
+                    await response_cache.set(email_key(user_email), entry, version)
+                return json_response(request, entry)
+
+            # Past the last page of a non-empty listing
+            if after_cursor:
+                return FastJSONResponse(dict(perevals=[], next_cursor=None))
 
             return JSONResponse({'status': 204, 'message': 'Данные не найдены.'})
 
         except (DatabaseError, IntegrityError) as e:
-            logger.error(f"Error getting data: {str(e)}")
+            logger.error("Error getting data: %s", e)
             return JSONResponse({'status': 500, 'message': "Ошибка при получении данных"})
 
         except Exception as e:
-            logger.error(f"Error getting data: {str(e)}")
+            logger.error("Error getting data: %s", e)
+            return JSONResponse({'status': 500, 'message': "Ошибка при получении данных"})
+
+
+@router.get("/sync",
+            summary="Получение изменений перевалов пользователя",
+            description="Перевалы пользователя, добавленные или изменённые (в т.ч. сменившие статус) "
+                        "после токена since. Без since отдаются все перевалы. Следующий запрос делается "
+                        "с полученным since, при has_more=true изменения получены не полностью.",
+            response_model=PerevalSyncResponse)
+async def get_data_changes(user_email: str, since: Optional[str] = None, limit: int = PAGE_SIZE):
+    limit = max(1, min(limit, PAGE_SIZE_MAX))
+
+    try:
+        position = decode_sync_token(since) if since else (0, 0)
+    except ValueError as e:
+        logger.info("Bad sync token: %s", e)
+        return JSONResponse({'status': 400, 'message': 'Неверный токен синхронизации.'})
+
+    async with database.connection():
+        try:
+            # Watermark and rows have to come from one snapshot
+            async with database.transaction(isolation="repeatable_read", readonly=True):
+                watermark = await database.fetch_val(sync_watermark_query())
+                rows = await database.fetch_all(perevals_changed_query(user_email, position, watermark, limit + 1))
+
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            if has_more:
+                token = encode_sync_token(rows[-1]["change_seq"], rows[-1]["id"])
+            else:
+                token = encode_sync_token(watermark, 0)
+
+            logger.info("Changes retrieved successfully. Found: %s", len(rows), extra=SAMPLED)
+            return FastJSONResponse(dict(perevals=[pereval_dict(row) for row in rows], since=token,
+                                         has_more=has_more))
+
+        except (DatabaseError, IntegrityError) as e:
+            logger.error("Error getting changes: %s", e)
             return JSONResponse({'status': 500, 'message': "Ошибка при получении данных"})
+
+        except Exception as e:
+            logger.error("Error getting changes: %s", e)
+            return JSONResponse({'status': 500, 'message': "Ошибка при получении данных"})
+
+
+async def not_modified(request: Request, query: PreparedQuery, **params) -> Optional[Response]:
+    """ 304 computed from the validators alone, before the perevals are read """
+    if not is_conditional(request.headers):
+        return None
+
+    row = await query.fetch_one(**params)
+    if not row["total"]:
+        return None
+    etag, last_modified = validators(row["total"], row["modified"])
+    if is_not_modified(request.headers, etag, last_modified):
+        return Response(status_code=304, headers=validator_headers(etag, last_modified))
+    return None
+
+
+def json_response(request: Request, entry: CachedResponse) -> Response:
+    headers = validator_headers(entry.etag, entry.last_modified)
+    if is_not_modified(request.headers, entry.etag, entry.last_modified):
+        return Response(status_code=304, headers=headers)
+    return Response(entry.content, media_type="application/json", headers=headers)
+
+
+def validator_headers(etag: str, last_modified: str) -> dict:
+    # no-cache: clients keep the copy but revalidate it on every use
+    return {'etag': etag, 'last-modified': last_modified, 'cache-control': 'no-cache'}
+
+
+async def stream_perevals(query) -> AsyncIterator[str]:
+    """ Yield perevals one NDJSON line at a time, reading rows with a server-side cursor """
+    try:
+        async for row in database.iterate(query):
+            yield dumps(pereval_dict(row)) + b"\n"
+    except Exception as e:
+        logger.error("Error streaming data: %s", e)
+        # The status is already sent, a last line tells the client the stream is incomplete
+        yield dumps({'status': 500, 'message': "Ошибка при получении данных"}) + b"\n"
+
+
+@router.get("/images/{sha256}",
+            summary="Получение изображения перевала",
+            description="Отдаёт изображение по его SHA-256, поддерживает запросы Range",
+            response_class=BlobResponse)
+async def get_image(sha256: str, request: Request):
+    try:
+        path = blob_path(sha256)
+    except ValueError:
+        path = None
+
+    # Blobs are content addressed, so the hash is a strong validator that never changes
+    return await serve_blob(request, path, f'"{sha256}"', 'public, max-age=31536000, immutable')
+
+
+@router.get("/images/{sha256}/{variant}",
+            summary="Получение уменьшенной копии изображения перевала",
+            description="Отдаёт миниатюру (thumbnail) или превью (preview) изображения. "
+                        "Пока копия не готова, отдаётся оригинал.",
+            response_class=BlobResponse)
+async def get_image_variant(sha256: str, variant: str, request: Request):
+    try:
+        path = derivative_path(sha256, variant)
+    except ValueError:
+        return await serve_blob(request, None, '', '')
+
+    if await run_in_threadpool(path.exists):
+        return await serve_blob(request, path, f'"{sha256}-{variant}"', 'public, max-age=31536000, immutable')
+
+    return await serve_blob(request, blob_path(sha256), f'"{sha256}"', 'no-cache')
+
+
+async def serve_blob(request: Request, path: Optional[Path], etag: str, cache_control: str):
+    try:
+        if path is None:
+            raise FileNotFoundError
+        size = (await run_in_threadpool(path.stat)).st_size
+    except FileNotFoundError:
+        logger.info("Image not found: %s", path)
+        return JSONResponse({'status': 404, 'message': 'Изображение не найдено.'}, status_code=404)
+
+    headers = {'etag': etag, 'cache-control': cache_control}
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers=headers)
+
+    try:
+        byte_range = parse_range(request.headers.get('range'), size)
+    except ValueError:
+        return Response(status_code=416, headers={'content-range': f'bytes */{size}'})
+
+    media_type = await run_in_threadpool(guess_media_type, path)
+    return BlobResponse(path, size, byte_range, headers=headers, media_type=media_type)
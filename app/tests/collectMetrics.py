@@ -0,0 +1,53 @@
+import unittest
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.utils.metrics import (Histogram, QueryStats, observe_query,
+                               query_stats, stage_duration, timed)
+
+client = TestClient(app)
+
+
+class TestCollectMetrics(unittest.IsolatedAsyncioTestCase):
+    #  Tests that a histogram renders cumulative buckets, sum and count per label values
+    def test_histogram(self):
+        histogram = Histogram("test_seconds", "Test.", ("route",), (0.1, 1.0))
+        histogram.observe(0.1, "/a")
+        histogram.observe(0.5, "/a")
+        histogram.observe(5, "/a")
+        lines = histogram.render()
+        self.assertIn('test_seconds_bucket{route="/a",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{route="/a",le="1.0"} 2', lines)
+        self.assertIn('test_seconds_bucket{route="/a",le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_sum{route="/a"} 5.6', lines)
+        self.assertIn('test_seconds_count{route="/a"} 3', lines)
+
+    #  Tests that queries are counted for the request being handled
+    def test_query_stats(self):
+        stats = QueryStats()
+        token = query_stats.set(stats)
+        try:
+            observe_query(0.5)
+            observe_query(0.25)
+        finally:
+            query_stats.reset(token)
+        self.assertEqual((stats.count, stats.duration), (2, 0.75))
+
+    #  Tests that a timed helper is recorded under its name
+    async def test_timed(self):
+        @timed
+        async def helper_stage():
+            return 1
+
+        self.assertEqual(await helper_stage(), 1)
+        self.assertIn(("helper_stage",), stage_duration.series)
+
+    #  Tests that requests are recorded by route template and served in the Prometheus format
+    def test_metrics_endpoint(self):
+        client.get("/SubmitData/tiles/99/0/0")
+        response = client.get("/metrics")
+        self.assertTrue(response.headers["content-type"].startswith("text/plain; version=0.0.4"))
+        self.assertIn('fstr_http_request_duration_seconds_count{method="GET",route="/SubmitData/tiles/{z}/{x}/{y}",'
+                      'status="200"}', response.text)
+        self.assertIn('fstr_db_queries_per_request_count{route="/SubmitData/tiles/{z}/{x}/{y}"}', response.text)
@@ -1,23 +1,32 @@
+import json
 import unittest
+from unittest.mock import patch
 import pytest
+import sqlalchemy
+from sqlalchemy.exc import DatabaseError
 from starlette.responses import JSONResponse
 
+from app.db_connection import database
+from app.models.models import pereval_add_table
 from app.models.schemas import PerevalResponseByEmail
-from app.routers.submitdata import get_data_by_email
+from app.routers.submitdata import get_data_by_email, stream_perevals
+from app.tests.helpers import (DatabaseTestCase, make_pereval, make_request,
+                               unique_email)
+from app.utils.functions import create_perevals, encode_cursor
 
 
 class TestGetDataByEmail(unittest.TestCase):
     #  Tests that the function returns a PerevalResponseByEmail object with a list of PerevalGetResponse objects for a valid email that has associated perevals
     @pytest.mark.asyncio
     async def test_valid_email_with_associated_perevals(self):
-        response = await get_data_by_email('valid_email_with_associated_perevals@test.com')
-        self.assertIsInstance(response, PerevalResponseByEmail)
+        response = await get_data_by_email('valid_email_with_associated_perevals@test.com', make_request())
+        response = PerevalResponseByEmail.parse_raw(response.body)
         self.assertGreater(len(response.perevals), 0)
 
     #  Tests that the function returns a JSONResponse with status 204 and message 'Данные не найдены.' for a valid email that has no associated perevals
     @pytest.mark.asyncio
     async def test_valid_email_with_no_associated_perevals(self):
-        response = await get_data_by_email('valid_email_with_no_associated_perevals@test.com')
+        response = await get_data_by_email('valid_email_with_no_associated_perevals@test.com', make_request())
         self.assertIsInstance(response, JSONResponse)
         self.assertEqual(response.status_code, 204)
         self.assertEqual(response.json(), {'status': 204, 'message': 'Данные не найдены.'})
@@ -25,7 +34,7 @@ class TestGetDataByEmail(unittest.TestCase):
     #  Tests that the function returns a JSONResponse with status 422 and message 'Неверный формат email' for an invalid email format
     @pytest.mark.asyncio
     async def test_invalid_email_format(self):
-        response = await get_data_by_email('invalid_email_format')
+        response = await get_data_by_email('invalid_email_format', make_request())
         self.assertIsInstance(response, JSONResponse)
         self.assertEqual(response.status_code, 422)
         self.assertEqual(response.json(), {'status': 422, 'message': 'Неверный формат email'})
@@ -33,7 +42,60 @@ class TestGetDataByEmail(unittest.TestCase):
     #  Tests that the function returns a JSONResponse with status 204 and message 'Данные не найдены.' for a non-existent email
     @pytest.mark.asyncio
     async def test_non_existent_email(self):
-        response = await get_data_by_email('non_existent_email@test.com')
+        response = await get_data_by_email('non_existent_email@test.com', make_request())
         self.assertIsInstance(response, JSONResponse)
         self.assertEqual(response.status_code, 204)
         self.assertEqual(response.json(), {'status': 204, 'message': 'Данные не найдены.'})
+
+
+class TestGetDataByEmailCursor(unittest.IsolatedAsyncioTestCase):
+    #  Tests that the function returns a JSONResponse with status 400 for a malformed cursor
+    async def test_invalid_cursor(self):
+        response = await get_data_by_email('valid_email_with_associated_perevals@test.com', make_request(),
+                                           cursor='invalid')
+        self.assertIsInstance(response, JSONResponse)
+        self.assertEqual(json.loads(response.body), {'status': 400, 'message': 'Неверный курсор.'})
+
+
+class TestStreamPerevals(unittest.IsolatedAsyncioTestCase):
+    #  Tests that a failure in the middle of a stream ends it with an error line instead of a silent cut
+    async def test_error_line(self):
+        async def failing_iterate(query):
+            raise DatabaseError('SELECT', {}, Exception('connection lost'))
+            yield
+
+        with patch('app.routers.submitdata.database.iterate', failing_iterate):
+            lines = [line async for line in stream_perevals(None)]
+        self.assertEqual(json.loads(lines[-1]), {'status': 500, 'message': 'Ошибка при получении данных'})
+
+
+class TestGetDataByEmailDatabase(DatabaseTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.email = unique_email()
+        async with database.transaction():
+            self.ids = await create_perevals([make_pereval(self.email, 'First'), make_pereval(self.email, 'Second')],
+                                             [[], []])
+
+    #  Tests that pages follow each other by cursor and the page after the last one is empty, not 204
+    async def test_pages(self):
+        first = json.loads((await get_data_by_email(self.email, make_request(), limit=1)).body)
+        self.assertEqual([pereval['title'] for pereval in first['perevals']], ['First'])
+        self.assertIsNotNone(first['next_cursor'])
+
+        second = json.loads((await get_data_by_email(self.email, make_request(), limit=1,
+                                                     cursor=first['next_cursor'])).body)
+        self.assertEqual([pereval['title'] for pereval in second['perevals']], ['Second'])
+        self.assertIsNone(second['next_cursor'])
+
+        last = await database.fetch_one(sqlalchemy.select(pereval_add_table.c.add_time, pereval_add_table.c.id)
+                                        .where(pereval_add_table.c.id == self.ids[-1]))
+        response = await get_data_by_email(self.email, make_request(), limit=1,
+                                           cursor=encode_cursor(last['add_time'], last['id']))
+        self.assertEqual(json.loads(response.body), {'perevals': [], 'next_cursor': None})
+
+    #  Tests that the stream has one line per pereval
+    async def test_stream(self):
+        response = await get_data_by_email(self.email, make_request(), stream=True)
+        lines = [json.loads(line) async for line in response.body_iterator]
+        self.assertEqual([line['title'] for line in lines], ['First', 'Second'])
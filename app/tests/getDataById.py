@@ -1,16 +1,22 @@
 import unittest
+from datetime import datetime, timedelta, timezone
 from unittest.mock import patch
 import pytest
 from sqlalchemy.exc import DatabaseError, IntegrityError
+from starlette.datastructures import Headers
 
-from app.routers.submitdata import get_data
+from app.routers.submitdata import get_data, update_data
+from app.tests.helpers import (DatabaseTestCase, make_pereval, make_request,
+                               unique_email)
+from app.utils.functions import create_perevals
+from app.utils.responses import is_not_modified, validators
 
 
 class TestGetData(unittest.TestCase):
     #  Tests that data is retrieved successfully for a valid pereval_id
     @pytest.mark.asyncio
     async def test_retrieve_data_successfully(self):
-        response = await get_data(1)
+        response = await get_data(1, make_request())
         self.assertEqual(response.status_code, 200)
         self.assertIsInstance(response.json(), dict)
         self.assertIn('id', response.json())
@@ -26,7 +32,7 @@ class TestGetData(unittest.TestCase):
     #  Tests that a JSONResponse with status 204 and message 'Данные не найдены.' is returned if pereval is not found
     @pytest.mark.asyncio
     async def test_return_not_found(self):
-        response = await get_data(9999)
+        response = await get_data(9999, make_request())
         self.assertEqual(response.status_code, 204)
         self.assertIsInstance(response.json(), dict)
         self.assertIn('status', response.json())
@@ -39,7 +45,7 @@ class TestGetData(unittest.TestCase):
     async def test_return_error_on_database_error(self):
         with patch('app.routes.get_data.database.fetch_one') as mock_fetch_one:
             mock_fetch_one.side_effect = DatabaseError()
-            response = await get_data(1)
+            response = await get_data(1, make_request())
             self.assertEqual(response.status_code, 500)
             self.assertIsInstance(response.json(), dict)
             self.assertIn('status', response.json())
@@ -49,10 +55,62 @@ class TestGetData(unittest.TestCase):
 
         with patch('app.routes.get_data.database.fetch_one') as mock_fetch_one:
             mock_fetch_one.side_effect = IntegrityError()
-            response = await get_data(1)
+            response = await get_data(1, make_request())
             self.assertEqual(response.status_code, 500)
             self.assertIsInstance(response.json(), dict)
             self.assertIn('status', response.json())
             self.assertEqual(response.json()['status'], 500)
             self.assertIn('message', response.json())
             self.assertEqual(response.json()['message'], 'Ошибка при получении данных')
+
+
+class TestValidators(unittest.IsolatedAsyncioTestCase):
+    #  Tests that the ETag changes with the row count and the latest change, Last-Modified is an HTTP date
+    def test_validators(self):
+        modified = datetime(2026, 10, 18, 10, 0, 0, 123456, tzinfo=timezone.utc)
+        etag, last_modified = validators(2, modified)
+        self.assertEqual(last_modified, 'Sun, 18 Oct 2026 10:00:00 GMT')
+        self.assertNotEqual(validators(3, modified)[0], etag)
+        self.assertNotEqual(validators(2, modified + timedelta(microseconds=1))[0], etag)
+
+    #  Tests that If-None-Match wins over If-Modified-Since and both are evaluated as in RFC 7232
+    def test_is_not_modified(self):
+        etag, last_modified = validators(1, datetime(2026, 10, 18, 10, 0, tzinfo=timezone.utc))
+        self.assertTrue(is_not_modified(Headers({'if-none-match': etag}), etag, last_modified))
+        self.assertTrue(is_not_modified(Headers({'if-none-match': f'"0-0", W/{etag}'}), etag, last_modified))
+        self.assertTrue(is_not_modified(Headers({'if-none-match': '*'}), etag, last_modified))
+        self.assertFalse(is_not_modified(Headers({'if-none-match': '"0-0"', 'if-modified-since': last_modified}),
+                                         etag, last_modified))
+
+        self.assertTrue(is_not_modified(Headers({'if-modified-since': last_modified}), etag, last_modified))
+        self.assertFalse(is_not_modified(Headers({'if-modified-since': 'Sun, 18 Oct 2026 09:59:59 GMT'}),
+                                         etag, last_modified))
+        self.assertFalse(is_not_modified(Headers({'if-modified-since': 'yesterday'}), etag, last_modified))
+        self.assertFalse(is_not_modified(Headers({}), etag, last_modified))
+
+
+class TestGetDataDatabase(DatabaseTestCase):
+    #  Tests that a repeated request with the returned ETag or Last-Modified is answered with 304 and no body
+    async def test_not_modified(self):
+        email = unique_email()
+        (pereval_id,) = await create_perevals([make_pereval(email)], [[]])
+        response = await get_data(pereval_id, make_request())
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('etag', response.headers)
+        self.assertIn('last-modified', response.headers)
+
+        not_modified = await get_data(pereval_id, make_request({'If-None-Match': response.headers['etag']}))
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.body, b'')
+
+        not_modified = await get_data(pereval_id,
+                                      make_request({'If-Modified-Since': response.headers['last-modified']}))
+        self.assertEqual(not_modified.status_code, 304)
+
+        modified = await get_data(pereval_id, make_request({'If-None-Match': '"0-0"'}))
+        self.assertEqual(modified.status_code, 200)
+
+        # After an update the old ETag no longer matches
+        self.assertEqual((await update_data(pereval_id, make_pereval(email, 'Renamed'))).state, 1)
+        updated = await get_data(pereval_id, make_request({'If-None-Match': response.headers['etag']}))
+        self.assertEqual(updated.status_code, 200)
@@ -0,0 +1,48 @@
+import json
+import unittest
+
+from app.routers.submitdata import get_data_changes, update_data
+from app.tests.helpers import DatabaseTestCase, make_pereval, unique_email
+from app.utils.functions import (create_perevals, decode_sync_token,
+                                 encode_sync_token)
+
+
+class TestGetDataChanges(unittest.IsolatedAsyncioTestCase):
+    #  Tests that a sync token survives the round trip and a malformed one is rejected
+    def test_sync_token(self):
+        self.assertEqual(decode_sync_token(encode_sync_token(1024, 7)), (1024, 7))
+        with self.assertRaises(ValueError):
+            decode_sync_token('invalid')
+
+    #  Tests that a malformed token returns status 400
+    async def test_invalid_token(self):
+        response = await get_data_changes('valid_email_with_associated_perevals@test.com', since='invalid')
+        self.assertEqual(json.loads(response.body), {'status': 400, 'message': 'Неверный токен синхронизации.'})
+
+
+class TestGetDataChangesDatabase(DatabaseTestCase):
+    async def changes(self, email, since=None, limit=100):
+        return json.loads((await get_data_changes(email, since=since, limit=limit)).body)
+
+    #  Tests that a full sync is paged, a repeated sync returns nothing and an update is synced again
+    async def test_sync_pages(self):
+        email = unique_email()
+        ids = await create_perevals([make_pereval(email, title) for title in ('First', 'Second', 'Third')],
+                                    [[], [], []])
+
+        response = await self.changes(email, limit=1)
+        seen = [pereval['id'] for pereval in response['perevals']]
+        while response['has_more']:
+            response = await self.changes(email, since=response['since'], limit=1)
+            seen.extend(pereval['id'] for pereval in response['perevals'])
+        self.assertEqual(sorted(seen), sorted(ids))
+
+        again = await self.changes(email, since=response['since'])
+        self.assertEqual(again['perevals'], [])
+        self.assertFalse(again['has_more'])
+
+        changed = make_pereval(email, 'Second, renamed')
+        self.assertEqual((await update_data(ids[1], changed)).state, 1)
+        synced = await self.changes(email, since=again['since'])
+        self.assertEqual([(pereval['id'], pereval['title']) for pereval in synced['perevals']],
+                         [(ids[1], 'Second, renamed')])
@@ -0,0 +1,67 @@
+import base64
+import unittest
+
+from starlette.testclient import TestClient
+
+from app.main import app
+from app.routers.submitdata import get_image
+from app.tests.helpers import make_request
+from app.utils.blobstore import decode_image_data, save_blob
+from app.utils.responses import BlobResponse
+
+JPEG = b'\xff\xd8\xff\xe0' + b'\x00' * 16
+
+
+class TestGetImage(unittest.IsolatedAsyncioTestCase):
+    #  Tests that a stored image is returned whole with its hash as ETag
+    async def test_image_found(self):
+        sha256, size = save_blob(b'Image Data')
+        response = await get_image(sha256, make_request())
+        self.assertIsInstance(response, BlobResponse)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['etag'], f'"{sha256}"')
+        self.assertEqual(response.headers['content-length'], str(size))
+
+    #  Tests that a Range request returns 206 with the requested part only
+    async def test_image_range(self):
+        sha256, size = save_blob(b'Image Data')
+        response = await get_image(sha256, make_request({'Range': 'bytes=0-4'}))
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.headers['content-range'], f'bytes 0-4/{size}')
+        self.assertEqual(response.headers['content-length'], '5')
+
+    #  Tests that identical uploads are stored once
+    async def test_deduplication(self):
+        self.assertEqual(save_blob(b'Image Data'), save_blob(b'Image Data'))
+
+    #  Tests that an unknown or malformed hash returns 404
+    async def test_image_not_found(self):
+        response = await get_image('0' * 64, make_request())
+        self.assertEqual(response.status_code, 404)
+        response = await get_image('../../etc/passwd', make_request())
+        self.assertEqual(response.status_code, 404)
+
+    #  Tests that the OpenAPI schema, and so /docs, can be built with the image routes
+    def test_openapi(self):
+        response = TestClient(app).get('/openapi.json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('/SubmitData/images/{sha256}', response.json()['paths'])
+
+
+class TestDecodeImageData(unittest.TestCase):
+    #  Tests that base64 of an image is decoded, with or without a data: URI
+    def test_image(self):
+        encoded = base64.b64encode(JPEG).decode()
+        self.assertEqual(decode_image_data(encoded), JPEG)
+        self.assertEqual(decode_image_data(f'data:image/jpeg;base64,{encoded}'), JPEG)
+
+    #  Tests that plain strings which happen to be valid base64 are kept as they are
+    def test_plain_string(self):
+        self.assertEqual(decode_image_data('test'), b'test')
+        self.assertEqual(decode_image_data('abcd'), b'abcd')
+        self.assertEqual(decode_image_data('SW1hZ2UgRGF0YQ=='), b'SW1hZ2UgRGF0YQ==')
+        self.assertEqual(decode_image_data('not base64!'), b'not base64!')
+
+    #  Tests that a data: URI marks the data as base64 whatever it contains
+    def test_data_uri(self):
+        self.assertEqual(decode_image_data('data:text/plain;base64,SW1hZ2UgRGF0YQ=='), b'Image Data')
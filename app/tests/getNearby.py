@@ -0,0 +1,82 @@
+import json
+import unittest
+
+from app.config import CLUSTER_MAX_ZOOM
+from app.routers.geo import get_bbox, get_nearby, get_tile
+from app.tests.helpers import DatabaseTestCase, make_pereval, unique_email
+from app.utils.functions import create_perevals
+from app.utils.tiles import cluster_worker, mercator, tile_cache
+
+# Far from the perevals of the other tests, which share the database
+POINTS = dict(center=(61.1000, 99.2000), near=(61.1200, 99.2500), far=(61.4000, 99.8000),
+              east=(-16.5000, 179.5000), west=(-16.5000, -179.5000))
+
+
+class TestGetNearby(unittest.IsolatedAsyncioTestCase):
+    #  Tests that invalid coordinates or radius return status 400
+    async def test_nearby_invalid_params(self):
+        response = await get_nearby(95, 7.1525)
+        self.assertEqual(json.loads(response.body)['status'], 400)
+        response = await get_nearby(45.3842, 7.1525, radius=0)
+        self.assertEqual(json.loads(response.body)['status'], 400)
+
+    #  Tests that invalid bounds or tile numbers return status 400
+    async def test_invalid_bbox_and_tile(self):
+        response = await get_bbox(46, 7, 45, 8)
+        self.assertEqual(json.loads(response.body)['status'], 400)
+        response = await get_tile(1, 2, 0)
+        self.assertEqual(json.loads(response.body)['status'], 400)
+
+
+class TestGetNearbyDatabase(DatabaseTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        email = unique_email()
+        ids = await create_perevals([make_pereval(email, name, latitude, longitude)
+                                     for name, (latitude, longitude) in POINTS.items()], [[]] * len(POINTS))
+        self.ids = dict(zip(POINTS, ids))
+        while await cluster_worker.process_batch():
+            pass
+        tile_cache.clear()
+
+    #  Tests that perevals around a point are returned nearest first and inside the radius
+    async def test_nearby_sorted_by_distance(self):
+        response = await get_nearby(*POINTS['center'], radius=20)
+        perevals = json.loads(response.body)['perevals']
+        distances = [pereval['distance'] for pereval in perevals]
+        self.assertEqual(distances, sorted(distances))
+        self.assertTrue(all(distance <= 20 for distance in distances))
+
+        ids = [pereval['id'] for pereval in perevals]
+        self.assertLess(ids.index(self.ids['center']), ids.index(self.ids['near']))
+        self.assertNotIn(self.ids['far'], ids)
+
+    #  Tests that only perevals inside the box are returned, including a box over the 180th meridian
+    async def test_bbox(self):
+        response = await get_bbox(61, 99, 61.2, 99.5)
+        perevals = json.loads(response.body)['perevals']
+        for pereval in perevals:
+            self.assertTrue(61 <= pereval['coords']['latitude'] <= 61.2)
+            self.assertTrue(99 <= pereval['coords']['longitude'] <= 99.5)
+        self.assertEqual({self.ids['center'], self.ids['near']} & {pereval['id'] for pereval in perevals},
+                         {self.ids['center'], self.ids['near']})
+
+        response = await get_bbox(-17, 179, -16, -179)
+        perevals = json.loads(response.body)['perevals']
+        for pereval in perevals:
+            self.assertTrue(pereval['coords']['longitude'] >= 179 or pereval['coords']['longitude'] <= -179)
+        self.assertLessEqual({self.ids['east'], self.ids['west']}, {pereval['id'] for pereval in perevals})
+
+    #  Tests that low zoom tiles return clusters and high zoom tiles return single perevals
+    async def test_tile(self):
+        response = await get_tile(0, 0, 0)
+        tile = json.loads(response.body)
+        self.assertEqual(tile['perevals'], [])
+        self.assertGreaterEqual(sum(cluster['count'] for cluster in tile['clusters']), len(POINTS))
+
+        zoom = CLUSTER_MAX_ZOOM + 3
+        x, y = mercator(*POINTS['center'], zoom)
+        response = await get_tile(zoom, int(x), int(y))
+        tile = json.loads(response.body)
+        self.assertEqual(tile['clusters'], [])
+        self.assertIn(self.ids['center'], [pereval['id'] for pereval in tile['perevals']])
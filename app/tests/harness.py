@@ -0,0 +1,186 @@
+"""
+Run the API tests against a throwaway PostgreSQL, without docker.
+
+    python -m app.tests.harness [pytest options] [test files]
+
+Starts a private server with initdb and pg_ctl in a temporary directory, on a
+free port and with fsync off. The binaries are looked up in FSTR_TEST_PG_BIN,
+PATH and the usual install locations (the postgresql and postgresql-contrib
+packages, pg_trgm is needed). With FSTR_TEST_DATABASE_URL a temporary database
+is created on that server instead. The migrations are applied with alembic,
+FSTR_DB_* and FSTR_BLOB_STORE_PATH point the app at the new database, and pytest
+runs the given test files, all of app/tests by default. The server or the
+database is removed afterwards. Tests needing the database are skipped outside
+the harness, see app/tests/helpers.py.
+
+initdb refuses to run as root: run the harness as a regular user.
+"""
+import glob
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import uuid
+from typing import List, Optional
+
+import sqlalchemy
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_TESTS = sorted(glob.glob(os.path.join(ROOT, "app", "tests", "*.py")))
+# Set while the harness runs the tests, tests needing a database are skipped without it
+HARNESS_ENV = "FSTR_TEST_HARNESS"
+BIN_DIRS = ("/usr/lib/postgresql/*/bin", "/usr/pgsql-*/bin", "/usr/local/pgsql/bin",
+            "/opt/homebrew/opt/postgresql*/bin")
+
+
+def find_bin_dir() -> Optional[str]:
+    """ Directory of initdb and pg_ctl, the newest installed version wins """
+    configured = os.environ.get("FSTR_TEST_PG_BIN")
+    if configured:
+        return configured
+    initdb = shutil.which("initdb")
+    if initdb:
+        return os.path.dirname(initdb)
+    # Debian and Ubuntu keep the server binaries out of PATH
+    found = [path for pattern in BIN_DIRS for path in glob.glob(pattern)
+             if os.path.exists(os.path.join(path, "initdb"))]
+    found.sort(key=lambda path: [int(number) for number in re.findall(r"\d+", path)])
+    return found[-1] if found else None
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class TemporaryPostgres:
+    """ A PostgreSQL server in a temporary directory, for the lifetime of a with block """
+
+    def __init__(self, bin_dir: str, user: str = "fstr", name: str = "fstr"):
+        self.bin_dir = bin_dir
+        self.user = user
+        self.name = name
+        self.port = free_port()
+        self.directory = None
+        self.started = False
+
+    def run(self, program: str, *args: str) -> None:
+        try:
+            subprocess.run([os.path.join(self.bin_dir, program), *args], check=True, capture_output=True, text=True)
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"{program} failed: {(e.stderr or e.stdout).strip()}") from None
+
+    @property
+    def data(self) -> str:
+        return os.path.join(self.directory, "data")
+
+    def __enter__(self) -> dict:
+        if hasattr(os, "geteuid") and os.geteuid() == 0:
+            raise RuntimeError("initdb does not run as root, run the harness as a regular user "
+                               "or set FSTR_TEST_DATABASE_URL")
+
+        self.directory = tempfile.mkdtemp(prefix="fstr-pg-")
+        try:
+            self.run("initdb", "-D", self.data, "-U", self.user, "-A", "trust", "-E", "UTF8", "--no-locale")
+            # Durability is not needed for a database thrown away after the run
+            options = (f"-p {self.port} -k {self.directory} -c listen_addresses=127.0.0.1 "
+                       "-c fsync=off -c synchronous_commit=off -c full_page_writes=off")
+            self.run("pg_ctl", "-D", self.data, "-l", os.path.join(self.directory, "server.log"), "-o", options,
+                     "-w", "start")
+            self.started = True
+            self.run("createdb", "-h", "127.0.0.1", "-p", str(self.port), "-U", self.user, self.name)
+        except BaseException:
+            self.__exit__(None, None, None)
+            raise
+
+        return dict(host="127.0.0.1", port=self.port, name=self.name, user=self.user, password="")
+
+    def __exit__(self, *exc_info) -> None:
+        if self.started:
+            self.run("pg_ctl", "-D", self.data, "-m", "immediate", "stop")
+            self.started = False
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class TemporaryDatabase:
+    """ A database created on the server of a URL, dropped at the end of a with block """
+
+    def __init__(self, url: str):
+        self.url = sqlalchemy.engine.make_url(url)
+        self.name = f"fstr_test_{uuid.uuid4().hex[:12]}"
+
+    def execute(self, statement: str) -> None:
+        engine = sqlalchemy.create_engine(self.url, isolation_level="AUTOCOMMIT")
+        try:
+            with engine.connect() as connection:
+                connection.execute(sqlalchemy.text(statement))
+        finally:
+            engine.dispose()
+
+    def __enter__(self) -> dict:
+        self.execute(f'CREATE DATABASE "{self.name}"')
+        return dict(host=self.url.host or "localhost", port=self.url.port or 5432, name=self.name,
+                    user=self.url.username, password=self.url.password or "")
+
+    def __exit__(self, *exc_info) -> None:
+        self.execute(f'DROP DATABASE IF EXISTS "{self.name}" WITH (FORCE)')
+
+
+def configure(settings: dict, media: str) -> None:
+    """ Point the app at the database, before anything imports app.config """
+    os.environ.update({
+        "FSTR_DB_HOST": settings["host"],
+        "FSTR_DB_PORT": str(settings["port"]),
+        "FSTR_DB_NAME": settings["name"],
+        "FSTR_DB_LOGIN": settings["user"],
+        "FSTR_DB_PASS": settings["password"],
+        "FSTR_BLOB_STORE_PATH": media,
+        HARNESS_ENV: "1",
+    })
+
+
+def migrate() -> None:
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config(os.path.join(ROOT, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(ROOT, "migrations"))
+    command.upgrade(config, "head")
+
+
+def main(argv: List[str]) -> int:
+    url = os.environ.get("FSTR_TEST_DATABASE_URL")
+    if url:
+        server = TemporaryDatabase(url)
+    else:
+        bin_dir = find_bin_dir()
+        if bin_dir is None:
+            print("PostgreSQL server not found: install postgresql and postgresql-contrib, "
+                  "or set FSTR_TEST_PG_BIN or FSTR_TEST_DATABASE_URL", file=sys.stderr)
+            return 2
+        server = TemporaryPostgres(bin_dir)
+
+    # Without test files the default suite runs, pytest options are passed through
+    if not any(os.path.exists(arg.split("::")[0]) for arg in argv):
+        argv = [*argv, *DEFAULT_TESTS]
+
+    # The app reads .env and its media path relative to the working directory
+    os.chdir(ROOT)
+    try:
+        with server as settings, tempfile.TemporaryDirectory(prefix="fstr-media-") as media:
+            configure(settings, media)
+            migrate()
+
+            import pytest
+            return pytest.main(["-p", "no:cacheprovider", *argv])
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
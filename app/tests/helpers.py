@@ -0,0 +1,46 @@
+import os
+import unittest
+import uuid
+
+from starlette.requests import Request
+
+from app.db_connection import database
+from app.models.schemas import (CoordsModel, ImagesModel, LevelModel,
+                                PerevalPostRequest, UserModel)
+from app.tests.harness import HARNESS_ENV
+
+
+def make_request(headers=None):
+    """ A bare GET request with the given headers, for calling route functions directly """
+    raw_headers = [(key.lower().encode(), value.encode()) for key, value in (headers or {}).items()]
+    return Request({'type': 'http', 'method': 'GET', 'headers': raw_headers})
+
+
+def unique_email():
+    return f'{uuid.uuid4().hex[:12]}@test.com'
+
+
+def make_pereval(email='test@test.com', title='Test Title', latitude=55.7522, longitude=37.6156, images=()):
+    return PerevalPostRequest(
+        beauty_title='Test Beauty Title',
+        title=title,
+        other_titles='Other Titles',
+        user=UserModel(email=email, name='Test', fam='User', otc='Testovich', phone='+123456789'),
+        coords=CoordsModel(latitude=latitude, longitude=longitude, height=0),
+        level=LevelModel(winter='1А', summer='1А', autumn='1А', spring='1А'),
+        images=[ImagesModel(data=data, name=name) for data, name in images],
+    )
+
+
+needs_database = unittest.skipUnless(os.environ.get(HARNESS_ENV), "needs the database of python -m app.tests.harness")
+
+
+@needs_database
+class DatabaseTestCase(unittest.IsolatedAsyncioTestCase):
+    """ Tests on the migrated database of python -m app.tests.harness, connected around every test """
+
+    async def asyncSetUp(self):
+        await database.connect()
+
+    async def asyncTearDown(self):
+        await database.disconnect()
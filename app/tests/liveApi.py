@@ -0,0 +1,148 @@
+import copy
+import json
+import os
+import time
+import unittest
+
+from starlette.testclient import TestClient
+
+from app.main import app
+from app.tests.harness import HARNESS_ENV
+from app.utils.response_cache import response_cache
+from benchmarks.load import api_ok, make_image, percentile
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "perevals.json")
+
+# p95 latency budgets of the hot endpoints in ms, FSTR_TEST_LATENCY_SCALE stretches them on slow machines
+LATENCY_BUDGETS = dict(get_by_id=10, get_by_id_uncached=25, get_by_email=10, get_by_email_uncached=25, post=75,
+                       patch=75)
+LATENCY_SCALE = float(os.environ.get("FSTR_TEST_LATENCY_SCALE", 1))
+WARMUP = 5
+SAMPLES = 100
+
+
+@unittest.skipUnless(os.environ.get(HARNESS_ENV), "needs the database of python -m app.tests.harness")
+class TestLiveApi(unittest.TestCase):
+    """ The app with its startup and the database, through an ASGI client, on the fixtures """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = TestClient(app)
+        cls.client.__enter__()
+        cls.addClassCleanup(cls.client.__exit__, None, None, None)
+
+        with open(FIXTURES) as file:
+            cls.fixtures = json.load(file)
+        response = cls.client.post("/SubmitData/batch", json=cls.fixtures)
+        assert api_ok(response), response.text
+        cls.ids = [item["id"] for item in response.json()["items"]]
+
+    def post(self, body: dict) -> int:
+        response = self.client.post("/SubmitData", json=body)
+        self.assertTrue(api_ok(response), response.text)
+        return response.json()["id"]
+
+    def measure(self, name: str, call, cached: bool = True) -> None:
+        """
+        Calls call(i) WARMUP + SAMPLES times, the p95 of the samples must stay within the budget.
+        Without cached the response cache is emptied before every call, so reads go to the database.
+        """
+        for i in range(WARMUP):
+            self.assertTrue(api_ok(call(i)))
+        latencies = []
+        for i in range(SAMPLES):
+            if not cached:
+                response_cache.local.clear()
+            start = time.perf_counter()
+            response = call(i)
+            latencies.append(time.perf_counter() - start)
+            self.assertTrue(api_ok(response), response.text)
+
+        latencies.sort()
+        p50, p95 = percentile(latencies, 50) * 1000, percentile(latencies, 95) * 1000
+        budget = LATENCY_BUDGETS[name] * LATENCY_SCALE
+        self.assertLessEqual(p95, budget, f"{name}: p95 {p95:.1f} ms over {budget:.0f} ms (p50 {p50:.1f} ms)")
+
+    #  Tests that every fixture is returned by id as it was sent
+    def test_get_by_id(self):
+        for pereval_id, fixture in zip(self.ids, self.fixtures):
+            response = self.client.get("/SubmitData", params={"pereval_id": pereval_id})
+            self.assertEqual(response.status_code, 200)
+            pereval = response.json()
+            self.assertEqual(pereval["id"], pereval_id)
+            self.assertEqual(pereval["status"], "new")
+            self.assertEqual(pereval["title"], fixture["title"])
+            self.assertEqual(pereval["user"]["email"], fixture["user"]["email"])
+            self.assertEqual(pereval["coords"], fixture["coords"])
+            self.assertEqual(pereval["level"], fixture["level"])
+
+    #  Tests that a repeated request with the returned ETag is answered with 304
+    def test_not_modified(self):
+        response = self.client.get("/SubmitData", params={"pereval_id": self.ids[0]})
+        not_modified = self.client.get("/SubmitData", params={"pereval_id": self.ids[0]},
+                                       headers={"If-None-Match": response.headers["etag"]})
+        self.assertEqual(not_modified.status_code, 304)
+
+    #  Tests that a user gets all of their perevals and nobody else's
+    def test_get_by_email(self):
+        for email in {fixture["user"]["email"] for fixture in self.fixtures}:
+            response = self.client.get("/SubmitData/<user_email>", params={"user_email": email})
+            self.assertEqual(response.status_code, 200)
+            titles = sorted(pereval["title"] for pereval in response.json()["perevals"])
+            expected = sorted(fixture["title"] for fixture in self.fixtures if fixture["user"]["email"] == email)
+            self.assertEqual(titles, expected)
+
+    #  Tests that a sent image is stored and served
+    def test_post_with_image(self):
+        body = copy.deepcopy(self.fixtures[0])
+        body["images"] = [{"data": make_image(), "name": "Седловина"}]
+        pereval = self.client.get("/SubmitData", params={"pereval_id": self.post(body)}).json()
+        self.assertEqual([image["name"] for image in pereval["images"]], ["Седловина"])
+        image = self.client.get(pereval["images"][0]["url"])
+        self.assertEqual(image.status_code, 200)
+        self.assertEqual(image.headers["content-type"], "image/jpeg")
+
+    #  Tests that a PATCH is visible to the following reads
+    def test_patch(self):
+        body = copy.deepcopy(self.fixtures[1])
+        pereval_id = self.post(body)
+        self.client.get("/SubmitData", params={"pereval_id": pereval_id})
+
+        body["title"] = "Донгуз-Орун Восточный"
+        response = self.client.patch("/SubmitData", params={"pereval_id": pereval_id}, json=body)
+        self.assertEqual(response.json(), {"state": 1, "message": "Данные обновлены."})
+        pereval = self.client.get("/SubmitData", params={"pereval_id": pereval_id}).json()
+        self.assertEqual(pereval["title"], "Донгуз-Орун Восточный")
+
+    #  Tests that reads by id stay within their latency budget, from the response cache and from the database
+    def test_latency_get_by_id(self):
+        def get(i):
+            return self.client.get("/SubmitData", params={"pereval_id": self.ids[i % len(self.ids)]})
+
+        self.measure("get_by_id", get)
+        self.measure("get_by_id_uncached", get, cached=False)
+
+    #  Tests that pages by email stay within their latency budget, from the response cache and from the database
+    def test_latency_get_by_email(self):
+        emails = sorted({fixture["user"]["email"] for fixture in self.fixtures})
+
+        def get(i):
+            return self.client.get("/SubmitData/<user_email>", params={"user_email": emails[i % len(emails)]})
+
+        self.measure("get_by_email", get)
+        self.measure("get_by_email_uncached", get, cached=False)
+
+    #  Tests that new perevals are accepted within the latency budget
+    def test_latency_post(self):
+        self.measure("post", lambda i: self.client.post("/SubmitData", json=self.fixtures[i % len(self.fixtures)]))
+
+    #  Tests that updates stay within the latency budget
+    def test_latency_patch(self):
+        body = copy.deepcopy(self.fixtures[2])
+        pereval_id = self.post(body)
+
+        def patch(i):
+            body["coords"]["height"] = 3000 + i
+            return self.client.patch("/SubmitData", params={"pereval_id": pereval_id}, json=body)
+
+        self.measure("patch", patch)
@@ -0,0 +1,110 @@
+import io
+import os
+import tempfile
+import unittest
+import uuid
+from concurrent.futures.process import BrokenProcessPool
+from unittest.mock import patch
+
+import sqlalchemy
+from PIL import Image
+
+from app.db_connection import database
+from app.models.models import image_jobs_table
+from app.tests.helpers import DatabaseTestCase
+from app.utils.blobstore import save_blob
+from app.utils.derivative_worker import DerivativeWorker, enqueue_image_jobs
+from app.utils.derivatives import VARIANTS, derivative_path, make_derivatives
+
+
+def make_jpeg(width=640, height=480):
+    buffer = io.BytesIO()
+    # A random corner keeps every image, and so its hash, unique
+    image = Image.new("RGB", (width, height), (120, 160, 200))
+    image.putpixel((0, 0), tuple(uuid.uuid4().bytes[:3]))
+    image.save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+class TestMakeDerivatives(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    #  Tests that every variant is written, scaled down to its size
+    def test_image(self):
+        sha256, _ = save_blob(make_jpeg(), self.root)
+        self.assertIsNone(make_derivatives(sha256, self.root))
+        for variant, size in VARIANTS.items():
+            with Image.open(derivative_path(sha256, variant, self.root)) as derivative:
+                self.assertEqual(derivative.format, "JPEG")
+                self.assertEqual(max(derivative.size), min(size, 640))
+
+    #  Tests that a blob which is not an image is reported, not raised, so its job is not retried
+    def test_not_an_image(self):
+        sha256, _ = save_blob(b"Image Data", self.root)
+        self.assertEqual(make_derivatives(sha256, self.root), "Not an image")
+        self.assertFalse(os.path.exists(derivative_path(sha256, "thumbnail", self.root)))
+
+    #  Tests that a decompression bomb is reported as permanent too
+    def test_decompression_bomb(self):
+        sha256, _ = save_blob(make_jpeg(), self.root)
+        with patch.object(Image, "MAX_IMAGE_PIXELS", 1000):
+            self.assertIsNotNone(make_derivatives(sha256, self.root))
+
+
+class TestDerivativeWorker(DatabaseTestCase):
+    async def job(self, sha256):
+        return await database.fetch_one(image_jobs_table.select().where(image_jobs_table.c.sha256 == sha256))
+
+    async def claim(self, worker, sha256):
+        return [job for job in await worker.claim_jobs() if job.sha256 == sha256]
+
+    #  Tests that a claimed job is leased, and claimed again with one more attempt once the lease expires
+    async def test_lease_reclaim(self):
+        sha256 = uuid.uuid4().hex * 2
+        await enqueue_image_jobs([sha256])
+        worker = DerivativeWorker(workers=0, batch_size=1000)
+
+        self.assertEqual([job.attempts for job in await self.claim(worker, sha256)], [1])
+        self.assertEqual(await self.claim(worker, sha256), [])
+
+        await database.execute(image_jobs_table.update().where(image_jobs_table.c.sha256 == sha256)
+                               .values(locked_until=sqlalchemy.func.now() - sqlalchemy.text("interval '1 second'")))
+        self.assertEqual([job.attempts for job in await self.claim(worker, sha256)], [2])
+        # There is no blob behind the job, the app's worker must not pick it up
+        await database.execute(image_jobs_table.delete().where(image_jobs_table.c.sha256 == sha256))
+
+    def break_pool(self, worker):
+        worker._pool = broken = worker.make_pool()
+        with self.assertRaises(BrokenProcessPool):
+            broken.submit(os._exit, 1).result()
+        return broken
+
+    #  Tests that a crashed worker process is replaced and its job is retried with the attempt counted
+    async def test_broken_pool(self):
+        sha256, _ = save_blob(make_jpeg())
+        await enqueue_image_jobs([sha256])
+        worker = DerivativeWorker(workers=1, batch_size=1000, max_attempts=2)
+        (job,) = await self.claim(worker, sha256)
+
+        broken = self.break_pool(worker)
+        self.addCleanup(lambda: worker._pool.shutdown(cancel_futures=True))
+        await worker.process(sha256, job.attempts)
+        self.assertIsNot(worker._pool, broken)
+        row = await self.job(sha256)
+        self.assertEqual((row.status, row.attempts, row.last_error), ('new', 1, 'Worker process died'))
+
+        await worker.process(sha256, job.attempts)
+        self.assertEqual((await self.job(sha256)).status, 'done')
+
+    #  Tests that a job which keeps killing the worker process fails after max_attempts
+    async def test_broken_pool_max_attempts(self):
+        sha256, _ = save_blob(make_jpeg())
+        await enqueue_image_jobs([sha256])
+        worker = DerivativeWorker(workers=1, batch_size=1000, max_attempts=2)
+        self.addCleanup(lambda: worker._pool.shutdown(cancel_futures=True))
+
+        for attempts, status in ((1, 'new'), (2, 'failed')):
+            self.break_pool(worker)
+            await worker.process(sha256, attempts)
+            self.assertEqual((await self.job(sha256)).status, status)
@@ -0,0 +1,31 @@
+import re
+import unittest
+from datetime import datetime
+
+from sqlalchemy.exc import InvalidRequestError
+
+from app.utils.functions import pereval_by_id, perevals_page
+
+
+class TestPreparedQuery(unittest.TestCase):
+    #  Tests that the SQL is compiled once with positional parameters
+    def test_sql(self):
+        self.assertIn("WHERE pereval_add.id = $", pereval_by_id.sql)
+        self.assertNotIn("%(", pereval_by_id.sql)
+        self.assertIn("LIMIT $", perevals_page[False].sql)
+
+    #  Tests that values are bound in the order of the SQL parameters
+    def test_args(self):
+        add_time = datetime(2026, 10, 18, 10, 0)
+        args = perevals_page[True].args(user_email='qwerty@mail.ru', limit=11, cursor_add_time=add_time, cursor_id=5)
+        params = dict(zip(perevals_page[True].names, args))
+        self.assertEqual(params['user_email'], 'qwerty@mail.ru')
+        self.assertEqual(params['limit'], 11)
+        self.assertEqual(params['cursor_add_time'], add_time)
+        self.assertEqual(params['cursor_id'], 5)
+        self.assertEqual(len(args), max(int(n) for n in re.findall(r"\$(\d+)", perevals_page[True].sql)))
+
+    #  Tests that a missing value is an error, not a NULL
+    def test_missing_param(self):
+        with self.assertRaises(InvalidRequestError):
+            pereval_by_id.args()
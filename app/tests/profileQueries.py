@@ -0,0 +1,41 @@
+import unittest
+
+import sqlalchemy
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app.models.models import pereval_add_table
+from app.utils.metrics import observe_query
+from app.utils.profiler import QueryProfilerMiddleware, statements_summary
+
+
+async def many_queries(request):
+    for pereval_id in range(int(request.query_params["n"])):
+        observe_query(0.001, pereval_add_table.select().where(pereval_add_table.c.id == pereval_id))
+    return PlainTextResponse("ok")
+
+
+client = TestClient(QueryProfilerMiddleware(Starlette(routes=[Route("/", many_queries)]), query_budget=3))
+
+
+class TestProfileQueries(unittest.TestCase):
+    #  Tests that the query count and time are returned in the Server-Timing header
+    def test_server_timing(self):
+        response = client.get("/", params={"n": 2})
+        self.assertTrue(response.headers["server-timing"].startswith('db;dur=2.0;desc="2 queries", app;dur='))
+
+    #  Tests that a request over the query budget is logged with its repeated statement
+    def test_over_budget(self):
+        with self.assertLogs("APIlogger", "WARNING") as logs:
+            client.get("/", params={"n": 5})
+        self.assertIn("5 queries", logs.output[0])
+        self.assertIn("5 x 5.0 ms: SELECT pereval_add.id", logs.output[0])
+
+    #  Tests that statements are grouped by SQL text, the most expensive first
+    def test_statements_summary(self):
+        select = sqlalchemy.select(pereval_add_table.c.id)
+        summary = statements_summary([("SELECT 1", 0.5), (select, 0.1), (select, 0.1), ("SELECT 1", 0.5)])
+        self.assertEqual(summary[0], ("SELECT 1", 2, 1.0))
+        self.assertEqual(summary[1][1:], (2, 0.2))
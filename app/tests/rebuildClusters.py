@@ -0,0 +1,88 @@
+import unittest
+from unittest.mock import patch
+
+import sqlalchemy
+
+from app.config import CLUSTER_MAX_ZOOM
+from app.db_connection import database
+from app.models.models import map_cluster_deltas_table, map_clusters_table
+from app.routers.submitdata import submit_data, update_data
+from app.tests.helpers import DatabaseTestCase, make_pereval, unique_email
+from app.utils.tiles import (backfill_clusters_sql, cluster_worker,
+                             rebuild_clusters)
+
+
+async def read_clusters():
+    rows = await database.fetch_all(map_clusters_table.select().where(map_clusters_table.c.count != 0))
+    return {(row['zoom'], row['cell_x'], row['cell_y']): (row['count'], row['sum_latitude'], row['sum_longitude'])
+            for row in rows}
+
+
+async def count_deltas():
+    return await database.fetch_val(sqlalchemy.select(sqlalchemy.func.count()).select_from(map_cluster_deltas_table))
+
+
+async def fold_clusters():
+    while await cluster_worker.process_batch():
+        pass
+
+
+class TestBackfillClustersSql(unittest.TestCase):
+    #  Tests that the backfill covers the zoom levels the cluster worker maintains
+    def test_max_zoom(self):
+        self.assertIn(f'generate_series(0, {CLUSTER_MAX_ZOOM})', backfill_clusters_sql())
+        self.assertIn('generate_series(0, 3)', backfill_clusters_sql(3))
+
+
+class TestRebuildClustersDatabase(DatabaseTestCase):
+    def assertClustersEqual(self, first, second):
+        self.assertEqual(first.keys(), second.keys())
+        for key, (count, sum_latitude, sum_longitude) in first.items():
+            self.assertEqual(count, second[key][0])
+            self.assertAlmostEqual(sum_latitude, second[key][1], places=6)
+            self.assertAlmostEqual(sum_longitude, second[key][2], places=6)
+
+    #  Tests that a write only records deltas and leaves map_clusters to the worker
+    async def test_write_records_deltas(self):
+        await fold_clusters()
+        before = await read_clusters()
+        await submit_data(make_pereval(unique_email(), latitude=43.2661, longitude=42.4786))
+
+        self.assertEqual(await read_clusters(), before)
+        self.assertEqual(await count_deltas(), 1)
+        await fold_clusters()
+        self.assertEqual(await count_deltas(), 0)
+        self.assertNotEqual(await read_clusters(), before)
+
+    #  Tests that a rebuild gives the same clusters as the folded deltas of submits and moves
+    async def test_rebuild_matches_updates(self):
+        email = unique_email()
+        ids = []
+        for latitude, longitude in ((43.2661, 42.4786), (43.2701, 42.4812), (-33.4489, -70.6693)):
+            ids.append((await submit_data(make_pereval(email, latitude=latitude, longitude=longitude))).id)
+        moved = make_pereval(email, latitude=-33.4501, longitude=-70.6702)
+        self.assertEqual((await update_data(ids[2], moved)).state, 1)
+
+        await fold_clusters()
+        updated = await read_clusters()
+        await rebuild_clusters()
+        rebuilt = await read_clusters()
+
+        self.assertClustersEqual(rebuilt, updated)
+        self.assertEqual(max(zoom for zoom, _, _ in rebuilt), CLUSTER_MAX_ZOOM)
+        self.assertTrue(all(count > 0 for count, _, _ in rebuilt.values()))
+
+    #  Tests that passes snapped to a stored coords row are clustered at that row, as the backfill counts them
+    async def test_tolerance_uses_stored_coords(self):
+        email = unique_email()
+        with patch('app.utils.functions.COORDS_TOLERANCE', 0.001):
+            first = await submit_data(make_pereval(email, latitude=27.98810, longitude=86.92500))
+            second = await submit_data(make_pereval(email, latitude=27.98860, longitude=86.92550))
+            moved = make_pereval(email, latitude=27.98790, longitude=86.92480)
+            self.assertEqual((await update_data(second.id, moved)).state, 1)
+            await update_data(first.id, make_pereval(email, latitude=-13.16310, longitude=-72.54500))
+
+        await fold_clusters()
+        updated = await read_clusters()
+        await rebuild_clusters()
+        self.assertClustersEqual(await read_clusters(), updated)
@@ -0,0 +1,60 @@
+import json
+import logging
+import unittest
+
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app.logger import (SAMPLED, JsonFormatter, LogQueueHandler,
+                        RequestIdFilter, RequestIdMiddleware, SamplingFilter,
+                        request_id)
+
+
+async def echo_request_id(request):
+    return PlainTextResponse(request_id.get())
+
+
+client = TestClient(RequestIdMiddleware(Starlette(routes=[Route("/", echo_request_id)])))
+
+
+def make_record(msg, *args, **extra) -> logging.LogRecord:
+    record = logging.LogRecord("APIlogger", logging.INFO, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+class TestRequestLogging(unittest.TestCase):
+    #  Tests that a valid X-Request-ID is kept for the request and returned
+    def test_request_id_header(self):
+        response = client.get("/", headers={"X-Request-ID": "abc-123"})
+        self.assertEqual(response.text, "abc-123")
+        self.assertEqual(response.headers["x-request-id"], "abc-123")
+
+    #  Tests that a missing or malformed X-Request-ID is replaced with a new one
+    def test_request_id_generated(self):
+        response = client.get("/", headers={"X-Request-ID": "bad id\n"})
+        self.assertEqual(len(response.text), 32)
+        self.assertEqual(response.headers["x-request-id"], response.text)
+        self.assertEqual(request_id.get(), "-")
+
+    #  Tests that records are stamped with the request id and written as one JSON object
+    def test_json_record(self):
+        token = request_id.set("abc-123")
+        try:
+            record = make_record("Pereval ID: %s", 5)
+            RequestIdFilter().filter(record)
+        finally:
+            request_id.reset(token)
+        line = json.loads(JsonFormatter().format(LogQueueHandler(None).prepare(record)))
+        self.assertEqual(line["message"], "Pereval ID: 5")
+        self.assertEqual(line["request_id"], "abc-123")
+        self.assertEqual(line["level"], "INFO")
+
+    #  Tests that only sampled records are dropped
+    def test_sampling(self):
+        sampling = SamplingFilter(0)
+        self.assertFalse(sampling.filter(make_record("Found: %s", 1, **SAMPLED)))
+        self.assertTrue(sampling.filter(make_record("Found: %s", 1)))
+        self.assertTrue(SamplingFilter(1).filter(make_record("Found: %s", 1, **SAMPLED)))
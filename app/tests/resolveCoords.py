@@ -0,0 +1,76 @@
+import random
+import unittest
+from unittest.mock import patch
+
+from app.db_connection import database
+from app.models.models import coords_table
+from app.models.schemas import CoordsModel
+from app.tests.helpers import DatabaseTestCase
+from app.utils.functions import coords_key, coords_match, resolve_coords
+
+
+def random_point(height=1000):
+    """ A point nobody else uses, 4 decimals like the app's clients send """
+    return CoordsModel(latitude=round(random.uniform(-60, 60), 4), longitude=round(random.uniform(-170, 170), 4),
+                       height=height)
+
+
+class TestCoordsMatch(unittest.TestCase):
+    #  Tests that only the same height within the tolerance on both axes matches
+    def test_tolerance(self):
+        row = dict(latitude=45.0, longitude=7.0, height=1200)
+        with patch('app.utils.functions.COORDS_TOLERANCE', 0.001):
+            self.assertTrue(coords_match(row, CoordsModel(latitude=45.0005, longitude=6.9995, height=1200)))
+            self.assertFalse(coords_match(row, CoordsModel(latitude=45.002, longitude=7.0, height=1200)))
+            self.assertFalse(coords_match(row, CoordsModel(latitude=45.0, longitude=7.002, height=1200)))
+            self.assertFalse(coords_match(row, CoordsModel(latitude=45.0, longitude=7.0, height=1201)))
+
+    #  Tests that without a tolerance only the exact point matches
+    def test_exact(self):
+        row = dict(latitude=45.0, longitude=7.0, height=1200)
+        with patch('app.utils.functions.COORDS_TOLERANCE', 0):
+            self.assertTrue(coords_match(row, CoordsModel(latitude=45.0, longitude=7.0, height=1200)))
+            self.assertFalse(coords_match(row, CoordsModel(latitude=45.0001, longitude=7.0, height=1200)))
+
+    def test_coords_key(self):
+        self.assertEqual(coords_key(CoordsModel(latitude=45, longitude=7.5, height=1200)), (45.0, 7.5, 1200))
+
+
+class TestResolveCoords(DatabaseTestCase):
+    #  Tests that the same point reuses its row, in request order, and another height gets a new one
+    async def test_exact_match(self):
+        point = random_point()
+        other_height = point.copy(update=dict(height=2000))
+        first = await resolve_coords([point])
+        ids = await resolve_coords([other_height, point, point])
+        self.assertEqual(ids[1:], first * 2)
+        self.assertNotEqual(ids[0], first[0])
+
+    #  Tests that a point within the tolerance reuses the nearest row
+    async def test_tolerance_nearest(self):
+        point = random_point()
+        far, near = await resolve_coords([point.copy(update=dict(latitude=point.latitude + 0.0008)),
+                                          point.copy(update=dict(latitude=point.latitude - 0.0002))])
+        with patch('app.utils.functions.COORDS_TOLERANCE', 0.001):
+            self.assertEqual(await resolve_coords([point]), [near])
+            (outside,) = await resolve_coords([point.copy(update=dict(latitude=point.latitude + 0.003))])
+            self.assertNotIn(outside, (far, near))
+
+    #  Tests that a row inserted by another request after the lookup is found again instead of failing
+    async def test_insert_race(self):
+        point = random_point()
+        row_id = await database.execute(coords_table.insert().values(
+            latitude=point.latitude, longitude=point.longitude, height=point.height))
+
+        fetch_all = database.fetch_all
+        calls = []
+
+        async def lookup_misses(query):
+            calls.append(query)
+            # The first query is the lookup, as if it ran before the other request committed
+            return [] if len(calls) == 1 else await fetch_all(query)
+
+        with patch('app.utils.functions.database.fetch_all', lookup_misses):
+            self.assertEqual(await resolve_coords([point]), [row_id])
+        # Lookup, INSERT ... ON CONFLICT DO NOTHING and the select of the conflicting row
+        self.assertEqual(len(calls), 3)
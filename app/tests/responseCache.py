@@ -0,0 +1,89 @@
+import json
+import unittest
+
+from app.routers.submitdata import get_data, submit_data, submit_data_batch
+from app.tests.helpers import (DatabaseTestCase, make_pereval, make_request,
+                               unique_email)
+from app.utils.cache import LRUCache
+from app.utils.response_cache import (CacheBackend, CachedResponse,
+                                      ResponseCache)
+
+
+class TestResponseCache(unittest.IsolatedAsyncioTestCase):
+    #  Tests that hits, misses and evictions are counted
+    def test_lru_counters(self):
+        cache = LRUCache(1, 60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), 2)
+        self.assertEqual(cache.stats(), dict(size=1, maxsize=1, hits=1, misses=1, evictions=1))
+
+    #  Tests that invalidated entries are dropped and a value read before the invalidation is not stored
+    async def test_invalidate(self):
+        cache = ResponseCache(10, 60)
+        entry = CachedResponse(b'{}', '"1-1"', 'Sun, 18 Oct 2026 10:00:00 GMT')
+        await cache.set('pereval:1', entry, cache.version())
+        self.assertEqual(await cache.get('pereval:1'), entry)
+
+        version = cache.version()
+        await cache.invalidate('pereval:1')
+        self.assertIsNone(await cache.get('pereval:1'))
+        await cache.set('pereval:1', entry._replace(content=b'{"stale": true}'), version)
+        self.assertIsNone(await cache.get('pereval:1'))
+
+    #  Tests that a backend missing a method fails when it is created, a complete one stores entries
+    async def test_backend(self):
+        class DictBackend(CacheBackend):
+            def __init__(self):
+                self.values = {}
+
+            async def get(self, key):
+                return self.values.get(key)
+
+            async def set(self, key, value, ttl):
+                self.values[key] = value
+
+            async def delete(self, *keys):
+                for key in keys:
+                    self.values.pop(key, None)
+
+        class IncompleteBackend(CacheBackend):
+            async def get(self, key):
+                return None
+
+        with self.assertRaises(TypeError):
+            IncompleteBackend()
+
+        cache = ResponseCache(10, 60, DictBackend())
+        entry = CachedResponse(b'{}', '"1-1"', 'Sun, 18 Oct 2026 10:00:00 GMT')
+        await cache.set('pereval:1', entry, cache.version())
+        self.assertEqual(await cache.get('pereval:1'), entry)
+        await cache.invalidate('pereval:1')
+        self.assertIsNone(await cache.get('pereval:1'))
+
+    #  Tests that an entry survives the round trip through a shared backend
+    def test_dump_load(self):
+        entry = CachedResponse(b'{"a":\n1}', '"2-5"', 'Sun, 18 Oct 2026 10:00:00 GMT')
+        self.assertEqual(CachedResponse.load(entry.dump()), entry)
+
+
+class TestResponseCacheDatabase(DatabaseTestCase):
+    async def get_phone(self, pereval_id):
+        response = await get_data(pereval_id, make_request())
+        return json.loads(response.body)['user']['phone']
+
+    #  Tests that cached perevals of a user show the new phone after the user is changed by another pereval
+    async def test_user_change_invalidates_perevals(self):
+        email = unique_email()
+        first = (await submit_data(make_pereval(email))).id
+        self.assertEqual(await self.get_phone(first), '+123456789')
+
+        changed = make_pereval(email)
+        changed.user.phone = '+7 900 000 00 01'
+        await submit_data(changed)
+        self.assertEqual(await self.get_phone(first), '+7 900 000 00 01')
+
+        changed.user.phone = '+7 900 000 00 02'
+        await submit_data_batch([changed])
+        self.assertEqual(await self.get_phone(first), '+7 900 000 00 02')
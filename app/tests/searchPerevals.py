@@ -0,0 +1,49 @@
+import json
+import unittest
+import uuid
+
+from app.routers.search import search_perevals
+from app.tests.helpers import DatabaseTestCase, make_pereval, unique_email
+from app.utils.functions import create_perevals
+from app.utils.search import transliterate
+
+
+class TestSearchPerevals(unittest.IsolatedAsyncioTestCase):
+    #  Tests that cyrillic and latin spellings give the same search text
+    def test_transliterate(self):
+        self.assertEqual(transliterate('Пхия'), 'pkhiya')
+        self.assertEqual(transliterate('Pkhiya'), 'pkhiya')
+        self.assertEqual(transliterate('«Ёлка» (1А)'), 'elka 1a')
+
+    #  Tests that an empty query returns status 400
+    async def test_search_empty(self):
+        response = await search_perevals(' !? ')
+        self.assertEqual(json.loads(response.body)['status'], 400)
+
+
+class TestSearchPerevalsDatabase(DatabaseTestCase):
+    async def search(self, q):
+        return json.loads((await search_perevals(q)).body)['perevals']
+
+    #  Tests that latin and cyrillic queries find the same perevals, best match first
+    async def test_search_transliterated(self):
+        email = unique_email()
+        ids = await create_perevals([make_pereval(email, 'Пхия'), make_pereval(email, 'Пхия Южный'),
+                                     make_pereval(email, 'Донгуз-Орун')], [[], [], []])
+
+        latin = await self.search('Pkhiya')
+        cyrillic = await self.search('Пхия')
+        self.assertEqual([pereval['id'] for pereval in latin], [pereval['id'] for pereval in cyrillic])
+        self.assertLessEqual(set(ids[:2]), {pereval['id'] for pereval in latin})
+        self.assertNotIn(ids[2], [pereval['id'] for pereval in latin])
+        ranks = [pereval['rank'] for pereval in latin]
+        self.assertEqual(ranks, sorted(ranks, reverse=True))
+
+    #  Tests that a word prefix and a query with a typo find the pereval
+    async def test_search_prefix_and_typo(self):
+        word = f'zqx{uuid.uuid4().hex[:8]}'
+        (pereval_id,) = await create_perevals([make_pereval(unique_email(), f'Перевал {word}')], [[]])
+
+        self.assertIn(pereval_id, [pereval['id'] for pereval in await self.search(word[:7])])
+        typo = word[:5] + word[6:]
+        self.assertIn(pereval_id, [pereval['id'] for pereval in await self.search(typo)])
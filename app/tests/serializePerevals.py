@@ -0,0 +1,32 @@
+import json
+import unittest
+from datetime import datetime
+
+from app.models.schemas import PerevalGetResponse, PerevalShortResponse
+from app.utils.functions import pereval_dict, pereval_short_dict
+from app.utils.responses import dumps
+
+ROW = {
+    'id': 1, 'status': 'new', 'beauty_title': 'пер. ', 'title': 'Пхия', 'other_titles': 'Триев', 'connect': None,
+    'add_time': datetime(2023, 7, 30, 12, 0, 0, 123000),
+    'user': {'email': 'qwerty@mail.ru', 'fam': 'Пупкин', 'name': 'Василий', 'otc': 'Иванович', 'phone': None},
+    'coords': {'latitude': 45, 'longitude': 7.15447, 'height': 1200},
+    'level': {'winter': '', 'summer': '1А', 'autumn': '1А', 'spring': ''},
+    'images': [{'name': 'Седловина', 'url': '/SubmitData/images/ab', 'size': 10,
+                'thumbnail_url': '/SubmitData/images/ab/thumbnail', 'preview_url': '/SubmitData/images/ab/preview'}],
+}
+
+
+class TestSerializePerevals(unittest.TestCase):
+    #  Tests that a pereval serialized from the row carries the same JSON as the response model
+    def test_pereval_dict(self):
+        self.assertEqual(json.loads(dumps(pereval_dict(ROW))), json.loads(PerevalGetResponse(**ROW).json()))
+
+    #  Tests that key order follows the model, so the bodies differ only in whitespace
+    def test_key_order(self):
+        self.assertEqual(list(json.loads(dumps(pereval_dict(ROW)))), list(PerevalGetResponse.__fields__))
+
+    #  Tests that a short pereval without distance and rank columns serializes like the model
+    def test_pereval_short_dict(self):
+        row = {key: ROW[key] for key in ('id', 'status', 'beauty_title', 'title', 'coords')}
+        self.assertEqual(json.loads(dumps(pereval_short_dict(row))), json.loads(PerevalShortResponse(**row).json()))
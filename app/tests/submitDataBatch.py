@@ -0,0 +1,56 @@
+import base64
+import json
+import unittest
+import uuid
+
+from app.config import BATCH_MAX_SIZE
+from app.models.schemas import PerevalBatchResponse
+from app.routers.submitdata import get_data, submit_data_batch
+from app.tests.helpers import (DatabaseTestCase, make_pereval, make_request,
+                               unique_email)
+
+
+def make_image_data():
+    """ base64 of bytes with a JPEG signature, unique so every photo gets its own blob """
+    return base64.b64encode(b'\xff\xd8\xff\xe0' + uuid.uuid4().bytes).decode()
+
+
+class TestSubmitDataBatch(unittest.IsolatedAsyncioTestCase):
+    #  Tests that an empty batch is accepted
+    async def test_empty_batch(self):
+        response = await submit_data_batch([])
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.items, [])
+
+    #  Tests that a batch larger than the limit is rejected without saving anything
+    async def test_batch_too_large(self):
+        response = await submit_data_batch([make_pereval()] * (BATCH_MAX_SIZE + 1))
+        self.assertEqual(response.status, 413)
+        self.assertEqual(response.items, [])
+
+
+class TestSubmitDataBatchDatabase(DatabaseTestCase):
+    #  Tests that every pereval of a batch is saved and reported in request order
+    async def test_valid_batch(self):
+        email = unique_email()
+        request = [make_pereval(email, title='First'), make_pereval(email, title='Second'),
+                   make_pereval(unique_email(), title='Third')]
+
+        response = await submit_data_batch(request)
+        self.assertIsInstance(response, PerevalBatchResponse)
+        self.assertEqual(response.status, 200)
+        self.assertEqual(len(response.items), 3)
+        self.assertTrue(all(item.status == 200 and item.id is not None for item in response.items))
+
+    #  Tests that each returned id is the pereval of the request at its position, with that request's photos
+    async def test_ids_match_requests(self):
+        request = [make_pereval(unique_email(), title=f'Pereval {i}', latitude=40 + i / 10,
+                                images=[(make_image_data(), f'photo {i}.jpg')]) for i in range(20)]
+
+        response = await submit_data_batch(request)
+        self.assertEqual(response.status, 200)
+        for i, item in enumerate(response.items):
+            pereval = json.loads((await get_data(item.id, make_request())).body)
+            self.assertEqual(pereval['title'], f'Pereval {i}')
+            self.assertEqual(pereval['user']['email'], request[i].user.email)
+            self.assertEqual([image['name'] for image in pereval['images']], [f'photo {i}.jpg'])
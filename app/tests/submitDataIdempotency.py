@@ -0,0 +1,80 @@
+import json
+import unittest
+import uuid
+from unittest import mock
+
+import sqlalchemy
+
+from app.db_connection import database
+from app.models.models import pereval_add_table, users_table
+from app.models.schemas import PerevalResponse
+from app.routers import submitdata
+from app.routers.submitdata import submit_data, submit_data_batch
+from app.tests.helpers import DatabaseTestCase, make_pereval, unique_email
+from app.utils.idempotency import IdempotencyStore, fingerprint, idempotency_store
+
+
+class TestSubmitDataIdempotency(unittest.TestCase):
+    #  Tests that a remembered result is replayed for the same request and rejected for another one
+    def test_replay_from_memory(self):
+        store = IdempotencyStore(ttl=60, cache_size=10)
+        email = unique_email()
+        request_fingerprint = fingerprint(make_pereval(email).json(sort_keys=True))
+        self.assertIsNone(store.replay('key', request_fingerprint))
+
+        store.remember('key', request_fingerprint, b'{"status": 200, "message": "ok", "id": 1}')
+        replay = store.replay('key', request_fingerprint)
+        self.assertEqual(replay.status_code, 200)
+        self.assertEqual(replay.headers['idempotent-replayed'], 'true')
+
+        other = store.replay('key', fingerprint(make_pereval(email, 'Other').json(sort_keys=True)))
+        self.assertEqual(other.status_code, 422)
+
+
+class TestSubmitDataIdempotencyDatabase(DatabaseTestCase):
+    async def count_perevals(self, email):
+        query = (
+            sqlalchemy.select(sqlalchemy.func.count())
+            .select_from(pereval_add_table.join(users_table))
+            .where(users_table.c.email == email)
+        )
+        return await database.fetch_val(query)
+
+    #  Tests that a retried submission returns the first pereval id instead of creating another one
+    async def test_retry_returns_same_pereval(self):
+        key, email = str(uuid.uuid4()), unique_email()
+        first = await submit_data(make_pereval(email), idempotency_key=key)
+        self.assertIsInstance(first, PerevalResponse)
+        self.assertEqual(first.status, 200)
+
+        # Once from memory and once from the database, as a retry reaching another process would be
+        for clear in (False, True):
+            if clear:
+                idempotency_store.cache.clear()
+            retry = await submit_data(make_pereval(email), idempotency_key=key)
+            self.assertEqual(retry.headers['idempotent-replayed'], 'true')
+            self.assertEqual(PerevalResponse.parse_raw(retry.body).id, first.id)
+        self.assertEqual(await self.count_perevals(email), 1)
+
+    #  Tests that a retry of a partly failed batch replays its result and does not save the accepted items again
+    async def test_partly_failed_batch_retry(self):
+        key, email = str(uuid.uuid4()), unique_email()
+        request = [make_pereval(email, 'First'), make_pereval(email, 'Second')]
+        store_images = submitdata.store_images
+        calls = []
+
+        async def failing_second(images):
+            calls.append(images)
+            if len(calls) == 2:
+                raise OSError('disk full')
+            return await store_images(images)
+
+        with mock.patch.object(submitdata, 'store_images', failing_second):
+            first = await submit_data_batch(request, idempotency_key=key)
+        self.assertEqual([item.status for item in first.items], [200, 500])
+
+        idempotency_store.cache.clear()
+        retry = await submit_data_batch(request, idempotency_key=key)
+        self.assertEqual(retry.headers['idempotent-replayed'], 'true')
+        self.assertEqual(json.loads(retry.body), json.loads(first.json()))
+        self.assertEqual(await self.count_perevals(email), 1)
@@ -0,0 +1,84 @@
+import json
+import unittest
+import uuid
+from unittest import mock
+
+import sqlalchemy
+
+from app.db_connection import database
+from app.models.models import ingest_queue_table
+from app.models.schemas import IngestStatusResponse, IngestTicketResponse
+from app.routers import submitdata
+from app.routers.submitdata import get_queued_status, submit_data_queued
+from app.tests.helpers import DatabaseTestCase, make_pereval, unique_email
+from app.utils import ingest_worker as ingest_worker_module
+from app.utils.ingest_worker import IngestWorker, ingest_worker
+
+
+class TestSubmitDataQueued(unittest.IsolatedAsyncioTestCase):
+    #  Tests that an unknown or malformed ticket returns 404
+    async def test_unknown_ticket(self):
+        response = await get_queued_status('not-a-ticket')
+        self.assertEqual(response.status_code, 404)
+
+    #  Tests that errors are reported in the body with HTTP 200, like the other submit paths
+    async def test_errors_in_body(self):
+        with mock.patch.object(submitdata, 'store_images', side_effect=OSError('disk full')):
+            response = await submit_data_queued(make_pereval(unique_email()))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.body)['status'], 500)
+
+        with mock.patch.object(submitdata, 'enqueue_pereval', side_effect=RuntimeError('no database')):
+            response = await submit_data_queued(make_pereval(unique_email()))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.body)['status'], 500)
+
+
+class TestSubmitDataQueuedDatabase(DatabaseTestCase):
+    async def queue_row(self, ticket):
+        return await database.fetch_one(ingest_queue_table.select().where(ingest_queue_table.c.ticket == ticket))
+
+    #  Tests that a queued pereval gets a ticket which resolves to the written pereval id
+    async def test_queued_pereval_is_written(self):
+        response = await submit_data_queued(make_pereval(unique_email()))
+        self.assertIsInstance(response, IngestTicketResponse)
+        self.assertEqual(response.status, 202)
+
+        status = await get_queued_status(response.ticket)
+        self.assertIsInstance(status, IngestStatusResponse)
+        self.assertEqual(status.state, 'pending')
+
+        await ingest_worker.process_batch()
+        status = await get_queued_status(response.ticket)
+        self.assertEqual(status.state, 'done')
+        self.assertIsNotNone(status.id)
+
+    #  Tests that an error after the commit neither fails the batch nor writes it again one by one
+    async def test_error_after_commit(self):
+        response = await submit_data_queued(make_pereval(unique_email()))
+        with mock.patch.object(ingest_worker_module, 'invalidate_perevals', side_effect=RuntimeError('cache down')):
+            self.assertGreaterEqual(await ingest_worker.process_batch(), 1)
+
+        row = await self.queue_row(response.ticket)
+        self.assertEqual(row['status'], 'done')
+        self.assertEqual(row['attempts'], 0)
+        self.assertIsNone(row['last_error'])
+
+    #  Tests that only written and failed rows older than the retention are deleted
+    async def test_cleanup(self):
+        old = sqlalchemy.func.now() - sqlalchemy.literal_column("interval '2 hours'")
+        tickets = {}
+        for status, created_at in (('done', old), ('failed', old), ('new', old), ('done', None)):
+            ticket = str(uuid.uuid4())
+            values = dict(ticket=ticket, payload='{}', images='[]', status=status)
+            if created_at is not None:
+                values.update(created_at=created_at)
+            await database.execute(ingest_queue_table.insert().values(**values))
+            tickets[ticket] = (status, created_at)
+
+        await IngestWorker(retention=3600).cleanup()
+        kept = {ticket for ticket in tickets if await self.queue_row(ticket) is not None}
+        self.assertEqual(kept, {ticket for ticket, (status, created_at) in tickets.items()
+                                if status == 'new' or created_at is None})
+
+        await database.execute(ingest_queue_table.delete().where(ingest_queue_table.c.ticket.in_(kept)))
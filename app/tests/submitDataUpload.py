@@ -0,0 +1,124 @@
+import hashlib
+import unittest
+import uuid
+from unittest.mock import patch
+
+from pydantic import ValidationError
+from starlette.testclient import TestClient
+
+from app.main import app
+from app.tests.helpers import make_pereval, needs_database, unique_email
+from app.utils.blobstore import blob_path
+from app.utils.multipart import PerevalUploadParser, UploadError
+
+BOUNDARY = 'fstr-test-boundary'
+CONTENT_TYPE = f'multipart/form-data; boundary={BOUNDARY}'
+
+
+def metadata(email='test@test.com'):
+    return make_pereval(email).json(exclude={'images'})
+
+
+def make_body(parts):
+    """ multipart/form-data body of (name, filename or None, bytes) parts """
+    body = b''
+    for name, filename, data in parts:
+        disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else '')
+        body += f'--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n\r\n'.encode() + data + b'\r\n'
+    return body + f'--{BOUNDARY}--\r\n'.encode()
+
+
+def parse(body, chunk_size=7):
+    parser = PerevalUploadParser.from_content_type(CONTENT_TYPE)
+    for start in range(0, len(body), chunk_size):
+        parser.write(body[start:start + chunk_size])
+    return parser, parser.finish()
+
+
+def photo():
+    return b'\xff\xd8\xff\xe0' + uuid.uuid4().bytes * 8
+
+
+class TestPerevalUploadParser(unittest.TestCase):
+    #  Tests that the metadata is validated and every photo is stored under its hash, whatever the chunking
+    def test_valid_upload(self):
+        first, second = photo(), photo()
+        parser, request = parse(make_body([('metadata', None, metadata().encode()),
+                                           ('file', 'first.jpg', first), ('file', 'second.jpg', second)]))
+        self.assertEqual(request.title, 'Test Title')
+        self.assertEqual([image.name for image in parser.images], ['first.jpg', 'second.jpg'])
+        self.assertEqual(parser.images[0].sha256, hashlib.sha256(first).hexdigest())
+        self.assertEqual(parser.images[1].size, len(second))
+        self.assertEqual(blob_path(parser.images[0].sha256).read_bytes(), first)
+
+    #  Tests that a photo over the size limit is rejected with 413
+    def test_oversize_image(self):
+        with patch('app.utils.multipart.MAX_IMAGE_SIZE', 10):
+            with self.assertRaises(UploadError) as error:
+                parse(make_body([('metadata', None, metadata().encode()), ('file', 'big.jpg', photo())]))
+        self.assertEqual(error.exception.status, 413)
+
+    #  Tests that metadata over the size limit is rejected with 413
+    def test_oversize_metadata(self):
+        with patch('app.utils.multipart.MAX_METADATA_SIZE', 10):
+            with self.assertRaises(UploadError) as error:
+                parse(make_body([('metadata', None, metadata().encode())]))
+        self.assertEqual(error.exception.status, 413)
+
+    #  Tests that an upload without the metadata part is rejected with 400
+    def test_missing_metadata(self):
+        with self.assertRaises(UploadError) as error:
+            parse(make_body([('file', 'photo.jpg', photo())]))
+        self.assertEqual(error.exception.status, 400)
+
+    #  Tests that malformed or invalid metadata raises ValidationError
+    def test_bad_metadata(self):
+        with self.assertRaises(ValidationError):
+            parse(make_body([('metadata', None, b'{"title": ')]))
+        with self.assertRaises(ValidationError):
+            parse(make_body([('metadata', None, b'{"title": "No user"}')]))
+
+    #  Tests that a request that is not multipart/form-data is rejected with 415
+    def test_wrong_content_type(self):
+        with self.assertRaises(UploadError) as error:
+            PerevalUploadParser.from_content_type('application/json')
+        self.assertEqual(error.exception.status, 415)
+
+
+class TestSubmitDataUpload(unittest.TestCase):
+    def post(self, body, content_type=CONTENT_TYPE):
+        return TestClient(app).post('/SubmitData/upload', content=body, headers={'content-type': content_type})
+
+    #  Tests that rejected uploads are answered with their status, before the database is used
+    def test_rejected(self):
+        response = self.post(b'{}', 'application/json')
+        self.assertEqual(response.status_code, 415)
+
+        response = self.post(make_body([('file', 'photo.jpg', photo())]))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'status': 400, 'message': 'Отсутствует часть metadata'})
+
+        response = self.post(make_body([('metadata', None, b'not json')]))
+        self.assertEqual(response.status_code, 422)
+
+        response = self.post(make_body([('metadata', None, metadata().encode()), ('avatar', None, b'x')]))
+        self.assertEqual(response.status_code, 400)
+
+
+@needs_database
+class TestSubmitDataUploadDatabase(unittest.TestCase):
+    #  Tests that an uploaded pass is saved with its photos and served back
+    def test_upload(self):
+        image = photo()
+        email = unique_email()
+        with TestClient(app) as client:
+            response = client.post('/SubmitData/upload', headers={'content-type': CONTENT_TYPE},
+                                   content=make_body([('metadata', None, metadata(email).encode()),
+                                                      ('file', 'photo.jpg', image)]))
+            self.assertEqual(response.json()['status'], 200)
+
+            pereval = client.get('/SubmitData', params={'pereval_id': response.json()['id']}).json()
+            self.assertEqual(pereval['user']['email'], email)
+            self.assertEqual([image['name'] for image in pereval['images']], ['photo.jpg'])
+            self.assertEqual(client.get(pereval['images'][0]['url']).content, image)
+
@@ -1,9 +1,16 @@
+import base64
+import hashlib
 import unittest
+import uuid
 from unittest.mock import AsyncMock, patch
 import pytest
+from app.db_connection import database
 from app.models.schemas import (CoordsModel, ImagesModel, LevelModel,
                                 PatchResponse, PerevalPostRequest, UserModel)
 from app.routers.submitdata import update_data
+from app.tests.helpers import DatabaseTestCase, make_pereval, unique_email
+from app.utils.blobstore import blob_path
+from app.utils.functions import create_perevals
 
 
 class TestUpdateData(unittest.TestCase):
@@ -172,3 +179,16 @@ class TestUpdateData(unittest.TestCase):
             response = await update_data(pereval_id, request)
             assert response.state == 0
             assert response.message == 'Error update pereval'
+
+
+class TestUpdateDataDatabase(DatabaseTestCase):
+    #  Tests that the photos of a rejected update are not written to the blob store
+    async def test_rejected_update_stores_nothing(self):
+        async with database.transaction():
+            (pereval_id,) = await create_perevals([make_pereval(unique_email())], [[]])
+
+        image = b'\xff\xd8\xff\xe0' + uuid.uuid4().bytes
+        request = make_pereval(unique_email(), images=[(base64.b64encode(image).decode(), 'photo.jpg')])
+        self.assertEqual((await update_data(pereval_id, request)).state, 0)
+        self.assertEqual((await update_data(10 ** 9, request)).state, 0)
+        self.assertFalse(blob_path(hashlib.sha256(image).hexdigest()).exists())
@@ -0,0 +1,76 @@
+from unittest.mock import patch
+
+import sqlalchemy
+
+from app.db_connection import database
+from app.models.models import users_table
+from app.models.schemas import UserModel
+from app.tests.helpers import DatabaseTestCase, unique_email
+from app.utils.functions import upsert_users, users_cache
+
+
+def make_user(email, phone='+7 900 000 00 01'):
+    return UserModel(email=email, fam='Иванов', name='Пётр', otc='Сергеевич', phone=phone)
+
+
+class TestUpsertUsers(DatabaseTestCase):
+    async def row(self, email):
+        # xmin changes whenever the row is written
+        query = sqlalchemy.select(users_table, sqlalchemy.literal_column('xmin::text').label('xmin')) \
+            .where(users_table.c.email == email)
+        return await database.fetch_one(query)
+
+    #  Tests that a new user is inserted and its id returned, but not cached as the insert may still roll back
+    async def test_insert(self):
+        email = unique_email()
+        ids = await upsert_users([make_user(email)])
+        row = await self.row(email)
+        self.assertEqual(ids, {email: row['id']})
+        self.assertEqual((row['last_name'], row['phone']), ('Иванов', '+7 900 000 00 01'))
+        self.assertIsNone(users_cache.get(email))
+
+    #  Tests that an unchanged user is not rewritten, is found by the follow-up select and then cached
+    async def test_unchanged(self):
+        email = unique_email()
+        (user_id,) = (await upsert_users([make_user(email)])).values()
+        before = await self.row(email)
+
+        self.assertEqual(await upsert_users([make_user(email)]), {email: user_id})
+        self.assertEqual((await self.row(email))['xmin'], before['xmin'])
+        self.assertEqual(users_cache.get(email)[0], user_id)
+
+    #  Tests that a cached user with the same values is answered without a query
+    async def test_cache_hit(self):
+        email = unique_email()
+        (user_id,) = (await upsert_users([make_user(email)])).values()
+        await upsert_users([make_user(email)])
+
+        with patch('app.utils.functions.database.fetch_all') as fetch_all:
+            self.assertEqual(await upsert_users([make_user(email)]), {email: user_id})
+        fetch_all.assert_not_called()
+
+    #  Tests that changed values miss the cache and update the row in place
+    async def test_changed(self):
+        email = unique_email()
+        (user_id,) = (await upsert_users([make_user(email)])).values()
+        await upsert_users([make_user(email)])
+        before = await self.row(email)
+
+        self.assertEqual(await upsert_users([make_user(email, phone='+7 900 000 00 02')]), {email: user_id})
+        row = await self.row(email)
+        self.assertEqual(row['phone'], '+7 900 000 00 02')
+        self.assertNotEqual(row['xmin'], before['xmin'])
+
+    #  Tests that new, unchanged and changed users of one call all get their ids, only the changed one is updated
+    async def test_mixed(self):
+        new, unchanged, changed = unique_email(), unique_email(), unique_email()
+        ids = await upsert_users([make_user(unchanged), make_user(changed)])
+
+        updated_users = set()
+        result = await upsert_users([make_user(new), make_user(unchanged), make_user(changed, phone='+7 999')],
+                                    updated_users)
+        self.assertEqual(updated_users, {ids[changed]})
+        self.assertEqual(result[unchanged], ids[unchanged])
+        self.assertEqual(result[changed], ids[changed])
+        self.assertEqual(result[new], (await self.row(new))['id'])
+        self.assertEqual((await self.row(changed))['phone'], '+7 999')
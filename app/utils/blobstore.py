@@ -0,0 +1,113 @@
+import base64
+import binascii
+import hashlib
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import Optional, Tuple
+
+from app.config import BLOB_STORE_PATH, IMAGES_URL
+
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+MEDIA_TYPES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF8", "image/gif"),
+    (b"RIFF", "image/webp"),
+)
+
+
+def blob_path(sha256: str, root: str = BLOB_STORE_PATH) -> Path:
+    """ Path of a blob in the store, raises ValueError for anything but a SHA-256 hex digest """
+    if not SHA256_RE.match(sha256):
+        raise ValueError(f"Invalid blob id: {sha256}")
+    return Path(root) / sha256[:2] / sha256[2:4] / sha256
+
+
+def image_url(sha256: str) -> str:
+    return f"{IMAGES_URL}{sha256}"
+
+
+class BlobWriter:
+    """ Writes a blob to a temporary file while hashing it, then moves it under its SHA-256 """
+
+    def __init__(self, root: str = BLOB_STORE_PATH):
+        self.root = root
+        tmp_dir = Path(root) / "tmp"
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        self.file = os.fdopen(fd, "wb")
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk: bytes) -> None:
+        self.file.write(chunk)
+        self.hash.update(chunk)
+        self.size += len(chunk)
+
+    def commit(self) -> Tuple[str, int]:
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+        sha256 = self.hash.hexdigest()
+        path = blob_path(sha256, self.root)
+        if path.exists():
+            # Same content is already stored, keep the existing copy
+            os.unlink(self.tmp_path)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(self.tmp_path, path)
+        return sha256, self.size
+
+    def abort(self) -> None:
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.unlink(self.tmp_path)
+
+
+def save_blob(data: bytes, root: str = BLOB_STORE_PATH) -> Tuple[str, int]:
+    writer = BlobWriter(root)
+    try:
+        writer.write(data)
+    except Exception:
+        writer.abort()
+        raise
+    return writer.commit()
+
+
+def decode_image_data(data: str) -> bytes:
+    """
+    Images are sent base64 encoded, older clients send plain strings which are stored as is.
+    A data: URI with ;base64 is always decoded. Anything else is only decoded when the
+    result is a known image format, a plain string like "test" is valid base64 too.
+    """
+    if data.startswith("data:") and ";base64," in data:
+        try:
+            return base64.b64decode(data.split(",", 1)[1], validate=True)
+        except (binascii.Error, ValueError):
+            return data.encode()
+
+    try:
+        decoded = base64.b64decode(data, validate=True)
+    except (binascii.Error, ValueError):
+        return data.encode()
+    return decoded if sniff_media_type(decoded) else data.encode()
+
+
+def sniff_media_type(head: bytes) -> Optional[str]:
+    """ Media type from the first bytes of an image, None for an unknown format """
+    for signature, media_type in MEDIA_TYPES:
+        if head.startswith(signature):
+            if media_type == "image/webp" and head[8:12] != b"WEBP":
+                continue
+            return media_type
+    return None
+
+
+def guess_media_type(path: Path) -> str:
+    with open(path, "rb") as file:
+        head = file.read(12)
+    return sniff_media_type(head) or "application/octet-stream"
@@ -0,0 +1,61 @@
+import time
+from typing import Any, AsyncGenerator, List, Optional
+
+from databases.backends.postgres import PostgresBackend, PostgresConnection
+from databases.interfaces import Record
+from sqlalchemy.sql import ClauseElement
+
+from app.utils.metrics import observe_query, pool_wait
+
+
+class InstrumentedPostgresBackend(PostgresBackend):
+    """ PostgresBackend whose connections report query times and pool waits to app.utils.metrics """
+
+    def connection(self) -> "InstrumentedPostgresConnection":
+        return InstrumentedPostgresConnection(self, self._dialect)
+
+
+class InstrumentedPostgresConnection(PostgresConnection):
+
+    async def acquire(self) -> None:
+        start = time.perf_counter()
+        await super().acquire()
+        pool_wait.observe(time.perf_counter() - start)
+
+    async def fetch_all(self, query: ClauseElement) -> List[Record]:
+        start = time.perf_counter()
+        try:
+            return await super().fetch_all(query)
+        finally:
+            observe_query(time.perf_counter() - start, query)
+
+    async def fetch_one(self, query: ClauseElement) -> Optional[Record]:
+        start = time.perf_counter()
+        try:
+            return await super().fetch_one(query)
+        finally:
+            observe_query(time.perf_counter() - start, query)
+
+    # fetch_val() goes through fetch_one()
+
+    async def execute(self, query: ClauseElement) -> Any:
+        start = time.perf_counter()
+        try:
+            return await super().execute(query)
+        finally:
+            observe_query(time.perf_counter() - start, query)
+
+    async def execute_many(self, queries: List[ClauseElement]) -> None:
+        start = time.perf_counter()
+        try:
+            await super().execute_many(queries)
+        finally:
+            observe_query(time.perf_counter() - start, queries[0] if queries else None)
+
+    async def iterate(self, query: ClauseElement) -> AsyncGenerator[Any, None]:
+        start = time.perf_counter()
+        try:
+            async for record in super().iterate(query):
+                yield record
+        finally:
+            observe_query(time.perf_counter() - start, query)
@@ -0,0 +1,149 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterable, List, Optional
+
+import sqlalchemy
+from sqlalchemy.dialects.postgresql import insert
+
+from app.config import (BLOB_STORE_PATH, IMAGE_JOB_BATCH_SIZE, IMAGE_JOB_LEASE,
+                        IMAGE_JOB_MAX_ATTEMPTS, IMAGE_JOB_POLL_INTERVAL,
+                        THUMBNAIL_WORKERS)
+from app.db_connection import database
+from app.logger import get_logger
+from app.models.models import image_jobs_table
+from app.utils.derivatives import make_derivatives
+
+logger = get_logger()
+
+
+async def enqueue_image_jobs(sha256s: Iterable[str]) -> None:
+    """ Record derivative jobs, call inside the transaction that stores the images """
+    values_list = [{'sha256': sha256} for sha256 in sorted(set(sha256s))]
+    if values_list:
+        query = insert(image_jobs_table).values(values_list).on_conflict_do_nothing(index_elements=['sha256'])
+        await database.execute(query)
+
+
+class DerivativeWorker:
+    """
+    Generates thumbnails and previews for stored photos in a process pool.
+
+    Jobs live in the image_jobs table. A job is leased while it is processed,
+    if the server dies the lease expires and another pass picks the job up.
+    A crashed worker process breaks the whole pool: it is replaced, and the
+    jobs it took down are retried after their lease. A crash counts as an
+    attempt, so a photo that always kills the worker fails after max_attempts.
+    """
+
+    def __init__(self, workers: int = THUMBNAIL_WORKERS, batch_size: int = IMAGE_JOB_BATCH_SIZE,
+                 max_attempts: int = IMAGE_JOB_MAX_ATTEMPTS, lease: int = IMAGE_JOB_LEASE,
+                 poll_interval: float = IMAGE_JOB_POLL_INTERVAL):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self.poll_interval = poll_interval
+
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    def start(self) -> None:
+        if self.workers <= 0 or self._task is not None:
+            return
+        self._pool = self.make_pool()
+        # An Event is bound to the loop it is first awaited in, the app may be started again in another loop
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self.run())
+
+    def make_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def replace_pool(self, broken: ProcessPoolExecutor) -> None:
+        # Every job of the broken pool fails at once, only the first one replaces it
+        if self._pool is broken:
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._pool = self.make_pool()
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def notify(self) -> None:
+        """ Wake the worker up, call after the transaction with new jobs is committed """
+        self._wakeup.set()
+
+    async def run(self) -> None:
+        while True:
+            try:
+                claimed = await self.process_batch()
+            except Exception as e:
+                logger.error("Error processing image jobs: %s", e)
+                claimed = 0
+
+            if claimed < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    async def process_batch(self) -> int:
+        jobs = await self.claim_jobs()
+        await asyncio.gather(*(self.process(job.sha256, job.attempts) for job in jobs))
+        return len(jobs)
+
+    async def claim_jobs(self) -> List:
+        candidates = (
+            sqlalchemy.select(image_jobs_table.c.id)
+            .where(image_jobs_table.c.status == 'new')
+            .where(sqlalchemy.or_(image_jobs_table.c.locked_until.is_(None),
+                                  image_jobs_table.c.locked_until < sqlalchemy.func.now()))
+            .order_by(image_jobs_table.c.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        query = (
+            image_jobs_table.update()
+            .where(image_jobs_table.c.id.in_(candidates.scalar_subquery()))
+            .values(attempts=image_jobs_table.c.attempts + 1,
+                    locked_until=sqlalchemy.literal_column(f"now() + interval '{int(self.lease)} seconds'"))
+            .returning(image_jobs_table.c.sha256, image_jobs_table.c.attempts)
+        )
+        return await database.fetch_all(query)
+
+    async def process(self, sha256: str, attempts: int) -> None:
+        query = image_jobs_table.update().where(image_jobs_table.c.sha256 == sha256)
+        loop = asyncio.get_running_loop()
+        pool = self._pool
+        try:
+            error = await loop.run_in_executor(pool, make_derivatives, sha256, BLOB_STORE_PATH)
+            if error is None:
+                await database.execute(query.values(status='done', locked_until=None, last_error=None))
+            else:
+                await database.execute(query.values(status='failed', last_error=error))
+        except BrokenProcessPool as e:
+            logger.error("Worker process died making derivatives for %s: %s", sha256, e)
+            self.replace_pool(pool)
+            await self.retry(query, attempts, 'Worker process died')
+        except Exception as e:
+            logger.error("Error making derivatives for %s: %s", sha256, e)
+            await self.retry(query, attempts, str(e))
+
+    async def retry(self, query: sqlalchemy.sql.Update, attempts: int, error: str) -> None:
+        """ Fail the job for good after max_attempts, otherwise keep the lease so the retry waits for it """
+        status = 'failed' if attempts >= self.max_attempts else 'new'
+        await database.execute(query.values(status=status, last_error=error))
+
+
+derivative_worker = DerivativeWorker()
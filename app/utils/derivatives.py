@@ -0,0 +1,55 @@
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from app.config import BLOB_STORE_PATH, IMAGES_URL
+from app.utils.blobstore import blob_path
+
+# Longest side in pixels of every derivative served for a photo
+VARIANTS = {
+    "thumbnail": 256,
+    "preview": 1280,
+}
+
+
+def derivative_path(sha256: str, variant: str, root: str = BLOB_STORE_PATH) -> Path:
+    if variant not in VARIANTS:
+        raise ValueError(f"Unknown image variant: {variant}")
+    return blob_path(sha256, root).parent / f"{sha256}.{variant}.jpg"
+
+
+def derivative_url(sha256: str, variant: str) -> str:
+    return f"{IMAGES_URL}{sha256}/{variant}"
+
+
+def make_derivatives(sha256: str, root: str = BLOB_STORE_PATH) -> Optional[str]:
+    """
+    Render every variant of a stored photo, runs in a worker process.
+
+    Returns why the blob can never be rendered, not an image or a decompression
+    bomb, so the job is not retried. None when the variants are written.
+    """
+    try:
+        with Image.open(blob_path(sha256, root)) as image:
+            image = ImageOps.exif_transpose(image).convert("RGB")
+            for variant, size in VARIANTS.items():
+                derivative = image.copy()
+                derivative.thumbnail((size, size))
+
+                path = derivative_path(sha256, variant, root)
+                fd, tmp_path = tempfile.mkstemp(dir=path.parent)
+                try:
+                    with os.fdopen(fd, "wb") as file:
+                        derivative.save(file, "JPEG", quality=80, optimize=True)
+                    os.replace(tmp_path, path)
+                except Exception:
+                    os.unlink(tmp_path)
+                    raise
+    except UnidentifiedImageError:
+        return "Not an image"
+    except Image.DecompressionBombError as e:
+        return str(e)
+    return None
@@ -1,170 +1,568 @@
-from typing import List, Optional
+import base64
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
+import sqlalchemy
 from fastapi import HTTPException
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert
 from sqlalchemy.exc import DatabaseError, IntegrityError
+from starlette.concurrency import run_in_threadpool
 
+from app.config import (COORDS_TOLERANCE, IMAGES_URL, USER_CACHE_SIZE,
+                        USER_CACHE_TTL)
 from app.db_connection import database
 from app.logger import get_logger
 from app.models.models import (coords_table, images_table, pereval_add_table,
                                users_table)
-from app.models.schemas import (CoordsModel, ImagesModel, LevelModel,
-                                PerevalGetResponse, PerevalPostRequest,
+from app.models.schemas import (CoordsModel, ImageRefModel, ImagesModel,
+                                PerevalMetadataRequest, PerevalPostRequest,
                                 UserModel)
+from app.utils.blobstore import decode_image_data, save_blob
+from app.utils.cache import LRUCache
+from app.utils.derivative_worker import enqueue_image_jobs
+from app.utils.metrics import timed
+from app.utils.prepared import PreparedQuery
+from app.utils.search import search_text
+from app.utils.tiles import record_cluster_changes
 
 logger = get_logger()
 
+users_cache = LRUCache(USER_CACHE_SIZE, USER_CACHE_TTL)
 
-async def get_or_create_coords(coords: CoordsModel, coords_id: Optional[int] = None) -> int:
+
+@timed
+async def get_or_create_coords(coords: CoordsModel) -> int:
     try:
-        if coords_id:
-            query = coords_table.select().where(coords_table.c.id == coords_id)
-            check_coords = await database.fetch_one(query)
-            if check_coords:
-                query = coords_table.update().where(coords_table.c.id == coords_id). \
-                    values(longitude=coords.longitude,
-                           latitude=coords.latitude,
-                           height=coords.height)
-
-                await database.execute(query)
-                logger.info(f"Coords updated successfully. ID: {coords_id}")
-                return check_coords.id
-
-        query = coords_table.insert().values(latitude=coords.latitude,
-                                             longitude=coords.longitude,
-                                             height=coords.height)
-        coords_id = await database.execute(query)
-        return coords_id
+        coords_ids = await resolve_coords([coords])
+        return coords_ids[0]
 
     except (DatabaseError, IntegrityError) as e:
         logger.error('Error creating coordinates: %s', str(e))
         raise HTTPException(status_code=500, detail='Error creating coordinates')
 
 
+def coords_key(coords: CoordsModel) -> Tuple[float, float, int]:
+    return coords.latitude, coords.longitude, coords.height
+
+
+def row_coords_key(row) -> Tuple[float, float, int]:
+    return row["latitude"], row["longitude"], row["height"]
+
+
+def coords_condition(keys: List[Tuple[float, float, int]]) -> sqlalchemy.sql.ColumnElement:
+    """ Exact match on any of the (latitude, longitude, height) keys """
+    return sqlalchemy.or_(*(
+        sqlalchemy.and_(coords_table.c.latitude == latitude,
+                        coords_table.c.longitude == longitude,
+                        coords_table.c.height == height)
+        for latitude, longitude, height in keys
+    ))
+
+
+def coords_match(row, coords: CoordsModel) -> bool:
+    return (row["height"] == coords.height
+            and abs(row["latitude"] - coords.latitude) <= COORDS_TOLERANCE
+            and abs(row["longitude"] - coords.longitude) <= COORDS_TOLERANCE)
+
+
+@timed
+async def resolve_coords(coords: List[CoordsModel]) -> List[int]:
+    """
+    Ids of coords rows for the given points, in the same order.
+
+    A point reuses an existing row with the same height whose latitude and
+    longitude are within COORDS_TOLERANCE degrees, the nearest one wins. Only
+    points with no such row are inserted, the unique index on
+    (latitude, longitude, height) keeps concurrent inserts from duplicating.
+    """
+    if COORDS_TOLERANCE > 0:
+        condition = sqlalchemy.or_(*(
+            sqlalchemy.and_(coords_table.c.height == point.height,
+                            coords_table.c.latitude.between(point.latitude - COORDS_TOLERANCE,
+                                                            point.latitude + COORDS_TOLERANCE),
+                            coords_table.c.longitude.between(point.longitude - COORDS_TOLERANCE,
+                                                             point.longitude + COORDS_TOLERANCE))
+            for point in coords
+        ))
+    else:
+        condition = coords_condition([coords_key(point) for point in coords])
+
+    query = sqlalchemy.select(coords_table).where(condition).order_by(coords_table.c.id)
+    candidates = await database.fetch_all(query)
+
+    found = {}
+    for point in coords:
+        matches = [row for row in candidates if coords_match(row, point)]
+        if matches:
+            nearest = min(matches, key=lambda row: (row["latitude"] - point.latitude) ** 2
+                                                   + (row["longitude"] - point.longitude) ** 2)
+            found[coords_key(point)] = nearest["id"]
+
+    missing = sorted({coords_key(point) for point in coords} - found.keys())
+    if missing:
+        query = insert(coords_table).values([
+            dict(latitude=latitude, longitude=longitude, height=height) for latitude, longitude, height in missing
+        ]).on_conflict_do_nothing(
+            index_elements=[coords_table.c.latitude, coords_table.c.longitude, coords_table.c.height]
+        ).returning(coords_table)
+        for row in await database.fetch_all(query):
+            found[row_coords_key(row)] = row["id"]
+
+        # Inserted concurrently by another request, the row exists now
+        conflicted = [key for key in missing if key not in found]
+        if conflicted:
+            query = sqlalchemy.select(coords_table).where(coords_condition(conflicted))
+            for row in await database.fetch_all(query):
+                found[row_coords_key(row)] = row["id"]
+
+    return [found[coords_key(point)] for point in coords]
+
+
+def pereval_values(request: PerevalMetadataRequest, user_id: int, coords_id: int) -> dict:
+    return dict(
+        beauty_title=request.beauty_title,
+        title=request.title,
+        other_titles=request.other_titles,
+        connect=request.connect,
+        coords_id=coords_id,
+        user_id=user_id,
+        level_winter=request.level.winter,
+        level_summer=request.level.summer,
+        level_autumn=request.level.autumn,
+        level_spring=request.level.spring,
+        search_text=search_text(request.title, request.beauty_title, request.other_titles)
+    )
+
+
+@timed
 async def create_pereval(request: PerevalPostRequest, user_id: int, coords_id: int) -> int:
     try:
-        query = pereval_add_table.insert().values(
-            beauty_title=request.beauty_title,
-            title=request.title,
-            other_titles=request.other_titles,
-            connect=request.connect,
-            coords_id=coords_id,
-            user_id=user_id,
-            level_winter=request.level.winter,
-            level_summer=request.level.summer,
-            level_autumn=request.level.autumn,
-            level_spring=request.level.spring
-        )
+        query = pereval_add_table.insert().values(**pereval_values(request, user_id, coords_id))
         return await database.execute(query)
     except Exception as e:
-        logger.error(f"Error creating pereval: {str(e)}")
+        logger.error("Error creating pereval: %s", e)
         raise HTTPException(status_code=500, detail="Error creating pereval")
 
 
+@timed
 async def update_pereval(request: PerevalPostRequest, pereval_id: int, user_id: int, coords_id: int) -> int:
     try:
-        query = pereval_add_table.update().where(pereval_add_table.c.id == pereval_id).values(
-            beauty_title=request.beauty_title,
-            title=request.title,
-            other_titles=request.other_titles,
-            connect=request.connect,
-            coords_id=coords_id,
-            user_id=user_id,
-            level_winter=request.level.winter,
-            level_summer=request.level.summer,
-            level_autumn=request.level.autumn,
-            level_spring=request.level.spring
-        )
+        query = pereval_add_table.update().where(pereval_add_table.c.id == pereval_id). \
+            values(**pereval_values(request, user_id, coords_id))
 
         return await database.execute(query)
     except Exception as e:
-        logger.error(f"Error update pereval: {str(e)}")
+        logger.error("Error update pereval: %s", e)
         raise HTTPException(status_code=500, detail="Error update pereval")
 
 
-async def get_or_create_user(user: UserModel) -> int:
+@timed
+async def get_or_create_user(user: UserModel, updated_users: Optional[Set[int]] = None) -> int:
     try:
-        query = users_table.select().where(users_table.c.email == user.email)
-        check_user = await database.fetch_one(query)
-
-        if check_user:
-            query = users_table.update().where(users_table.c.email == user.email). \
-                values(first_name=user.name,
-                       last_name=user.fam,
-                       patronymic=user.otc,
-                       phone=user.phone
-                       )
-
-            await database.execute(query)
-            return check_user.id
-
-        else:
-            query = users_table.insert().values(
-                email=user.email,
-                first_name=user.name,
-                last_name=user.fam,
-                patronymic=user.otc,
-                phone=user.phone
-            )
-
-            return await database.execute(query)
+        users = await upsert_users([user], updated_users)
+        return users[user.email]
     except (DatabaseError, IntegrityError) as e:
-        logger.error(f"Error getting or creating user: {str(e)}")
+        logger.error("Error getting or creating user: %s", e)
+
+
+@timed
+async def store_images(images: List[ImagesModel]) -> List[ImageRefModel]:
+    """ Save image payloads to the blob store off the event loop """
+    refs = []
+    for image in images:
+        sha256, size = await run_in_threadpool(save_blob, decode_image_data(image.data))
+        refs.append(ImageRefModel(sha256=sha256, size=size, name=image.name))
+    return refs
 
 
-async def create_images(images: List[ImagesModel], pereval_id: int) -> None:
+@timed
+async def create_images(images: List[ImageRefModel], pereval_id: int) -> None:
     try:
-        values_list = [{'pereval': pereval_id, 'data': image.data, 'name': image.name} for image in images]
-        query = images_table.insert()
-        await database.execute_many(query, values_list)
+        await insert_images({pereval_id: images})
     except (DatabaseError, IntegrityError) as e:
-        logger.error(f"Error creating image: {str(e)}")
+        logger.error("Error creating image: %s", e)
 
 
-async def get_images(pereval_id: int) -> List[ImagesModel]:
-    try:
-        query = images_table.select().where(images_table.c.pereval == pereval_id)
-        images = await database.fetch_all(query)
-    except Exception as e:
-        logger.error(f'Error retrieving images data: {e}')
+@timed
+async def insert_images(images: Dict[int, List[ImageRefModel]]) -> None:
+    """ Insert images of several perevals with a single multi-row INSERT """
+    values_list = [{'pereval': pereval_id, 'sha256': image.sha256, 'size': image.size, 'name': image.name}
+                   for pereval_id, pereval_images in images.items() for image in pereval_images]
+    if not values_list:
+        return
+
+    await database.execute(images_table.insert().values(values_list))
+    await enqueue_image_jobs(value['sha256'] for value in values_list)
+
+
+@timed
+async def upsert_users(users: List[UserModel], updated_users: Optional[Set[int]] = None) -> Dict[str, int]:
+    """
+    Insert or update users by email, returns email -> id.
+
+    Rows are only written when something changed. Users whose committed row is
+    known to match the request are answered from users_cache without a query.
+    Ids of existing users whose data changed are added to updated_users.
+    """
+    values = {user.email: dict(email=user.email,
+                               first_name=user.name,
+                               last_name=user.fam,
+                               patronymic=user.otc,
+                               phone=user.phone) for user in users}
+
+    ids = {}
+    for email in list(values):
+        cached = users_cache.get(email)
+        if cached is not None and cached[1] == values[email]:
+            ids[email] = cached[0]
+            del values[email]
+
+    if not values:
+        return ids
+
+    # Sorted by email so concurrent batches lock rows in the same order
+    query = insert(users_table).values([values[email] for email in sorted(values)])
+    query = query.on_conflict_do_update(
+        index_elements=[users_table.c.email],
+        set_=dict(first_name=query.excluded.first_name,
+                  last_name=query.excluded.last_name,
+                  patronymic=query.excluded.patronymic,
+                  phone=query.excluded.phone),
+        where=sqlalchemy.or_(*(users_table.c[column].is_distinct_from(query.excluded[column])
+                               for column in ('first_name', 'last_name', 'patronymic', 'phone')))
+    ).returning(users_table.c.id, users_table.c.email,
+                # xmax of a row written by ON CONFLICT DO UPDATE is set, of an inserted one it is 0
+                sqlalchemy.literal_column("xmax::text <> '0'").label("updated"))
+
+    for row in await database.fetch_all(query):
+        ids[row["email"]] = row["id"]
+        if row["updated"] and updated_users is not None:
+            updated_users.add(row["id"])
+
+    # Unchanged rows are skipped by the upsert and not returned
+    unchanged = [email for email in values if email not in ids]
+    if unchanged:
+        query = sqlalchemy.select(users_table.c.id, users_table.c.email).where(users_table.c.email.in_(unchanged))
+        for row in await database.fetch_all(query):
+            ids[row["email"]] = row["id"]
+            # Only rows this transaction did not write are cached, they survive a rollback
+            users_cache.set(row["email"], (row["id"], values[row["email"]]))
+
+    return ids
+
+
+@timed
+async def create_perevals(requests: List[PerevalMetadataRequest], images: List[List[ImageRefModel]],
+                          updated_users: Optional[Set[int]] = None) -> List[int]:
+    """ Insert several perevals with one statement per table, ids are returned in request order """
+    users = await upsert_users([request.user for request in requests], updated_users)
+
+    coords = await resolve_coords([request.coords for request in requests])
+
+    # Neither the order a multi-row INSERT draws serial ids in nor the order of its RETURNING rows is
+    # guaranteed, so the ids are taken from the sequence first and every row is inserted with its own
+    id_sequence = sqlalchemy.func.pg_get_serial_sequence(pereval_add_table.name, pereval_add_table.c.id.name)
+    count = sqlalchemy.cast(len(requests), sqlalchemy.Integer)
+    ids_query = sqlalchemy.select(sqlalchemy.func.nextval(id_sequence)).select_from(
+        sqlalchemy.func.generate_series(1, count))
+    perevals = [row[0] for row in await database.fetch_all(ids_query)]
+
+    query = pereval_add_table.insert().values([
+        dict(pereval_values(request, users[request.user.email], coords_id), id=pereval_id)
+        for request, coords_id, pereval_id in zip(requests, coords, perevals)
+    ])
+    await database.execute(query)
+
+    await insert_images(dict(zip(perevals, images)))
+    await record_cluster_changes(added=coords)
+    return perevals
+
+
+async def user_pereval_ids(user_ids: Iterable[int]) -> List[int]:
+    """ Ids of all perevals of the users, their cached responses embed the user's data """
+    user_ids = list(user_ids)
+    if not user_ids:
         return []
+    query = sqlalchemy.select(pereval_add_table.c.id).where(pereval_add_table.c.user_id.in_(user_ids))
+    return [row["id"] for row in await database.fetch_all(query)]
+
+
+def json_object(**columns) -> sqlalchemy.sql.ColumnElement:
+    """ Build a json_build_object() expression from keyword -> column pairs """
+    args = []
+    for key, column in columns.items():
+        args.extend((sqlalchemy.literal_column(f"'{key}'"), column))
+    return sqlalchemy.type_coerce(sqlalchemy.func.json_build_object(*args), sqlalchemy.JSON)
+
+
+def pereval_images_agg() -> sqlalchemy.sql.ColumnElement:
+    """ Correlated subquery aggregating the images of a pereval into a JSON array """
+    images = (
+        sqlalchemy.select(
+            sqlalchemy.func.json_agg(
+                aggregate_order_by(
+                    sqlalchemy.func.json_build_object(
+                        sqlalchemy.literal_column("'name'"), images_table.c.name,
+                        sqlalchemy.literal_column("'url'"),
+                        sqlalchemy.literal(IMAGES_URL).concat(images_table.c.sha256),
+                        sqlalchemy.literal_column("'size'"), images_table.c.size,
+                        sqlalchemy.literal_column("'thumbnail_url'"),
+                        sqlalchemy.literal(IMAGES_URL).concat(images_table.c.sha256).concat('/thumbnail'),
+                        sqlalchemy.literal_column("'preview_url'"),
+                        sqlalchemy.literal(IMAGES_URL).concat(images_table.c.sha256).concat('/preview')
+                    ),
+                    images_table.c.id
+                )
+            )
+        )
+        .where(images_table.c.pereval == pereval_add_table.c.id)
+        .scalar_subquery()
+    )
+    return sqlalchemy.type_coerce(
+        sqlalchemy.func.coalesce(images, sqlalchemy.literal_column("'[]'::json")),
+        sqlalchemy.JSON
+    )
+
 
-    return [ImagesModel(**image) for image in images]
+def pereval_response_query() -> sqlalchemy.sql.Select:
+    """ Select a pereval shaped like PerevalGetResponse, images included """
+    return (
+        sqlalchemy.select(
+            pereval_add_table.c.id,
+            pereval_add_table.c.status,
+            pereval_add_table.c.beauty_title,
+            pereval_add_table.c.title,
+            pereval_add_table.c.other_titles,
+            pereval_add_table.c.connect,
+            pereval_add_table.c.add_time,
+            json_object(
+                email=users_table.c.email,
+                fam=users_table.c.last_name,
+                name=users_table.c.first_name,
+                otc=users_table.c.patronymic,
+                phone=users_table.c.phone
+            ).label("user"),
+            json_object(
+                latitude=coords_table.c.latitude,
+                longitude=coords_table.c.longitude,
+                height=coords_table.c.height
+            ).label("coords"),
+            json_object(
+                winter=pereval_add_table.c.level_winter,
+                summer=pereval_add_table.c.level_summer,
+                autumn=pereval_add_table.c.level_autumn,
+                spring=pereval_add_table.c.level_spring
+            ).label("level"),
+            pereval_images_agg().label("images")
+        )
+        .select_from(
+            pereval_add_table
+            .join(coords_table, pereval_add_table.c.coords_id == coords_table.c.id)
+            .join(users_table, pereval_add_table.c.user_id == users_table.c.id)
+        )
+    )
 
 
-async def get_pereval_by_id(pereval):
-    user = UserModel(
-        email=pereval.email,
-        fam=pereval.last_name,
-        name=pereval.first_name,
-        otc=pereval.patronymic,
-        phone=pereval.phone
+def pereval_modified() -> sqlalchemy.sql.ColumnElement:
+    """ Last change of a pereval response: an update of the pereval or of its user """
+    return sqlalchemy.func.greatest(pereval_add_table.c.updated_at, users_table.c.updated_at)
+
+
+def with_validators(query: sqlalchemy.sql.Select) -> sqlalchemy.sql.Select:
+    """
+    Add total and modified of all rows a pereval_response_query() matches, before
+    its limit. One statement keeps the validators and the rows of the same snapshot.
+    """
+    validators = validators_query(query).subquery("validators")
+    return query.add_columns(validators.c.total, validators.c.modified).join(validators, sqlalchemy.true())
+
+
+def validators_query(query: sqlalchemy.sql.Select) -> sqlalchemy.sql.Select:
+    """ Only total and modified of a pereval_response_query(), no responses are built """
+    return (
+        query.with_only_columns(
+            sqlalchemy.func.count().label("total"),
+            sqlalchemy.func.max(pereval_modified()).label("modified")
+        )
+        .order_by(None)
+        .limit(None)
     )
 
-    coords = CoordsModel(
-        latitude=pereval.latitude,
-        longitude=pereval.longitude,
-        height=pereval.height
+
+def pereval_dict(row) -> dict:
+    """
+    Map a row of pereval_response_query() straight to the JSON shape of
+    PerevalGetResponse. The user, level and images objects are built by the
+    query in model field order, so no models are constructed on the read paths.
+    """
+    return dict(
+        id=row["id"],
+        status=row["status"],
+        beauty_title=row["beauty_title"],
+        title=row["title"],
+        other_titles=row["other_titles"],
+        connect=row["connect"],
+        add_time=row["add_time"],
+        user=row["user"],
+        coords=coords_dict(row["coords"]),
+        level=row["level"],
+        images=row["images"]
     )
 
-    level = LevelModel(
-        winter=pereval.level_winter,
-        summer=pereval.level_summer,
-        autumn=pereval.level_autumn,
-        spring=pereval.level_spring
+
+def coords_dict(coords: dict) -> dict:
+    # json_build_object() gives 43 for a whole float, CoordsModel would give 43.0
+    return dict(latitude=float(coords["latitude"]), longitude=float(coords["longitude"]), height=coords["height"])
+
+
+def pereval_short_query() -> sqlalchemy.sql.Select:
+    """ Select a pereval shaped like PerevalShortResponse """
+    return (
+        sqlalchemy.select(
+            pereval_add_table.c.id,
+            pereval_add_table.c.status,
+            pereval_add_table.c.beauty_title,
+            pereval_add_table.c.title,
+            json_object(
+                latitude=coords_table.c.latitude,
+                longitude=coords_table.c.longitude,
+                height=coords_table.c.height
+            ).label("coords")
+        )
+        .select_from(
+            pereval_add_table
+            .join(coords_table, pereval_add_table.c.coords_id == coords_table.c.id)
+        )
     )
 
-    images = await get_images(pereval.id)
-
-    return PerevalGetResponse(
-        id=pereval.id,
-        status=pereval.status,
-        beauty_title=pereval.beauty_title,
-        title=pereval.title,
-        other_titles=pereval.other_titles,
-        connect=pereval.connect,
-        add_time=pereval.add_time,
-        user=user,
-        coords=coords,
-        level=level,
-        images=images
+
+def pereval_short_dict(row) -> dict:
+    """ Map a row of pereval_short_query() straight to the JSON shape of PerevalShortResponse """
+    keys = set(row)
+    return dict(
+        id=row["id"],
+        status=row["status"],
+        beauty_title=row["beauty_title"],
+        title=row["title"],
+        coords=coords_dict(row["coords"]),
+        distance=row["distance"] if "distance" in keys else None,
+        rank=row["rank"] if "rank" in keys else None
     )
+
+
+def encode_cursor(add_time: datetime, pereval_id: int) -> str:
+    """ Encode the (add_time, id) keyset position of a pereval as an opaque cursor """
+    raw = f"{add_time.isoformat()}|{pereval_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """ Decode a cursor made by encode_cursor(), raises ValueError if it is malformed """
+    try:
+        add_time, pereval_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(add_time), int(pereval_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def perevals_by_email_query(after_cursor: bool = False) -> sqlalchemy.sql.Select:
+    """
+    Perevals of a user in (add_time, id) order. user_email is a bindparam(), and
+    so are cursor_add_time and cursor_id of the position to start after.
+    """
+    query = (
+        pereval_response_query()
+        .where(users_table.c.email == sqlalchemy.bindparam("user_email"))
+        .order_by(pereval_add_table.c.add_time, pereval_add_table.c.id)
+    )
+    if after_cursor:
+        query = query.where(
+            sqlalchemy.tuple_(pereval_add_table.c.add_time, pereval_add_table.c.id)
+            > sqlalchemy.tuple_(sqlalchemy.bindparam("cursor_add_time", type_=pereval_add_table.c.add_time.type),
+                                sqlalchemy.bindparam("cursor_id", type_=pereval_add_table.c.id.type))
+        )
+    return query
+
+
+def cursor_params(cursor: Optional[str]) -> dict:
+    """ Values for the cursor bindparams of perevals_by_email_query(), raises ValueError if it is malformed """
+    if not cursor:
+        return {}
+    add_time, pereval_id = decode_cursor(cursor)
+    return dict(cursor_add_time=add_time, cursor_id=pereval_id)
+
+
+def pereval_check_query() -> sqlalchemy.sql.Select:
+    """ A pereval with its user and coords, checked before an update. pereval_id is a bindparam() """
+    return (
+        sqlalchemy.select(
+            pereval_add_table,
+            users_table,
+            coords_table.c.latitude,
+            coords_table.c.longitude
+        )
+        .select_from(
+            pereval_add_table
+            .join(users_table, pereval_add_table.c.user_id == users_table.c.id)
+            .join(coords_table, pereval_add_table.c.coords_id == coords_table.c.id)
+        )
+        .where(pereval_add_table.c.id == sqlalchemy.bindparam("pereval_id"))
+    )
+
+
+def encode_sync_token(change_seq: int, pereval_id: int) -> str:
+    """ Encode the (change_seq, id) position a client has synced up to as an opaque token """
+    return base64.urlsafe_b64encode(f"{change_seq}|{pereval_id}".encode()).decode()
+
+
+def decode_sync_token(token: str) -> Tuple[int, int]:
+    """ Decode a token made by encode_sync_token(), raises ValueError if it is malformed """
+    try:
+        change_seq, pereval_id = base64.urlsafe_b64decode(token.encode()).decode().split("|")
+        return int(change_seq), int(pereval_id)
+    except Exception as e:
+        raise ValueError(f"Invalid sync token: {token}") from e
+
+
+def sync_watermark_query() -> sqlalchemy.sql.Select:
+    """
+    Oldest transaction still running for the current snapshot. Every change_seq
+    below it belongs to a finished transaction, so no row can appear there later.
+    """
+    return sqlalchemy.select(
+        sqlalchemy.cast(
+            sqlalchemy.cast(sqlalchemy.func.pg_snapshot_xmin(sqlalchemy.func.pg_current_snapshot()), sqlalchemy.Text),
+            sqlalchemy.BigInteger
+        )
+    )
+
+
+def perevals_changed_query(user_email: str, since: Tuple[int, int], watermark: int,
+                           limit: int) -> sqlalchemy.sql.Select:
+    """ Perevals of a user changed after the since position and before the watermark, in change order """
+    return (
+        pereval_response_query()
+        .add_columns(pereval_add_table.c.change_seq)
+        .where(users_table.c.email == user_email)
+        .where(sqlalchemy.tuple_(pereval_add_table.c.change_seq, pereval_add_table.c.id) > since)
+        .where(pereval_add_table.c.change_seq < watermark)
+        .order_by(pereval_add_table.c.change_seq, pereval_add_table.c.id)
+        .limit(limit)
+    )
+
+
+# Fixed shapes of the read paths, compiled once. A page of perevals_by_email_query()
+# is keyed by whether it starts after a cursor, its size is the limit bindparam()
+pereval_by_id_query = pereval_response_query().where(pereval_add_table.c.id == sqlalchemy.bindparam("pereval_id"))
+pereval_by_id = PreparedQuery(with_validators(pereval_by_id_query))
+pereval_by_id_validators = PreparedQuery(validators_query(pereval_by_id_query))
+pereval_check = PreparedQuery(pereval_check_query())
+perevals_page = {
+    after_cursor: PreparedQuery(with_validators(
+        perevals_by_email_query(after_cursor).limit(sqlalchemy.bindparam("limit", type_=sqlalchemy.Integer))))
+    for after_cursor in (False, True)
+}
+perevals_page_validators = {
+    after_cursor: PreparedQuery(validators_query(perevals_by_email_query(after_cursor)))
+    for after_cursor in (False, True)
+}
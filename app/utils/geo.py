@@ -0,0 +1,88 @@
+import math
+from typing import List, Tuple
+
+import sqlalchemy
+
+from app.models.models import coords_table
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+# coords.cell is a generated column numbering a regular lat/lon grid row by row,
+# these constants must match its expression (see models.coords_table)
+CELLS_PER_DEGREE = 10
+CELLS_PER_ROW = 360 * CELLS_PER_DEGREE + 1
+
+# Wider boxes are covered by a single cell range instead of one range per grid row
+MAX_CELL_ROWS = 64
+
+
+def cell_row(latitude: float) -> int:
+    return math.floor((latitude + 90) * CELLS_PER_DEGREE)
+
+
+def cell_column(longitude: float) -> int:
+    return math.floor((longitude + 180) * CELLS_PER_DEGREE)
+
+
+def cell_id(latitude: float, longitude: float) -> int:
+    return cell_row(latitude) * CELLS_PER_ROW + cell_column(longitude)
+
+
+def split_antimeridian(west: float, east: float) -> List[Tuple[float, float]]:
+    """ Longitude intervals of a box, a box with west > east crosses the 180th meridian """
+    if west <= east:
+        return [(west, east)]
+    return [(west, 180.0), (-180.0, east)]
+
+
+def radius_bbox(latitude: float, longitude: float, radius: float) -> Tuple[float, float, float, float]:
+    """ Bounding box (south, west, north, east) of a circle of radius km """
+    delta_lat = radius / KM_PER_DEGREE
+    south, north = max(latitude - delta_lat, -90.0), min(latitude + delta_lat, 90.0)
+
+    # Near a pole the circle covers every longitude
+    if north >= 90.0 or south <= -90.0 or radius >= math.pi * EARTH_RADIUS_KM / 2:
+        return south, -180.0, north, 180.0
+
+    delta_lon = math.degrees(math.asin(min(1.0, math.sin(radius / EARTH_RADIUS_KM)
+                                           / math.cos(math.radians(latitude)))))
+    west, east = longitude - delta_lon, longitude + delta_lon
+    if west < -180.0:
+        west += 360.0
+    if east > 180.0:
+        east -= 360.0
+    return south, west, north, east
+
+
+def bbox_condition(south: float, west: float, north: float, east: float) -> sqlalchemy.sql.ColumnElement:
+    """ Filter on coords inside a box, driven by B-tree range scans over coords.cell """
+    first_row, last_row = cell_row(south), cell_row(north)
+    intervals = split_antimeridian(west, east)
+
+    cell_ranges = []
+    if last_row - first_row + 1 > MAX_CELL_ROWS:
+        cell_ranges.append((first_row * CELLS_PER_ROW, (last_row + 1) * CELLS_PER_ROW - 1))
+    else:
+        for row in range(first_row, last_row + 1):
+            for interval_west, interval_east in intervals:
+                cell_ranges.append((row * CELLS_PER_ROW + cell_column(interval_west),
+                                    row * CELLS_PER_ROW + cell_column(interval_east)))
+
+    return sqlalchemy.and_(
+        sqlalchemy.or_(*(coords_table.c.cell.between(first, last) for first, last in cell_ranges)),
+        coords_table.c.latitude.between(south, north),
+        sqlalchemy.or_(*(coords_table.c.longitude.between(interval_west, interval_east)
+                         for interval_west, interval_east in intervals))
+    )
+
+
+def haversine(latitude: float, longitude: float) -> sqlalchemy.sql.ColumnElement:
+    """ Great-circle distance in km from a point to coords """
+    func = sqlalchemy.func
+    lat1, lat2 = func.radians(sqlalchemy.literal(latitude)), func.radians(coords_table.c.latitude)
+    half_dlat = (lat2 - lat1) / 2
+    half_dlon = (func.radians(coords_table.c.longitude) - func.radians(sqlalchemy.literal(longitude))) / 2
+    return 2 * EARTH_RADIUS_KM * func.asin(func.least(1.0, func.sqrt(
+        func.power(func.sin(half_dlat), 2) + func.cos(lat1) * func.cos(lat2) * func.power(func.sin(half_dlon), 2)
+    )))
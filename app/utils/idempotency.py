@@ -0,0 +1,122 @@
+import asyncio
+import hashlib
+from typing import Optional
+
+import sqlalchemy
+from sqlalchemy.dialects.postgresql import insert
+from starlette.responses import JSONResponse, Response
+
+from app.config import (IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_CLEANUP_INTERVAL,
+                        IDEMPOTENCY_TTL)
+from app.db_connection import database
+from app.logger import get_logger
+from app.models.models import idempotency_keys_table
+from app.utils.cache import LRUCache
+
+logger = get_logger()
+
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+
+def fingerprint(*parts: str) -> str:
+    """ Hash of the request body, to tell a retry from a different request with the same key """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Results of write requests made with an Idempotency-Key header.
+
+    claim() runs first in the write transaction. A concurrent request with the
+    same key waits on the key row until the first one commits and then replays
+    its result. Committed results are also kept in memory, so most retries are
+    answered before any work is done. Keys expire after ttl seconds.
+    """
+
+    def __init__(self, ttl: int = IDEMPOTENCY_TTL, cache_size: int = IDEMPOTENCY_CACHE_SIZE,
+                 cleanup_interval: float = IDEMPOTENCY_CLEANUP_INTERVAL):
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        self.cache = LRUCache(cache_size, ttl)
+        self._task: Optional[asyncio.Task] = None
+
+    def replay(self, key: str, request_fingerprint: str) -> Optional[Response]:
+        """ Stored result from memory, None when the key is not known here """
+        cached = self.cache.get(key)
+        if cached is None:
+            return None
+        return self.replay_response(request_fingerprint, *cached)
+
+    async def claim(self, key: str, request_fingerprint: str) -> Optional[Response]:
+        """ Take the key inside the write transaction, returns the stored result if it is already used """
+        query = insert(idempotency_keys_table).values(key=key, fingerprint=request_fingerprint)
+        query = query.on_conflict_do_update(
+            index_elements=[idempotency_keys_table.c.key],
+            set_=dict(fingerprint=query.excluded.fingerprint, response=None, created_at=sqlalchemy.func.now()),
+            where=self.expired()
+        ).returning(idempotency_keys_table.c.key)
+        if await database.fetch_one(query) is not None:
+            return None
+
+        query = (
+            sqlalchemy.select(idempotency_keys_table.c.fingerprint, idempotency_keys_table.c.response)
+            .where(idempotency_keys_table.c.key == key)
+        )
+        row = await database.fetch_one(query)
+        logger.info("Replaying idempotent request. Key: %s", key)
+        return self.replay_response(request_fingerprint, row["fingerprint"], row["response"].encode())
+
+    async def save(self, key: str, content: bytes) -> None:
+        """ Store the result in the transaction that claimed the key """
+        query = (
+            idempotency_keys_table.update()
+            .where(idempotency_keys_table.c.key == key)
+            .values(response=content.decode())
+        )
+        await database.execute(query)
+
+    def remember(self, key: str, request_fingerprint: str, content: bytes) -> None:
+        """ Keep the result in memory, call after the transaction is committed """
+        self.cache.set(key, (request_fingerprint, content))
+
+    @staticmethod
+    def replay_response(request_fingerprint: str, stored_fingerprint: str, content: bytes) -> Response:
+        if stored_fingerprint != request_fingerprint:
+            return JSONResponse({'status': 422, 'message': 'Ключ Idempotency-Key использован для другого запроса.'},
+                                status_code=422)
+        return Response(content, media_type="application/json", headers={'idempotent-replayed': 'true'})
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.cleanup()
+            except Exception as e:
+                logger.error("Error cleaning up idempotency keys: %s", e)
+            await asyncio.sleep(self.cleanup_interval)
+
+    async def cleanup(self) -> None:
+        await database.execute(idempotency_keys_table.delete().where(self.expired()))
+
+    def expired(self) -> sqlalchemy.sql.ColumnElement:
+        return idempotency_keys_table.c.created_at < sqlalchemy.func.now() - sqlalchemy.literal_column(
+            f"interval '{int(self.ttl)} seconds'")
+
+
+idempotency_store = IdempotencyStore()
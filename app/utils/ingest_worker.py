@@ -0,0 +1,194 @@
+import asyncio
+import json
+import time
+import uuid
+from typing import List, Optional
+
+import sqlalchemy
+
+from app.config import (INGEST_BATCH_SIZE, INGEST_CLEANUP_INTERVAL,
+                        INGEST_LINGER, INGEST_MAX_ATTEMPTS,
+                        INGEST_POLL_INTERVAL, INGEST_RETENTION)
+from app.db_connection import database
+from app.logger import get_logger
+from app.models.models import ingest_queue_table
+from app.models.schemas import ImageRefModel, PerevalMetadataRequest
+from app.utils.derivative_worker import derivative_worker
+from app.utils.functions import create_perevals, user_pereval_ids
+from app.utils.response_cache import invalidate_perevals
+from app.utils.tiles import invalidate_tiles
+
+logger = get_logger()
+
+
+async def enqueue_pereval(request: PerevalMetadataRequest, images: List[ImageRefModel]) -> str:
+    """ Store a validated pereval in the ingest queue, returns its ticket """
+    ticket = str(uuid.uuid4())
+    query = ingest_queue_table.insert().values(
+        ticket=ticket,
+        payload=request.json(),
+        images=json.dumps([image.dict() for image in images])
+    )
+    await database.execute(query)
+    return ticket
+
+
+class IngestWorker:
+    """
+    Writes queued perevals to the database in batches.
+
+    Rows are claimed with FOR UPDATE SKIP LOCKED in the transaction that inserts
+    the perevals, so a crash simply returns them to the queue. When a batch
+    fails its rows are retried one by one to find the bad one. Written and
+    failed rows are deleted after retention seconds.
+    """
+
+    def __init__(self, batch_size: int = INGEST_BATCH_SIZE, max_attempts: int = INGEST_MAX_ATTEMPTS,
+                 linger: float = INGEST_LINGER, poll_interval: float = INGEST_POLL_INTERVAL,
+                 retention: int = INGEST_RETENTION, cleanup_interval: float = INGEST_CLEANUP_INTERVAL):
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.linger = linger
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.cleanup_interval = cleanup_interval
+        self._cleanup_at = 0.0
+
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    def start(self) -> None:
+        if self._task is None:
+            # An Event is bound to the loop it is first awaited in, the app may be started again in another loop
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def notify(self) -> None:
+        """ Wake the worker up, call after a pereval is queued """
+        self._wakeup.set()
+
+    async def run(self) -> None:
+        while True:
+            if time.monotonic() >= self._cleanup_at:
+                try:
+                    await self.cleanup()
+                except Exception as e:
+                    logger.error("Error cleaning up ingest queue: %s", e)
+                self._cleanup_at = time.monotonic() + self.cleanup_interval
+
+            try:
+                written = await self.process_batch()
+            except Exception as e:
+                logger.error("Error processing ingest queue: %s", e)
+                written = 0
+
+            if written < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                    # Let requests arriving together share one batch
+                    await asyncio.sleep(self.linger)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    async def process_batch(self) -> int:
+        try:
+            return await self.write()
+        except Exception as e:
+            logger.error("Error writing ingest batch, retrying one by one: %s", e)
+
+        written = 0
+        for row in await database.fetch_all(self.pending_query()):
+            try:
+                written += await self.write(row["id"])
+            except Exception as e:
+                await self.fail(row["id"], str(e))
+        return written
+
+    async def write(self, row_id: Optional[int] = None) -> int:
+        """ Insert the next batch of queued perevals, or only the given row """
+        async with database.transaction():
+            rows = await database.fetch_all(self.claim_query(row_id))
+            if not rows:
+                return 0
+
+            requests = [PerevalMetadataRequest.parse_raw(row["payload"]) for row in rows]
+            images = [[ImageRefModel(**image) for image in json.loads(row["images"])] for row in rows]
+            updated_users = set()
+            ids = await create_perevals(requests, images, updated_users)
+            stale = await user_pereval_ids(updated_users)
+
+            query = (
+                ingest_queue_table.update()
+                .where(ingest_queue_table.c.id.in_([row["id"] for row in rows]))
+                .values(status='done', last_error=None,
+                        # asyncpg sends the ids untyped, the CASE would be text without the casts
+                        pereval_id=sqlalchemy.case({row["id"]: sqlalchemy.cast(pereval, sqlalchemy.Integer)
+                                                    for row, pereval in zip(rows, ids)},
+                                                   value=ingest_queue_table.c.id))
+            )
+            await database.execute(query)
+
+        logger.info("Ingest batch written. Pereval IDs: %s", ids)
+        await self.after_commit(requests, stale)
+        return len(rows)
+
+    @staticmethod
+    async def after_commit(requests: List[PerevalMetadataRequest], stale: List[int]) -> None:
+        """ Wake the derivative worker and drop stale caches, errors here must not fail the committed batch """
+        try:
+            derivative_worker.notify()
+            invalidate_tiles((request.coords.latitude, request.coords.longitude) for request in requests)
+            await invalidate_perevals(stale, {request.user.email for request in requests})
+        except Exception as e:
+            logger.error("Error invalidating caches after ingest batch: %s", e)
+
+    async def fail(self, row_id: int, error: str) -> None:
+        """ Count a failed attempt, the row fails for good after max_attempts """
+        logger.error("Error writing queued pereval %s: %s", row_id, error)
+        status = sqlalchemy.case((ingest_queue_table.c.attempts + 1 >= self.max_attempts, 'failed'), else_='new')
+        query = (
+            ingest_queue_table.update()
+            .where(ingest_queue_table.c.id == row_id)
+            .values(attempts=ingest_queue_table.c.attempts + 1, status=status, last_error=error)
+        )
+        await database.execute(query)
+
+    async def cleanup(self) -> None:
+        """ Delete written and failed rows older than retention, their tickets are answered with 404 """
+        query = ingest_queue_table.delete().where(
+            ingest_queue_table.c.status.in_(('done', 'failed')),
+            ingest_queue_table.c.created_at < sqlalchemy.func.now() - sqlalchemy.literal_column(
+                f"interval '{int(self.retention)} seconds'")
+        )
+        await database.execute(query)
+
+    def pending_query(self) -> sqlalchemy.sql.Select:
+        return (
+            sqlalchemy.select(ingest_queue_table.c.id)
+            .where(ingest_queue_table.c.status == 'new')
+            .order_by(ingest_queue_table.c.id)
+            .limit(self.batch_size)
+        )
+
+    def claim_query(self, row_id: Optional[int] = None) -> sqlalchemy.sql.Select:
+        query = (
+            self.pending_query()
+            .add_columns(ingest_queue_table.c.payload, ingest_queue_table.c.images)
+            .with_for_update(skip_locked=True)
+        )
+        if row_id is not None:
+            query = query.where(ingest_queue_table.c.id == row_id)
+        return query
+
+
+ingest_worker = IngestWorker()
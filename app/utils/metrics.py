@@ -0,0 +1,201 @@
+import bisect
+import functools
+import math
+import time
+from contextvars import ContextVar
+from typing import (Any, Callable, Dict, Iterable, List, Optional, Sequence,
+                    Tuple)
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+LabelValues = Tuple[str, ...]
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = (f'{name}="{escape(value)}"' for name, value in zip(names, values))
+    return "{" + ",".join(pairs) + "}"
+
+
+def escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Histogram:
+    """
+    Histogram in the Prometheus text format, a series per label values.
+
+    observe() is a bisect and two additions, cheap enough for every request.
+    Everything runs on the event loop, so no locking is needed.
+    """
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        # Bucket bounds are inclusive (le)
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = format_labels(self.labels + ("le",), label_values + (format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """ Gauge whose values are read from collect() when the metrics are rendered """
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str],
+                 collect: Callable[[], Iterable[Tuple[LabelValues, float]]]):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for label_values, value in self.collect():
+            lines.append(f"{self.name}{format_labels(self.labels, label_values)} {format_value(value)}")
+        return lines
+
+
+class Registry:
+    """ Metrics served by GET /metrics """
+
+    def __init__(self):
+        self.metrics: list = []
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        metric = Histogram(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        metric = Gauge(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+request_duration = registry.histogram(
+    "fstr_http_request_duration_seconds", "Time to handle a request.", ("method", "route", "status"))
+stage_duration = registry.histogram(
+    "fstr_stage_duration_seconds", "Time spent in a helper of a request.", ("stage",))
+query_duration = registry.histogram(
+    "fstr_db_query_duration_seconds", "Time of a single database query.")
+request_queries = registry.histogram(
+    "fstr_db_queries_per_request", "Database queries made by a request.", ("route",), COUNT_BUCKETS)
+request_query_duration = registry.histogram(
+    "fstr_db_query_seconds_per_request", "Time a request spent in database queries.", ("route",))
+pool_wait = registry.histogram(
+    "fstr_db_pool_wait_seconds", "Time to acquire a connection from the pool.")
+
+
+class QueryStats:
+    """
+    Database queries of the request being handled. statements is None unless
+    the query profiler asks for the (statement, duration) of every query.
+    """
+
+    __slots__ = ("count", "duration", "statements")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements: Optional[List[Tuple[Any, float]]] = None
+
+
+query_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def observe_query(duration: float, statement: Any = None) -> None:
+    """
+    Record a finished query, for the request too when called while handling one.
+    The statement, a ClauseElement or SQL text, is only kept while profiling.
+    """
+    query_duration.observe(duration)
+    stats = query_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.duration += duration
+        if stats.statements is not None:
+            stats.statements.append((statement, duration))
+
+
+def timed(func):
+    """ Record the duration of an async helper in fstr_stage_duration_seconds, under its name """
+    stage = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            stage_duration.observe(time.perf_counter() - start, stage)
+
+    return wrapper
+
+
+class MetricsMiddleware:
+    """ Request latency and database queries per request, by route template """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        stats = QueryStats()
+        token = query_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            query_stats.reset(token)
+            # The router stores the matched route in the scope
+            route = getattr(scope.get("route"), "path", "unmatched")
+            request_duration.observe(time.perf_counter() - start, scope["method"], route, str(status))
+            request_queries.observe(stats.count, route)
+            request_query_duration.observe(stats.duration, route)
@@ -0,0 +1,115 @@
+from typing import Dict, List, Optional
+
+from multipart.multipart import MultipartParser, parse_options_header
+
+from app.config import MAX_IMAGE_SIZE, MAX_METADATA_SIZE
+from app.models.schemas import ImageRefModel, PerevalMetadataRequest
+from app.utils.blobstore import BlobWriter
+
+METADATA_FIELD = "metadata"
+
+
+class UploadError(Exception):
+    """ Raised when a multipart upload is malformed or too large """
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+class PerevalUploadParser:
+    """
+    Incremental multipart/form-data parser for pereval uploads.
+
+    The "metadata" part is buffered and validated as soon as it ends, every
+    file part is written to the blob store chunk by chunk while it arrives,
+    so memory use does not depend on the size of the photos.
+    """
+
+    def __init__(self, boundary: bytes):
+        self.metadata: Optional[PerevalMetadataRequest] = None
+        self.images: List[ImageRefModel] = []
+
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._buffer: Optional[bytearray] = None
+        self._writer: Optional[BlobWriter] = None
+        self._image_name = ""
+
+        self._parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+        })
+
+    @classmethod
+    def from_content_type(cls, content_type: str) -> "PerevalUploadParser":
+        media_type, params = parse_options_header(content_type)
+        if media_type != b"multipart/form-data" or b"boundary" not in params:
+            raise UploadError("Ожидается multipart/form-data", status=415)
+        return cls(params[b"boundary"])
+
+    def write(self, chunk: bytes) -> None:
+        self._parser.write(chunk)
+
+    def finish(self) -> PerevalMetadataRequest:
+        self._parser.finalize()
+        if self.metadata is None:
+            raise UploadError("Отсутствует часть metadata")
+        return self.metadata
+
+    def abort(self) -> None:
+        if self._writer is not None:
+            self._writer.abort()
+            self._writer = None
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        field = options.get(b"name", b"").decode("utf-8", "replace")
+
+        if b"filename" in options:
+            self._image_name = options[b"filename"].decode("utf-8", "replace")
+            self._writer = BlobWriter()
+        elif field == METADATA_FIELD:
+            self._buffer = bytearray()
+        else:
+            raise UploadError(f"Неизвестное поле формы: {field}")
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._writer is not None:
+            if self._writer.size + end - start > MAX_IMAGE_SIZE:
+                raise UploadError("Изображение слишком большое", status=413)
+            self._writer.write(data[start:end])
+        elif self._buffer is not None:
+            if len(self._buffer) + end - start > MAX_METADATA_SIZE:
+                raise UploadError("Часть metadata слишком большая", status=413)
+            self._buffer.extend(data[start:end])
+
+    def _on_part_end(self) -> None:
+        if self._writer is not None:
+            sha256, size = self._writer.commit()
+            self._writer = None
+            self.images.append(ImageRefModel(sha256=sha256, size=size, name=self._image_name))
+        elif self._buffer is not None:
+            # Raises ValidationError straight away, before the photos are read
+            self.metadata = PerevalMetadataRequest.parse_raw(bytes(self._buffer))
+            self._buffer = None
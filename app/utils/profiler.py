@@ -0,0 +1,94 @@
+import time
+from collections import defaultdict
+from typing import Any, List, Tuple
+
+from sqlalchemy.dialects import postgresql
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import PROFILE_QUERY_BUDGET, PROFILE_SLOW_REQUEST
+from app.logger import get_logger
+from app.utils.metrics import QueryStats, query_stats
+
+logger = get_logger()
+
+DIALECT = postgresql.dialect()
+STATEMENT_MAX_LENGTH = 1000
+
+
+def statement_text(statement: Any) -> str:
+    """ SQL of a recorded statement with placeholders, values are left out of the logs """
+    if statement is None:
+        return "?"
+    if not isinstance(statement, str):
+        statement = str(statement.compile(dialect=DIALECT))
+    statement = " ".join(statement.split())
+    return statement[:STATEMENT_MAX_LENGTH]
+
+
+def statements_summary(statements: List[Tuple[Any, float]]) -> List[Tuple[str, int, float]]:
+    """ (SQL, count, total seconds) of the statements, the most expensive first. Repeats show N+1 queries """
+    summary = defaultdict(lambda: [0, 0.0])
+    for statement, duration in statements:
+        entry = summary[statement_text(statement)]
+        entry[0] += 1
+        entry[1] += duration
+    return sorted(((sql, count, total) for sql, (count, total) in summary.items()), key=lambda item: -item[2])
+
+
+def server_timing(stats: QueryStats, elapsed: float) -> str:
+    return f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries", app;dur={elapsed * 1000:.1f}'
+
+
+class QueryProfilerMiddleware:
+    """
+    Records every statement of a request with its duration. Requests with more
+    than query_budget queries or slower than slow_request seconds are logged
+    with their statements. The Server-Timing response header gives the query
+    count and time to the caller.
+
+    Opt-in with FSTR_PROFILE_QUERIES, keeping the statements costs memory per request.
+    """
+
+    def __init__(self, app: ASGIApp, query_budget: int = PROFILE_QUERY_BUDGET,
+                 slow_request: float = PROFILE_SLOW_REQUEST):
+        self.app = app
+        self.query_budget = query_budget
+        self.slow_request = slow_request
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Shares the stats of MetricsMiddleware when it runs outside
+        stats = query_stats.get()
+        token = None
+        if stats is None:
+            stats = QueryStats()
+            token = query_stats.set(stats)
+        stats.statements = []
+        start = time.perf_counter()
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("server-timing",
+                                                     server_timing(stats, time.perf_counter() - start))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            if token is not None:
+                query_stats.reset(token)
+            self.check(scope, stats, time.perf_counter() - start)
+
+    def check(self, scope: Scope, stats: QueryStats, elapsed: float) -> None:
+        if stats.count <= self.query_budget and elapsed <= self.slow_request:
+            return
+
+        route = getattr(scope.get("route"), "path", scope["path"])
+        lines = [f"{count} x {total * 1000:.1f} ms: {sql}"
+                 for sql, count, total in statements_summary(stats.statements)]
+        logger.warning("Request over budget %s %s: %.1f ms, %s queries in %.1f ms\n%s",
+                       scope["method"], route, elapsed * 1000, stats.count, stats.duration * 1000, "\n".join(lines))
@@ -0,0 +1,151 @@
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, NamedTuple, Optional
+
+from app.config import (RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL,
+                        RESPONSE_CACHE_URL)
+from app.logger import get_logger
+from app.utils.cache import LRUCache
+
+logger = get_logger()
+
+
+class CachedResponse(NamedTuple):
+    """ Serialized JSON body with its validators """
+
+    content: bytes
+    etag: str
+    last_modified: str
+
+    def dump(self) -> bytes:
+        return f"{self.etag}\n{self.last_modified}\n".encode() + self.content
+
+    @classmethod
+    def load(cls, value: bytes) -> "CachedResponse":
+        etag, last_modified, content = value.split(b"\n", 2)
+        return cls(content, etag.decode(), last_modified.decode())
+
+
+class CacheBackend(ABC):
+    """ Shared cache for serialized responses, e.g. to let several workers share entries """
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        ...
+
+    @abstractmethod
+    async def delete(self, *keys: str) -> None:
+        ...
+
+
+class RedisBackend(CacheBackend):
+    """ CacheBackend on Redis, needs the redis package """
+
+    def __init__(self, url: str):
+        from redis import asyncio as redis
+        self.client = redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self.client.set(key, value, px=int(ttl * 1000))
+
+    async def delete(self, *keys: str) -> None:
+        await self.client.delete(*keys)
+
+
+class ResponseCache:
+    """
+    Cache of serialized responses, in process or in a shared backend.
+
+    With a backend every worker sees the same entries and invalidations, so the
+    in-process LRU is not used then. Backend errors are logged and count as misses.
+
+    Take version() before reading the data and pass it to set(): a value read
+    before an invalidation in this process is then not stored.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, backend: Optional[CacheBackend] = None):
+        self.ttl = ttl
+        self.local = LRUCache(maxsize, ttl)
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.invalidations = 0
+
+    def version(self) -> int:
+        return self.invalidations
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        if self.backend is None:
+            value = self.local.get(key)
+        else:
+            try:
+                value = await self.backend.get(key)
+                value = CachedResponse.load(value) if value is not None else None
+            except Exception as e:
+                logger.error("Error reading response cache: %s", e)
+                self.errors += 1
+                value = None
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, value: CachedResponse, version: int) -> None:
+        if version != self.invalidations:
+            return
+        if self.backend is None:
+            self.local.set(key, value)
+            return
+        try:
+            await self.backend.set(key, value.dump(), self.ttl)
+        except Exception as e:
+            logger.error("Error writing response cache: %s", e)
+            self.errors += 1
+
+    async def invalidate(self, *keys: str) -> None:
+        """ Drop entries, call after the change is committed """
+        self.invalidations += 1
+        if self.backend is None:
+            for key in keys:
+                self.local.delete(key)
+            return
+        try:
+            await self.backend.delete(*keys)
+        except Exception as e:
+            logger.error("Error invalidating response cache: %s", e)
+            self.errors += 1
+
+    def stats(self) -> Dict[str, int]:
+        stats = dict(hits=self.hits, misses=self.misses, errors=self.errors)
+        if self.backend is None:
+            stats.update(size=len(self.local), maxsize=self.local.maxsize, evictions=self.local.evictions)
+        return stats
+
+
+def pereval_key(pereval_id: int) -> str:
+    return f"pereval:{pereval_id}"
+
+
+def email_key(user_email: str) -> str:
+    # Only the first page with the default limit is cached
+    return f"email:{user_email}"
+
+
+async def invalidate_perevals(pereval_ids: Iterable[int] = (), user_emails: Iterable[str] = ()) -> None:
+    """ Drop cached responses of changed perevals and of their users' lists """
+    keys = [pereval_key(pereval_id) for pereval_id in pereval_ids] + [email_key(email) for email in user_emails]
+    if keys:
+        await response_cache.invalidate(*keys)
+
+
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL,
+                               RedisBackend(RESPONSE_CACHE_URL) if RESPONSE_CACHE_URL else None)
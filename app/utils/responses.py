@@ -0,0 +1,147 @@
+import json
+import os
+import typing
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse, Response
+from starlette.types import Receive, Scope, Send
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def dumps(content: typing.Any) -> bytes:
+    """
+    JSON of plain dicts and lists, e.g. from pereval_dict(). Uses orjson when it
+    is installed, the output carries the same data as pydantic's .json().
+    """
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, default=json_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def json_default(value: typing.Any) -> typing.Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class FastJSONResponse(JSONResponse):
+    """ JSONResponse rendered with dumps() """
+
+    def render(self, content: typing.Any) -> bytes:
+        return dumps(content)
+
+
+def parse_range(range_header: typing.Optional[str], size: int) -> typing.Optional[typing.Tuple[int, int]]:
+    """
+    Parse a single "bytes=start-end" Range header into inclusive offsets.
+
+    Returns None when the whole file should be sent (no header, unknown unit or
+    several ranges) and raises ValueError when the range cannot be satisfied.
+    """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+
+    start, _, end = range_header[len("bytes="):].strip().partition("-")
+    try:
+        if start:
+            first, last = int(start), int(end) if end else size - 1
+        else:
+            first, last = size - int(end), size - 1
+    except ValueError:
+        return None
+
+    first, last = max(first, 0), min(last, size - 1)
+    if first > last:
+        raise ValueError(f"Range not satisfiable: {range_header}")
+    return first, last
+
+
+def validators(total: int, modified: datetime) -> typing.Tuple[str, str]:
+    """ Strong ETag and Last-Modified of rows, from their number and latest updated_at """
+    micros = (modified - EPOCH) // timedelta(microseconds=1)
+    return f'"{total}-{micros}"', format_datetime(modified.astimezone(timezone.utc), usegmt=True)
+
+
+def is_conditional(headers: Headers) -> bool:
+    return "if-none-match" in headers or "if-modified-since" in headers
+
+
+def is_not_modified(headers: Headers, etag: str, last_modified: str) -> bool:
+    """ Evaluate If-None-Match, or If-Modified-Since when it is absent (RFC 7232) """
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+class BlobResponse(Response):
+    """
+    File response with Range support.
+
+    Uses the ASGI zero-copy send extension (sendfile) when the server offers it,
+    otherwise streams the file in chunks read off the event loop.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, path: typing.Union[str, "os.PathLike[str]"], size: int,
+                 byte_range: typing.Optional[typing.Tuple[int, int]] = None,
+                 headers: typing.Optional[typing.Mapping[str, str]] = None,
+                 media_type: str = "application/octet-stream", status_code: int = 200):
+        # FastAPI reads the default of status_code for the OpenAPI schema of routes using this class
+        self.path = path
+        self.media_type = media_type
+        self.background = None
+        self.offset, last = byte_range if byte_range else (0, size - 1)
+        self.count = last - self.offset + 1
+
+        headers = dict(headers or {})
+        headers["accept-ranges"] = "bytes"
+        headers["content-length"] = str(self.count)
+        if byte_range:
+            self.status_code = 206
+            headers["content-range"] = f"bytes {self.offset}-{last}/{size}"
+        else:
+            self.status_code = status_code
+        self.init_headers(headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+
+        if scope["method"] == "HEAD" or self.count <= 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as file:
+                await send({"type": "http.response.zerocopysend", "file": file,
+                            "offset": self.offset, "count": self.count, "more_body": False})
+            return
+
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.offset)
+            remaining = self.count
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                remaining -= len(chunk)
+                more_body = remaining > 0 and len(chunk) > 0
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+                if not chunk:
+                    break
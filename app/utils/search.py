@@ -0,0 +1,50 @@
+import re
+import unicodedata
+
+import sqlalchemy
+
+from app.models.models import pereval_add_table
+
+CYRILLIC_TO_LATIN = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "e", "ж": "zh", "з": "z", "и": "i",
+    "й": "y", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p", "р": "r", "с": "s", "т": "t",
+    "у": "u", "ф": "f", "х": "kh", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "shch", "ъ": "", "ы": "y", "ь": "",
+    "э": "e", "ю": "yu", "я": "ya", "і": "i", "ї": "yi", "є": "ye", "ґ": "g",
+}
+TRANSLITERATION = str.maketrans(CYRILLIC_TO_LATIN)
+NOT_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def transliterate(text: str) -> str:
+    """
+    Lowercase latin form of the text used for search, so "Пхия" and "Pkhiya"
+    give the same "pkhiya". Accents are dropped, punctuation becomes spaces.
+    """
+    text = unicodedata.normalize("NFKD", text.lower().translate(TRANSLITERATION))
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return NOT_WORD.sub(" ", text).strip()
+
+
+def search_text(*titles: str) -> str:
+    """ Value of pereval_add.search_text for the titles of a pereval """
+    return " ".join(filter(None, (transliterate(title or "") for title in titles)))
+
+
+def search_condition(text: str) -> sqlalchemy.sql.ColumnElement:
+    """ Matches perevals by word prefixes or, with typos, by trigram word similarity """
+    return sqlalchemy.or_(
+        pereval_add_table.c.search_vector.op("@@")(prefix_tsquery(text)),
+        sqlalchemy.literal(text).op("<%")(pereval_add_table.c.search_text)
+    )
+
+
+def search_rank(text: str) -> sqlalchemy.sql.ColumnElement:
+    return (
+        sqlalchemy.func.ts_rank(pereval_add_table.c.search_vector, prefix_tsquery(text))
+        + sqlalchemy.func.word_similarity(text, pereval_add_table.c.search_text)
+    )
+
+
+def prefix_tsquery(text: str) -> sqlalchemy.sql.ColumnElement:
+    # transliterate() leaves only [a-z0-9] words, safe to pass to to_tsquery()
+    return sqlalchemy.func.to_tsquery("simple", " & ".join(f"{word}:*" for word in text.split()))
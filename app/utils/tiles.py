@@ -0,0 +1,234 @@
+import asyncio
+import math
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import sqlalchemy
+from sqlalchemy.dialects.postgresql import insert
+
+from app.config import (CLUSTER_BATCH_SIZE, CLUSTER_MAX_ZOOM,
+                        CLUSTER_POLL_INTERVAL, TILE_CACHE_SIZE,
+                        TILE_CACHE_TTL, TILE_MAX_ZOOM)
+from app.db_connection import database
+from app.logger import get_logger
+from app.models.models import (coords_table, map_cluster_deltas_table,
+                               map_clusters_table)
+from app.utils.cache import LRUCache
+
+logger = get_logger()
+
+# Every tile is split into CLUSTER_GRID x CLUSTER_GRID cluster cells
+CLUSTER_GRID = 8
+MAX_LATITUDE = 85.05112878
+
+Point = Tuple[float, float]
+
+tile_cache = LRUCache(TILE_CACHE_SIZE, TILE_CACHE_TTL)
+
+
+def mercator(latitude: float, longitude: float, zoom: int) -> Tuple[float, float]:
+    """ Web Mercator position of a point in tile units at the zoom level """
+    n = 2 ** zoom
+    latitude = max(min(latitude, MAX_LATITUDE), -MAX_LATITUDE)
+    x = (longitude + 180.0) / 360.0 * n
+    y = (1.0 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2.0 * n
+    return min(max(x, 0.0), n - 1e-9), min(max(y, 0.0), n - 1e-9)
+
+
+def tile_bbox(zoom: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """ Bounds (south, west, north, east) of a tile """
+    n = 2 ** zoom
+
+    def latitude(tile_y: float) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * tile_y / n))))
+
+    return latitude(y + 1), x / n * 360.0 - 180.0, latitude(y), (x + 1) / n * 360.0 - 180.0
+
+
+def cluster_deltas(added: Iterable[Point], removed: Iterable[Point]) -> Dict[Tuple[int, int, int], List[float]]:
+    """ Per cluster cell change of (count, sum_latitude, sum_longitude) """
+    deltas = defaultdict(lambda: [0, 0.0, 0.0])
+    for points, sign in ((added, 1), (removed, -1)):
+        for latitude, longitude in points:
+            for zoom in range(CLUSTER_MAX_ZOOM + 1):
+                x, y = mercator(latitude, longitude, zoom)
+                delta = deltas[(zoom, int(x * CLUSTER_GRID), int(y * CLUSTER_GRID))]
+                delta[0] += sign
+                delta[1] += sign * latitude
+                delta[2] += sign * longitude
+    return {key: delta for key, delta in deltas.items() if any(delta)}
+
+
+async def record_cluster_changes(added: Iterable[int] = (), removed: Iterable[int] = ()) -> None:
+    """
+    Record passes added at or removed from coords rows, in the transaction that
+    changes the passes. The cluster worker folds them into map_clusters later,
+    so writers never wait on the shared low zoom cluster rows.
+    """
+    values_list = [dict(coords_id=coords_id, count=1) for coords_id in added] + \
+                  [dict(coords_id=coords_id, count=-1) for coords_id in removed]
+    if values_list:
+        await database.execute(map_cluster_deltas_table.insert().values(values_list))
+
+
+async def update_clusters(added: Iterable[Point] = (), removed: Iterable[Point] = ()) -> None:
+    """
+    Apply added and removed passes to map_clusters with one upsert.
+
+    Rows are written in key order, so concurrent cluster workers do not deadlock.
+    """
+    deltas = cluster_deltas(added, removed)
+    if not deltas:
+        return
+
+    query = insert(map_clusters_table).values([
+        dict(zoom=zoom, cell_x=cell_x, cell_y=cell_y, count=count, sum_latitude=sum_latitude,
+             sum_longitude=sum_longitude)
+        for (zoom, cell_x, cell_y), (count, sum_latitude, sum_longitude) in sorted(deltas.items())
+    ])
+    query = query.on_conflict_do_update(
+        index_elements=[map_clusters_table.c.zoom, map_clusters_table.c.cell_x, map_clusters_table.c.cell_y],
+        set_=dict(count=map_clusters_table.c.count + query.excluded.count,
+                  sum_latitude=map_clusters_table.c.sum_latitude + query.excluded.sum_latitude,
+                  sum_longitude=map_clusters_table.c.sum_longitude + query.excluded.sum_longitude)
+    )
+    await database.execute(query)
+
+
+def backfill_clusters_sql(max_zoom: int = CLUSTER_MAX_ZOOM) -> str:
+    """ INSERT of the clusters of every pass up to max_zoom, in the cells of mercator() """
+    return f"""
+        INSERT INTO map_clusters (zoom, cell_x, cell_y, count, sum_latitude, sum_longitude)
+        SELECT zoom, cell_x, cell_y, count(*), sum(latitude), sum(longitude)
+        FROM (
+            SELECT z.zoom, c.latitude, c.longitude,
+                   floor(least(greatest((c.longitude + 180) / 360 * 2 ^ z.zoom, 0), 2 ^ z.zoom - 1e-9)
+                         * {CLUSTER_GRID})::int AS cell_x,
+                   floor(least(greatest((1 - asinh(tan(radians(
+                         greatest(least(c.latitude, {MAX_LATITUDE}), -{MAX_LATITUDE})))) / pi()) / 2 * 2 ^ z.zoom, 0),
+                         2 ^ z.zoom - 1e-9) * {CLUSTER_GRID})::int AS cell_y
+            FROM pereval_add p
+            JOIN coords c ON c.id = p.coords_id
+            CROSS JOIN generate_series(0, {int(max_zoom)}) AS z(zoom)
+        ) points
+        GROUP BY zoom, cell_x, cell_y
+    """
+
+
+async def rebuild_clusters() -> None:
+    """ Recompute map_clusters from the passes, needed after FSTR_CLUSTER_MAX_ZOOM changes """
+    async with database.transaction():
+        # Writers and cluster workers wait until the new rows are in, the locks are taken in their order.
+        # Passes committed before the lock are in the backfill, so their pending deltas are dropped.
+        await database.execute(sqlalchemy.text("LOCK TABLE map_cluster_deltas IN EXCLUSIVE MODE"))
+        await database.execute(sqlalchemy.text("LOCK TABLE map_clusters IN EXCLUSIVE MODE"))
+        await database.execute(map_cluster_deltas_table.delete())
+        await database.execute(map_clusters_table.delete())
+        await database.execute(sqlalchemy.text(backfill_clusters_sql()))
+    tile_cache.clear()
+
+
+class ClusterWorker:
+    """
+    Folds the deltas of record_cluster_changes() into map_clusters.
+
+    Deltas are claimed with FOR UPDATE SKIP LOCKED and deleted in the
+    transaction that applies them, so several processes can fold at once and
+    a crash returns them to the table. Cluster tiles lag the writes by up to
+    poll_interval seconds.
+    """
+
+    def __init__(self, batch_size: int = CLUSTER_BATCH_SIZE, poll_interval: float = CLUSTER_POLL_INTERVAL):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self) -> None:
+        while True:
+            try:
+                folded = await self.process_batch()
+            except Exception as e:
+                logger.error("Error folding cluster deltas: %s", e)
+                folded = 0
+
+            if folded < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+    async def process_batch(self) -> int:
+        """ Apply the next batch of deltas, returns how many were folded """
+        deltas = map_cluster_deltas_table
+        async with database.transaction():
+            claimed = (
+                sqlalchemy.select(deltas.c.id)
+                .order_by(deltas.c.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            rows = await database.fetch_all(
+                deltas.delete().where(deltas.c.id.in_(claimed.scalar_subquery())).returning(deltas.c.coords_id,
+                                                                                           deltas.c.count)
+            )
+            if not rows:
+                return 0
+
+            # The stored coords rows, the same points backfill_clusters_sql() counts
+            query = (
+                sqlalchemy.select(coords_table.c.id, coords_table.c.latitude, coords_table.c.longitude)
+                .where(coords_table.c.id.in_({row["coords_id"] for row in rows}))
+            )
+            points = {row["id"]: (row["latitude"], row["longitude"]) for row in await database.fetch_all(query)}
+            await update_clusters(added=[points[row["coords_id"]] for row in rows if row["count"] > 0],
+                                  removed=[points[row["coords_id"]] for row in rows if row["count"] < 0])
+
+        invalidate_tiles(points.values())
+        return len(rows)
+
+
+def clusters_query(zoom: int, x: int, y: int) -> sqlalchemy.sql.Select:
+    return (
+        sqlalchemy.select(
+            (map_clusters_table.c.sum_latitude / map_clusters_table.c.count).label("latitude"),
+            (map_clusters_table.c.sum_longitude / map_clusters_table.c.count).label("longitude"),
+            map_clusters_table.c.count
+        )
+        .where(map_clusters_table.c.zoom == zoom)
+        .where(map_clusters_table.c.cell_x.between(x * CLUSTER_GRID, (x + 1) * CLUSTER_GRID - 1))
+        .where(map_clusters_table.c.cell_y.between(y * CLUSTER_GRID, (y + 1) * CLUSTER_GRID - 1))
+        .where(map_clusters_table.c.count > 0)
+    )
+
+
+def invalidate_tiles(points: Iterable[Point]) -> None:
+    """ Drop cached tiles containing the points, call after the change is committed """
+    for latitude, longitude in points:
+        for zoom in range(TILE_MAX_ZOOM + 1):
+            x, y = mercator(latitude, longitude, zoom)
+            tile_cache.delete((zoom, int(x), int(y)))
+
+
+cluster_worker = ClusterWorker()
+
+
+async def main() -> None:
+    await database.connect()
+    try:
+        await rebuild_clusters()
+    finally:
+        await database.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,39 @@
+"""
+Compare two runs saved by benchmarks.load, e.g. before and after a change.
+
+    python -m benchmarks.compare benchmarks/results/BASE.json benchmarks/results/NEW.json
+
+Prints each metric of the scenarios found in both runs with its change in percent.
+"""
+import json
+import sys
+
+METRICS = ("rps", "p50_ms", "p95_ms", "p99_ms", "errors")
+
+
+def load(path: str) -> dict:
+    with open(path) as file:
+        return json.load(file)
+
+
+def change(base: float, new: float) -> str:
+    if not base:
+        return ""
+    return f"{(new - base) / base * 100:+.1f}%"
+
+
+def main(base_path: str, new_path: str) -> None:
+    base, new = load(base_path), load(new_path)
+    print(f"base {base['commit'][:8]} {base['time']}  {base['config']}")
+    print(f"new  {new['commit'][:8]} {new['time']}  {new['config']}")
+    for name in base["results"]:
+        if name not in new["results"]:
+            continue
+        print(f"\n{name}")
+        for metric in METRICS:
+            old_value, new_value = base["results"][name][metric], new["results"][name][metric]
+            print(f"  {metric:8} {old_value:>10} {new_value:>10} {change(old_value, new_value):>8}")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:3])
@@ -0,0 +1,218 @@
+"""
+Load test of the pereval endpoints, run against a server on a database seeded with benchmarks.seed.
+
+    python -m benchmarks.load [--url http://127.0.0.1:8000 | --asgi] [--concurrency 16] [--requests 1000]
+                              [--scenarios post,get_by_id,get_by_email,patch] [--replay corpus.jsonl]
+
+Every scenario sends --requests requests from --concurrency concurrent
+clients and reports requests per second and p50/p95/p99 latency. The run is
+saved as JSON in --output, named after the time and the commit, to be compared
+with benchmarks.compare. --asgi runs the app in this process instead of
+over HTTP, handy for profiling but client and server then share one CPU.
+
+A replay corpus is a JSONL file of {"method", "path", "params", "json"} objects,
+sent in order as the "replay" scenario.
+"""
+import argparse
+import asyncio
+import base64
+import io
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List
+
+import httpx
+from PIL import Image
+
+from app.config import PAGE_SIZE
+from app.db_connection import database
+from app.models.schemas import UserModel
+from benchmarks.seed import seed_pereval, seeded_perevals
+
+Scenario = Callable[[httpx.AsyncClient, int], Awaitable[bool]]
+
+
+def make_image() -> str:
+    """ A small JPEG, base64 encoded the way clients send it """
+    buffer = io.BytesIO()
+    Image.new("RGB", (640, 480), (120, 160, 200)).save(buffer, "JPEG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def api_ok(response: httpx.Response) -> bool:
+    """ Errors are also sent with HTTP 200 and a status or state field in the body """
+    if response.status_code >= 400:
+        return False
+    body = response.json()
+    if not isinstance(body, dict):
+        return True
+    if isinstance(body.get("status"), int) and body["status"] >= 300:
+        return False
+    return body.get("state", 1) != 0
+
+
+class Scenarios:
+    """ Request makers for each scenario, on perevals sampled from the seeded data """
+
+    def __init__(self, perevals: List[dict], images: int, replay: List[dict]):
+        self.perevals = perevals
+        self.emails = sorted({pereval["user"]["email"] for pereval in perevals})
+        self.image = make_image() if images else None
+        self.images = images
+        self.replay_requests = replay
+        self.random = random.Random(1)
+
+    def body(self, user: dict) -> dict:
+        body = json.loads(seed_pereval(self.random, UserModel(**user)).json())
+        body["images"] = [{"data": self.image, "name": f"Фото {i + 1}"} for i in range(self.images)]
+        return body
+
+    async def post(self, client: httpx.AsyncClient, i: int) -> bool:
+        pereval = self.perevals[i % len(self.perevals)]
+        return api_ok(await client.post("/SubmitData", json=self.body(pereval["user"])))
+
+    async def get_by_id(self, client: httpx.AsyncClient, i: int) -> bool:
+        pereval = self.perevals[i % len(self.perevals)]
+        response = await client.get("/SubmitData", params={"pereval_id": pereval["id"]})
+        return api_ok(response) and response.json().get("id") == pereval["id"]
+
+    async def get_by_email(self, client: httpx.AsyncClient, i: int) -> bool:
+        email = self.emails[i % len(self.emails)]
+        response = await client.get("/SubmitData/<user_email>", params={"user_email": email, "limit": PAGE_SIZE})
+        return api_ok(response)
+
+    async def patch(self, client: httpx.AsyncClient, i: int) -> bool:
+        pereval = self.perevals[i % len(self.perevals)]
+        response = await client.patch("/SubmitData", params={"pereval_id": pereval["id"]},
+                                      json=self.body(pereval["user"]))
+        return api_ok(response)
+
+    async def replay(self, client: httpx.AsyncClient, i: int) -> bool:
+        request = self.replay_requests[i % len(self.replay_requests)]
+        response = await client.request(request.get("method", "GET"), request["path"],
+                                        params=request.get("params"), json=request.get("json"))
+        return response.status_code < 400
+
+
+def percentile(values: List[float], q: float) -> float:
+    """ Nearest-rank percentile of sorted values """
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, requests: int, concurrency: int) -> dict:
+    latencies: List[float] = []
+    errors = 0
+    counter = itertools.count()
+
+    async def worker() -> None:
+        nonlocal errors
+        while True:
+            i = next(counter)
+            if i >= requests:
+                return
+            start = time.perf_counter()
+            try:
+                ok = await scenario(client, i)
+            except (httpx.HTTPError, ValueError):
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            errors += not ok
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return dict(
+        requests=len(latencies),
+        errors=errors,
+        seconds=round(elapsed, 3),
+        rps=round(len(latencies) / elapsed, 1),
+        mean_ms=round(statistics.fmean(latencies) * 1000, 2),
+        p50_ms=round(percentile(latencies, 50) * 1000, 2),
+        p95_ms=round(percentile(latencies, 95) * 1000, 2),
+        p99_ms=round(percentile(latencies, 99) * 1000, 2),
+        max_ms=round(latencies[-1] * 1000, 2),
+    )
+
+
+def git_commit() -> Dict[str, object]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                               text=True, check=True).stdout
+        return dict(commit=commit.strip(), dirty=bool(dirty.strip()))
+    except (OSError, subprocess.CalledProcessError):
+        return dict(commit="unknown", dirty=False)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test of the pereval endpoints")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", default="http://127.0.0.1:8000")
+    target.add_argument("--asgi", action="store_true", help="run the app in this process")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=1000, help="requests per scenario")
+    parser.add_argument("--scenarios", default="post,get_by_id,get_by_email,patch")
+    parser.add_argument("--images", type=int, default=1, help="images in each POST and PATCH")
+    parser.add_argument("--sample", type=int, default=1000, help="seeded perevals to spread requests over")
+    parser.add_argument("--replay", help="JSONL corpus of requests for the replay scenario")
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(__file__), "results"))
+    args = parser.parse_args()
+
+    await database.connect()
+    try:
+        perevals = await seeded_perevals(args.sample)
+    finally:
+        await database.disconnect()
+    if not perevals:
+        raise SystemExit("No seeded perevals, run python -m benchmarks.seed first")
+
+    replay = []
+    scenario_names = args.scenarios.split(",")
+    if args.replay:
+        with open(args.replay) as file:
+            replay = [json.loads(line) for line in file if line.strip()]
+        scenario_names.append("replay")
+    scenarios = Scenarios(perevals, args.images, replay)
+
+    if args.asgi:
+        from app.main import app
+        await app.router.startup()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+    else:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        client = httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60)
+
+    results = {}
+    try:
+        async with client:
+            for name in scenario_names:
+                results[name] = await run_scenario(client, getattr(scenarios, name), args.requests, args.concurrency)
+                print(name, json.dumps(results[name]))
+    finally:
+        if args.asgi:
+            await app.router.shutdown()
+
+    now = datetime.now(timezone.utc)
+    run = dict(time=now.isoformat(), **git_commit(), python=platform.python_version(),
+               config=dict(target="asgi" if args.asgi else args.url, concurrency=args.concurrency,
+                           requests=args.requests, images=args.images, sample=len(perevals)),
+               results=results)
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"{now:%Y%m%dT%H%M%S}-{run['commit'][:8]}.json")
+    with open(path, "w") as file:
+        json.dump(run, file, indent=2)
+    print(f"Saved {path}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
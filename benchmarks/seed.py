@@ -0,0 +1,103 @@
+"""
+Fill the database from FSTR_DB_* with benchmark data, after `alembic upgrade head`.
+
+    python -m benchmarks.seed [--users 1000] [--perevals 20000] [--images 3] [--seed 1]
+
+Users, coords and perevals go through create_perevals(), the same path as
+POST /SubmitData/batch, so search text and map clusters are filled in too.
+Image rows point to blobs that do not exist: reads only return their URLs,
+and no derivative jobs are queued for them. Seeded users have emails at
+SEED_DOMAIN, the load driver picks its ids and emails from them.
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+import time
+
+import sqlalchemy
+
+from app.db_connection import database
+from app.models.models import images_table, pereval_add_table, users_table
+from app.models.schemas import (CoordsModel, LevelModel,
+                                PerevalMetadataRequest, UserModel)
+from app.utils.functions import create_perevals
+
+SEED_DOMAIN = "bench.example"
+BATCH_SIZE = 500
+LEVELS = ("", "1А", "1Б", "2А", "2Б", "3А", "3Б")
+WORDS = ("Пхия", "Триев", "Кавказ", "Дугоба", "Ала-Арча", "Бечо", "Донгуз-Орун", "Twin", "Col", "Pass", "Северный",
+         "Южный", "Верхний", "Ледовый", "Снежный", "Каменный")
+
+
+def seed_user(index: int) -> UserModel:
+    return UserModel(email=f"user{index}@{SEED_DOMAIN}", fam=f"Фамилия{index}", name="Имя", otc="Отчество",
+                     phone=f"+7 900 {index:07d}")
+
+
+def seed_pereval(rnd: random.Random, user: UserModel) -> PerevalMetadataRequest:
+    return PerevalMetadataRequest(
+        beauty_title="пер.",
+        title=" ".join(rnd.sample(WORDS, 2)),
+        other_titles=rnd.choice(WORDS),
+        connect="",
+        user=user,
+        # Mountain areas of the Caucasus and Central Asia
+        coords=CoordsModel(latitude=round(rnd.uniform(38, 44), 4), longitude=round(rnd.uniform(40, 78), 4),
+                           height=rnd.randrange(1500, 6000)),
+        level=LevelModel(winter=rnd.choice(LEVELS), summer=rnd.choice(LEVELS), autumn=rnd.choice(LEVELS),
+                         spring=rnd.choice(LEVELS)),
+    )
+
+
+async def seed(users: int, perevals: int, images: int, seed_value: int) -> None:
+    rnd = random.Random(seed_value)
+    user_models = [seed_user(index) for index in range(users)]
+
+    for offset in range(0, perevals, BATCH_SIZE):
+        requests = [seed_pereval(rnd, rnd.choice(user_models)) for _ in range(min(BATCH_SIZE, perevals - offset))]
+        async with database.transaction():
+            ids = await create_perevals(requests, [[] for _ in requests])
+            values = [dict(pereval=pereval_id, sha256=hashlib.sha256(f"{pereval_id}-{i}".encode()).hexdigest(),
+                           size=rnd.randrange(50_000, 5_000_000), name=f"Фото {i + 1}")
+                      for pereval_id in ids for i in range(rnd.randint(0, images))]
+            if values:
+                await database.execute(images_table.insert().values(values))
+        print(f"{offset + len(requests)}/{perevals} perevals")
+
+
+async def seeded_perevals(limit: int) -> list:
+    """ Random seeded perevals still open for PATCH, with their users, for the load driver """
+    query = (
+        sqlalchemy.select(pereval_add_table.c.id, users_table.c.email, users_table.c.first_name,
+                          users_table.c.last_name, users_table.c.patronymic, users_table.c.phone)
+        .select_from(pereval_add_table.join(users_table, pereval_add_table.c.user_id == users_table.c.id))
+        .where(users_table.c.email.like(f"%@{SEED_DOMAIN}"))
+        .where(pereval_add_table.c.status == "new")
+        .order_by(sqlalchemy.func.random())
+        .limit(limit)
+    )
+    return [dict(id=row["id"], user=dict(email=row["email"], fam=row["last_name"], name=row["first_name"],
+                                         otc=row["patronymic"], phone=row["phone"]))
+            for row in await database.fetch_all(query)]
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Fill the database with benchmark data")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--perevals", type=int, default=20000)
+    parser.add_argument("--images", type=int, default=3, help="up to this many images per pereval")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    await database.connect()
+    try:
+        await seed(args.users, args.perevals, args.images, args.seed)
+    finally:
+        await database.disconnect()
+    print(f"Seeded in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,62 @@
+"""
+Serialization of a page of perevals: the response models against pereval_dict() and dumps().
+
+    python -m benchmarks.serialization [rows] [repeat]
+
+Needs only the app package, no database: rows are built in memory with the
+shape pereval_response_query() returns.
+"""
+import json
+import sys
+import timeit
+from datetime import datetime
+
+from fastapi.encoders import jsonable_encoder
+
+from app.models.schemas import PerevalGetResponse, PerevalResponseByEmail
+from app.utils.functions import pereval_dict
+from app.utils.responses import dumps, orjson
+
+
+def make_rows(count: int) -> list:
+    return [{
+        'id': i, 'status': 'new', 'beauty_title': 'пер. ', 'title': f'Пхия {i}', 'other_titles': 'Триев',
+        'connect': '', 'add_time': datetime(2023, 7, 30, 12, 0, i % 60),
+        'user': {'email': 'qwerty@mail.ru', 'fam': 'Пупкин', 'name': 'Василий', 'otc': 'Иванович',
+                 'phone': '+7 555 55 55'},
+        'coords': {'latitude': 45.3842, 'longitude': 7.1525, 'height': 1200},
+        'level': {'winter': '', 'summer': '1А', 'autumn': '1А', 'spring': ''},
+        'images': [{'name': f'Фото {j}', 'url': f'/SubmitData/images/{j:064x}', 'size': 120000,
+                    'thumbnail_url': f'/SubmitData/images/{j:064x}/thumbnail',
+                    'preview_url': f'/SubmitData/images/{j:064x}/preview'} for j in range(3)],
+    } for i in range(count)]
+
+
+def models(rows: list) -> bytes:
+    """ The path before: response models and pydantic's .json() """
+    return PerevalResponseByEmail(perevals=[PerevalGetResponse(**row) for row in rows]).json().encode()
+
+
+def fastapi_encoder(rows: list) -> bytes:
+    """ Response models returned to FastAPI: jsonable_encoder() and json.dumps() """
+    response = PerevalResponseByEmail(perevals=[PerevalGetResponse(**row) for row in rows])
+    return json.dumps(jsonable_encoder(response)).encode()
+
+
+def dicts(rows: list) -> bytes:
+    """ The read paths now: rows mapped to dicts and dumps() """
+    return dumps(dict(perevals=[pereval_dict(row) for row in rows], next_cursor=None))
+
+
+def main(count: int = 100, repeat: int = 20) -> None:
+    rows = make_rows(count)
+    assert json.loads(models(rows)) == json.loads(dicts(rows))
+
+    print(f"{count} perevals, best of 5 x {repeat}, dumps() with {'orjson' if orjson else 'json'}")
+    for run in (models, fastapi_encoder, dicts):
+        seconds = min(timeit.repeat(lambda: run(rows), number=repeat, repeat=5)) / repeat
+        print(f"{run.__name__:16} {seconds * 1000:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
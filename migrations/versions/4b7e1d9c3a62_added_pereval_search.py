@@ -0,0 +1,47 @@
+"""Added pereval search
+
+Revision ID: 4b7e1d9c3a62
+Revises: 9d4e6b2a7c15
+Create Date: 2026-10-18 19:26:51.308417
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+from app.utils.search import search_text
+
+# revision identifiers, used by Alembic.
+revision = '4b7e1d9c3a62'
+down_revision = '9d4e6b2a7c15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.add_column('pereval_add', sa.Column('search_text', sa.Text(), server_default='', nullable=False))
+
+    # Transliteration lives in Python, fill the column for existing passes
+    connection = op.get_bind()
+    perevals = connection.execute(sa.text("SELECT id, title, beauty_title, other_titles FROM pereval_add")).fetchall()
+    if perevals:
+        connection.execute(
+            sa.text("UPDATE pereval_add SET search_text = :search_text WHERE id = :id"),
+            [{'search_text': search_text(title, beauty_title, other_titles), 'id': pereval_id}
+             for pereval_id, title, beauty_title, other_titles in perevals]
+        )
+
+    op.add_column('pereval_add', sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed(
+        "to_tsvector('simple'::regconfig, search_text)"), nullable=True))
+    op.create_index('ix_pereval_add_search_vector', 'pereval_add', ['search_vector'], unique=False,
+                    postgresql_using='gin')
+    op.create_index('ix_pereval_add_search_text', 'pereval_add', ['search_text'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'search_text': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    op.drop_index('ix_pereval_add_search_text', table_name='pereval_add')
+    op.drop_index('ix_pereval_add_search_vector', table_name='pereval_add')
+    op.drop_column('pereval_add', 'search_vector')
+    op.drop_column('pereval_add', 'search_text')
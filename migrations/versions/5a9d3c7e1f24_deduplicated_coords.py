@@ -0,0 +1,38 @@
+"""Deduplicated coords
+
+Revision ID: 5a9d3c7e1f24
+Revises: e5d7f0a3b912
+Create Date: 2026-10-18 15:21:09.640358
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '5a9d3c7e1f24'
+down_revision = 'e5d7f0a3b912'
+branch_labels = None
+depends_on = None
+
+DUPLICATES = """
+    SELECT id, min(id) OVER (PARTITION BY latitude, longitude, height) AS keep_id
+    FROM coords
+"""
+
+
+def upgrade() -> None:
+    # Point every pereval at the oldest of identical coords rows, then drop the rest
+    op.execute(f"""
+        UPDATE pereval_add SET coords_id = duplicates.keep_id
+        FROM ({DUPLICATES}) AS duplicates
+        WHERE pereval_add.coords_id = duplicates.id AND duplicates.id <> duplicates.keep_id
+    """)
+    op.execute(f"""
+        DELETE FROM coords USING ({DUPLICATES}) AS duplicates
+        WHERE coords.id = duplicates.id AND duplicates.id <> duplicates.keep_id
+    """)
+    op.create_unique_constraint('uq_coords_latitude_longitude_height', 'coords',
+                                ['latitude', 'longitude', 'height'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_coords_latitude_longitude_height', 'coords', type_='unique')
@@ -0,0 +1,42 @@
+"""Added pereval change sequence
+
+Revision ID: 6f2b8d4e9a03
+Revises: 8e3a5c0f2d71
+Create Date: 2026-10-18 21:37:04.118562
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '6f2b8d4e9a03'
+down_revision = '8e3a5c0f2d71'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('pereval_add', sa.Column('change_seq', sa.BigInteger(),
+                                           server_default=sa.text('pg_current_xact_id()::text::bigint'),
+                                           nullable=False))
+    op.create_index('ix_pereval_add_user_id_change_seq_id', 'pereval_add', ['user_id', 'change_seq', 'id'],
+                    unique=False)
+
+    # Inserts take the column default, every update moves the row to the writing transaction
+    op.execute("""
+        CREATE FUNCTION set_change_seq() RETURNS trigger AS $$
+        BEGIN
+            NEW.change_seq = pg_current_xact_id()::text::bigint;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("CREATE TRIGGER pereval_add_change_seq BEFORE UPDATE ON pereval_add "
+               "FOR EACH ROW EXECUTE FUNCTION set_change_seq()")
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER pereval_add_change_seq ON pereval_add")
+    op.execute("DROP FUNCTION set_change_seq()")
+    op.drop_index('ix_pereval_add_user_id_change_seq_id', table_name='pereval_add')
+    op.drop_column('pereval_add', 'change_seq')
@@ -0,0 +1,48 @@
+"""Added updated_at
+
+Revision ID: 8e3a5c0f2d71
+Revises: 4b7e1d9c3a62
+Create Date: 2026-10-18 20:41:13.592830
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '8e3a5c0f2d71'
+down_revision = '4b7e1d9c3a62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('pereval_add', sa.Column('updated_at', sa.DateTime(timezone=True),
+                                           server_default=sa.text('now()'), nullable=False))
+    op.add_column('users', sa.Column('updated_at', sa.DateTime(timezone=True),
+                                     server_default=sa.text('now()'), nullable=False))
+    op.drop_index('ix_pereval_add_user_id_add_time_id', table_name='pereval_add')
+    op.create_index('ix_pereval_add_user_id_add_time_id', 'pereval_add', ['user_id', 'add_time', 'id'],
+                    unique=False, postgresql_include=['updated_at'])
+
+    # Any update, including moderation done outside the API, moves updated_at
+    op.execute("""
+        CREATE FUNCTION set_updated_at() RETURNS trigger AS $$
+        BEGIN
+            NEW.updated_at = clock_timestamp();
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    for table in ('pereval_add', 'users'):
+        op.execute(f"CREATE TRIGGER {table}_updated_at BEFORE UPDATE ON {table} "
+                   f"FOR EACH ROW EXECUTE FUNCTION set_updated_at()")
+
+
+def downgrade() -> None:
+    for table in ('pereval_add', 'users'):
+        op.execute(f"DROP TRIGGER {table}_updated_at ON {table}")
+    op.execute("DROP FUNCTION set_updated_at()")
+    op.drop_index('ix_pereval_add_user_id_add_time_id', table_name='pereval_add')
+    op.create_index('ix_pereval_add_user_id_add_time_id', 'pereval_add', ['user_id', 'add_time', 'id'], unique=False)
+    op.drop_column('users', 'updated_at')
+    op.drop_column('pereval_add', 'updated_at')
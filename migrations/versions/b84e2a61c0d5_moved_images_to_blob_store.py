@@ -0,0 +1,44 @@
+"""Moved images to blob store
+
+Revision ID: b84e2a61c0d5
+Revises: 3f1c9b2d4e7a
+Create Date: 2026-10-18 11:03:27.904126
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+from app.utils.blobstore import decode_image_data, save_blob
+
+# revision identifiers, used by Alembic.
+revision = 'b84e2a61c0d5'
+down_revision = '3f1c9b2d4e7a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('pereval_images', sa.Column('sha256', sa.String(length=64), nullable=True))
+    op.add_column('pereval_images', sa.Column('size', sa.Integer(), nullable=True))
+
+    # Move inline image payloads into the blob store
+    connection = op.get_bind()
+    images = connection.execute(sa.text("SELECT id, data FROM pereval_images")).fetchall()
+    for image_id, data in images:
+        sha256, size = save_blob(decode_image_data(data or ''))
+        connection.execute(
+            sa.text("UPDATE pereval_images SET sha256 = :sha256, size = :size WHERE id = :id"),
+            {'sha256': sha256, 'size': size, 'id': image_id}
+        )
+
+    op.alter_column('pereval_images', 'sha256', nullable=False)
+    op.alter_column('pereval_images', 'size', nullable=False)
+    op.drop_column('pereval_images', 'data')
+
+
+def downgrade() -> None:
+    # Blobs stay in the store, rows keep their hash as the payload
+    op.add_column('pereval_images', sa.Column('data', sa.String(length=100), nullable=True))
+    op.execute("UPDATE pereval_images SET data = sha256")
+    op.drop_column('pereval_images', 'size')
+    op.drop_column('pereval_images', 'sha256')